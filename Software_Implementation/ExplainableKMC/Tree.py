@@ -1,18 +1,43 @@
 import numpy as np
 import pandas as pd
-from collections import Counter
+import heapq
+import time
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from sklearn.cluster import KMeans
 from .splitters import get_min_mistakes_cut
+from .splitters import get_min_mistakes_cut_presorted
+from .splitters import partition_presorted
 from .splitters import get_min_surrogate_cut
-
-try:
-    from graphviz import Source
-    graphviz_available = True
-except Exception:
-    graphviz_available = False
+from .splitters import get_min_mistakes_cut_hist
+from .splitters import surrogate_histograms
+from .splitters import get_min_surrogate_cut_from_hist
+from .approximate import SampledBuild
+from .assignment import assign, center_dots
+from .evaluation import evaluate, evaluation_from_sums
+from .flat_tree import FlatTree, LEAF, bfs_nodes
+from .incremental import DEFAULT_DRIFT_TOLERANCE, IncrementalStats
+from .profiling import NULL_CONTEXT, NULL_NODE_RECORD
+from .render import dot_source, render, tree_nodes, write_exports
+from .sharded import ShardedFit
+from .streaming import DEFAULT_STREAM_CHUNK_SIZE, iter_chunks, write_labels
+from .tree_file import read_tree_file, write_tree_file
 
 BASE_TREE = ['IMM', 'NONE']
 
+SPLITTERS = ['auto', 'sort', 'hist']
+
+# Largest number of distinct values per column for which the counting based cut finders are used.
+MAX_HIST_BINS = 256
+
+# Integer dtypes the cut finders are compiled for, narrowest first.
+COMPACT_DTYPES = [np.uint8, np.int8, np.uint16, np.int16, np.int32]
+
+# Surrogate costs closer than this, relative to the cost scale of the leaf, are ties (as in the surrogate cut
+# finders). Cost gains within it are zero, so that leaves whose split keeps their center on both sides are expanded
+# in creation order, whatever the rounding of the splitter that found them.
+SURROGATE_COST_RTOL = 1e-9
+
 LEAF_DATA_KEY_X_DATA = 'X_DATA_KEY'
 LEAF_DATA_KEY_Y = 'Y_KEY'
 LEAF_DATA_KEY_X_CENTER_DOT = 'X_CENTER_DOT'
@@ -21,7 +46,9 @@ LEAF_DATA_KEY_SPLITTER = 'SPLITTER_KEY'
 
 class Tree:
 
-    def __init__(self, k, max_leaves=None, verbose=0, light=True, base_tree='IMM', n_jobs=None, random_state=None):
+    def __init__(self, k, max_leaves=None, verbose=0, light=True, base_tree='IMM', n_jobs=None, random_state=None,
+                 compact=False, presort=False, splitter='auto', profiler=None, incremental=False,
+                 sample_size=None):
         """
         Constructor for explainable k-means tree.
         :param k: Number of clusters.
@@ -31,6 +58,12 @@ class Tree:
         :param base_tree: Specify weather the first k leaves are generated according to IMM splitting criteria or not. Valid values are ["IMM", "NONE"].
         :param n_jobs: The number of jobs to run in parallel.
         :param random_state: Determines random number generation for k-means initialization. Use an int to make the randomness deterministic.
+        :param compact: If True, integer valued input is kept in the narrowest integer dtype that holds it (e.g. uint8) instead of float64.
+        :param presort: If True, the IMM tree is built by sorting each column once at the root and partitioning a single row permutation in place, instead of sorting and copying the data at every node.
+        :param splitter: Cut finder backend. "sort" sorts each column at every node, "hist" builds per-value histograms in a single pass and requires integer data in [0, MAX_HIST_BINS), "auto" picks "hist" when the data allows it. Valid values are ["auto", "sort", "hist"]. The presorted IMM build always uses its own sort based kernel.
+        :param profiler: Optional Profiler (see profiling.py) recording per stage and per node timings and memory of fit. Profiling is off if None.
+        :param incremental: If True, fit keeps integer statistics of the training data (see incremental.py), so partial_fit can add new samples to the tree later. Requires integer data in [0, MAX_HIST_BINS). On top of per-node sums, this keeps (d * d + d * k + d) * n_bins int64 of histograms for each of the (at most max_leaves / 2) parents of two leaves, e.g. 62 KB each for 16 features, k = 14 and 16 bins, or 10 MB each for 64 features and 256 bins.
+        :param sample_size: If given, the IMM tree of training sets larger than sample_size is built approximately: the cut of each node is picked on a per-center stratified sample of about sample_size of its rows, grown where the best cuts are close (see approximate.py). The statistics are still computed on all the data, see approximation_report.
         """
         self.k = k
         self.tree = None
@@ -45,7 +78,39 @@ class Tree:
             raise Exception(base_tree + ' is not a supported base tree')
         self.base_tree = base_tree
         self.n_jobs = n_jobs if n_jobs is not None else 1
+        self.compact = compact
+        self.presort = presort
+        if splitter not in SPLITTERS:
+            raise Exception(splitter + ' is not a supported splitter')
+        self.splitter = splitter
+        self._n_bins = None
         self._feature_importance = None
+        self._flat = None
+        self._fit_times = {}
+        self._fit_evaluation = None
+        self.profiler = profiler
+        self.incremental = incremental
+        self._incremental_stats = None
+        self._partial_fit_report = None
+        self.sample_size = sample_size
+        self._sampled_build = None
+
+    @property
+    def tree(self):
+        """
+        Root Node of the fitted tree. A loaded tree only holds flat arrays, and builds its nodes on first access.
+        """
+        if self._tree is None and self._flat is not None:
+            self._tree = self._flat.to_node(Node, self._node_samples, self._node_mistakes)
+        return self._tree
+
+    @tree.setter
+    def tree(self, root):
+        # The flat arrays are compiled from the nodes, so a new root invalidates them
+        self._tree = root
+        self._flat = None
+        self._node_samples = None
+        self._node_mistakes = None
 
     def _build_tree(self, x_data, y, valid_centers, valid_cols):
         """
@@ -56,59 +121,183 @@ class Tree:
         :param valid_cols: Boolean array specifying which columns should be considered fot the tree creation.
         :return: The root of the created tree.
         """
+        return self._schedule_build(self._build_node, (x_data, y, valid_centers, valid_cols))
+
+    def _build_node(self, node, n_jobs, x_data, y, valid_centers, valid_cols):
+        """
+        Fill a single node of the tree, and return the build tasks of its children.
+        :param node: The node to fill.
+        :param n_jobs: Number of threads for the column search of this node.
+        :param x_data: The input samples that reach the node.
+        :param y: Clusters of the input samples.
+        :param valid_centers: Boolean array specifying which centers should be considered for the tree creation.
+        :param valid_cols: Boolean array specifying which columns should be considered fot the tree creation.
+        :return: List of (child node, arguments) tasks.
+        """
         if self.verbose > 1:
             print('build node (samples=%d)' % x_data.shape[0])
-        node = Node()
         if x_data.shape[0] == 0:
             node.value = 0
-            return node
+            return []
         elif valid_centers.sum() == 1:
             node.value = np.argmax(valid_centers)
-            return node
-        else:
-            if np.unique(y).shape[0] == 1:
-                node.value = y[0]
-                return node
+            return []
+        elif np.unique(y).shape[0] == 1:
+            node.value = y[0]
+            return []
+
+        # Verify data types prior to cython call. x_data is already float64 or a compact integer dtype.
+        y = y.astype(np.int32, copy=False)
+        valid_centers = valid_centers.astype(np.int32, copy=False)
+        valid_cols = valid_cols.astype(np.int32, copy=False)
+
+        record = self._node_record("build", x_data.shape[0])
+        with record.section("cut_search"):
+            if self._n_bins is not None:
+                cut = get_min_mistakes_cut_hist(x_data, y, self.all_centers, valid_centers, valid_cols,
+                                                self._n_bins, n_jobs)
             else:
+                cut = get_min_mistakes_cut(x_data, y, self.all_centers, valid_centers, valid_cols, n_jobs,
+                                           record.timings)
 
-                # Verify data type is float64 prior to cython call
-                x_data = x_data.astype(np.float64, copy=False)
-                y = y.astype(np.int32, copy=False)
-                self.all_centers = self.all_centers.astype(np.float64, copy=False)
-                valid_centers = valid_centers.astype(np.int32, copy=False)
-                valid_cols = valid_cols.astype(np.int32, copy=False)
+        if cut is None:
+            node.value = np.argmax(valid_centers)
+            record.finish()
+            return []
 
-                cut = get_min_mistakes_cut(x_data, y, self.all_centers, valid_centers, valid_cols, self.n_jobs)
+        col = cut["col"]
+        threshold = cut["threshold"]
+        node.set_condition(col, threshold)
 
-                if cut is None:
-                    node.value = np.argmax(valid_centers)
-                else:
-                    col = cut["col"]
-                    threshold = cut["threshold"]
-                    node.set_condition(col, threshold)
+        with record.section("mask_copy"):
+            left_data_mask = x_data[:, col] <= threshold
+            matching_centers_mask = self.all_centers[:, col][y] <= threshold
+            mistakes_mask = left_data_mask != matching_centers_mask
+            left_mask = left_data_mask & ~mistakes_mask
+            right_mask = ~left_data_mask & ~mistakes_mask
+            left_x_data, left_y = x_data[left_mask], y[left_mask]
+            right_x_data, right_y = x_data[right_mask], y[right_mask]
+        left_valid_centers, right_valid_centers = self.__split_valid_centers__(valid_centers, col, threshold)
+        record.finish(col, threshold)
+
+        node.left = Node()
+        node.right = Node()
+        return [(node.left, (left_x_data, left_y, left_valid_centers, valid_cols)),
+                (node.right, (right_x_data, right_y, right_valid_centers, valid_cols))]
+
+    def _build_tree_presorted(self, x_data, y, order, side, start, end, valid_centers, valid_cols):
+        """
+        Build a tree over the rows order[:, start:end], where order[col] lists rows sorted by column col.
+        Splitting a node partitions order[:, start:end] in place, so every column stays sorted in each child range
+        and no data is copied or re-sorted.
+        :param x_data: The input samples.
+        :param y: Clusters of the input samples.
+        :param order: Per-column row permutations (int32, shape d x n).
+        :param side: Scratch array of length n used to mark the side of each row.
+        :param start: First position of this node's rows in order.
+        :param end: End position (exclusive) of this node's rows in order.
+        :param valid_centers: Boolean array specifying which centers should be considered for the tree creation.
+        :param valid_cols: Boolean array specifying which columns should be considered fot the tree creation.
+        :return: The root of the created tree.
+        """
+        def build_node(node, n_jobs, start, end, valid_centers):
+            return self._build_node_presorted(node, n_jobs, x_data, y, order, side, start, end,
+                                              valid_centers, valid_cols)
+
+        return self._schedule_build(build_node, (start, end, valid_centers))
+
+    def _build_node_presorted(self, node, n_jobs, x_data, y, order, side, start, end, valid_centers, valid_cols):
+        """
+        Fill a single node of a presorted build, and return the build tasks of its children.
+        Sibling nodes own disjoint ranges of order and disjoint rows of side, so they can be built concurrently.
+        :return: List of (child node, (start, end, valid_centers)) tasks.
+        """
+        if self.verbose > 1:
+            print('build node (samples=%d)' % (end - start))
+        if end == start:
+            node.value = 0
+            return []
+        elif valid_centers.sum() == 1:
+            node.value = np.argmax(valid_centers)
+            return []
+
+        rows = order[0, start:end]
+        node_y = y[rows]
+        if np.unique(node_y).shape[0] == 1:
+            node.value = node_y[0]
+            return []
+
+        record = self._node_record("build", end - start)
+        with record.section("cut_search"):
+            cut = get_min_mistakes_cut_presorted(x_data, y, self.all_centers, valid_centers, valid_cols,
+                                                 order, start, end, n_jobs)
+        if cut is None:
+            node.value = np.argmax(valid_centers)
+            record.finish()
+            return []
+
+        col = cut["col"]
+        threshold = cut["threshold"]
+        node.set_condition(col, threshold)
 
-                    left_data_mask = x_data[:, col] <= threshold
-                    matching_centers_mask = self.all_centers[:, col][y] <= threshold
-                    mistakes_mask = left_data_mask != matching_centers_mask
+        with record.section("mask_copy"):
+            left_data_mask = x_data[rows, col] <= threshold
+            matching_centers_mask = self.all_centers[:, col][node_y] <= threshold
+            # 0: left, 1: right, 2: mistake (dropped from both children)
+            side[rows] = np.where(left_data_mask != matching_centers_mask, 2, ~left_data_mask)
+            n_left, n_right = partition_presorted(order, side, start, end, n_jobs)
+        record.finish(col, threshold)
+        left_valid_centers, right_valid_centers = self.__split_valid_centers__(valid_centers, col, threshold)
 
-                    left_valid_centers_mask = self.all_centers[valid_centers.astype(bool), col] <= threshold
-                    left_valid_centers = np.zeros(valid_centers.shape, dtype=np.int32)
-                    left_valid_centers[valid_centers.astype(bool)] = left_valid_centers_mask
-                    right_valid_centers = np.zeros(valid_centers.shape, dtype=np.int32)
-                    right_valid_centers[valid_centers.astype(bool)] = ~left_valid_centers_mask
+        node.left = Node()
+        node.right = Node()
+        return [(node.left, (start, start + n_left, left_valid_centers)),
+                (node.right, (start + n_left, start + n_left + n_right, right_valid_centers))]
 
-                    node.left = self._build_tree(x_data[left_data_mask & ~mistakes_mask],
-                                                 y[left_data_mask & ~mistakes_mask],
-                                                 left_valid_centers,
-                                                 valid_cols)
-                    node.right = self._build_tree(x_data[~left_data_mask & ~mistakes_mask],
-                                                  y[~left_data_mask & ~mistakes_mask],
-                                                  right_valid_centers,
-                                                  valid_cols)
+    def __split_valid_centers__(self, valid_centers, col, threshold):
+        left_valid_centers_mask = self.all_centers[valid_centers.astype(bool), col] <= threshold
+        left_valid_centers = np.zeros(valid_centers.shape, dtype=np.int32)
+        left_valid_centers[valid_centers.astype(bool)] = left_valid_centers_mask
+        right_valid_centers = np.zeros(valid_centers.shape, dtype=np.int32)
+        right_valid_centers[valid_centers.astype(bool)] = ~left_valid_centers_mask
+        return left_valid_centers, right_valid_centers
 
-                return node
+    def _schedule_build(self, build_node, root_args):
+        """
+        Build a tree node by node. build_node(node, n_jobs, *args) fills node and returns its children tasks.
+        With n_jobs > 1, sibling subtrees are built concurrently by a pool of n_jobs threads: idle threads pick up
+        whichever node task is waiting next, and the n_jobs budget is split between the pending nodes for their
+        column searches (a lone root node gets all of it). Each node depends only on its own inputs, so the tree
+        is the same for any schedule.
+        :param build_node: Node builder.
+        :param root_args: Arguments of the root node.
+        :return: The root of the created tree.
+        """
+        root = Node()
+        if self.n_jobs <= 1:
+            stack = [(root, root_args)]
+            while len(stack) > 0:
+                node, args = stack.pop()
+                stack.extend(reversed(build_node(node, 1, *args)))
+            return root
+
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+            pending = {pool.submit(build_node, root, self.n_jobs, *root_args)}
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                children = [child for future in done for child in future.result()]
+                col_jobs = max(1, self.n_jobs // max(1, len(pending) + len(children)))
+                for node, args in children:
+                    pending.add(pool.submit(build_node, node, col_jobs, *args))
+        return root
+
+    def _stage(self, name):
+        return NULL_CONTEXT if self.profiler is None else self.profiler.stage(name)
 
-    def fit(self, x_data, clusters, hardware_accel, kmeans):
+    def _node_record(self, phase, samples):
+        return NULL_NODE_RECORD if self.profiler is None else self.profiler.node(phase, samples)
+
+    def fit(self, x_data, clusters=None, hardware_accel=False, kmeans=None, provider=None, labels=None, order=None):
         """
         Build a threshold tree from the training set x_data.
         :param x_data: The training input samples.
@@ -118,57 +307,219 @@ class Tree:
         are already provided.
         :param kmeans: Trained model of k-means clustering over the training data.
         Not required if we are accelerating hardware.
+        :param provider: Optional CentroidProvider (see centroids.py). If given, it takes precedence over clusters,
+        hardware_accel and kmeans, and is fitted on x_data unless it is already fitted.
+        :param labels: Optional closest center of each sample, if already known. Skips assigning them again (see assignment.py).
+        :param order: Optional presort_columns(x_data), for the presorted build, e.g. shared by fits of several k.
+        The build partitions a copy of it, the order itself is left sorted.
         :return: Fitted threshold tree.
         """
 
-        x_data = convert_input(x_data)
-        if hardware_accel is False:
+        x_data = convert_input(x_data, self.compact)
+        if provider is not None:
+            if not provider.is_fitted():
+                provider.fit(x_data)
+            assert provider.cluster_centers_.shape[0] == self.k
+            self.all_centers = provider.cluster_centers_
+            kmeans = provider
+        elif hardware_accel is False:
             if kmeans is None:
                 if self.verbose > 0:
                     print('Finding %d-means' % self.k)
                 kmeans = KMeans(self.k, verbose=self.verbose, random_state=self.random_state, n_init=1, max_iter=40)
                 kmeans.fit(x_data)
-                self.all_centers = kmeans.cluster_centers_
-                y = np.array(kmeans.predict(x_data), dtype=np.int32)
             else:
                 assert kmeans.n_clusters == self.k
+            self.all_centers = kmeans.cluster_centers_
         else:
             self.all_centers = clusters
-            kmeans = KMeans(self.k, verbose=self.verbose, random_state=self.random_state, n_init=1, max_iter=40)
-            kmeans.cluster_centers_ = clusters
-            kmeans._n_threads = 16
-        y = np.array(kmeans.predict(x_data), dtype=np.double)
-
-        if self.base_tree == "IMM":
-            self.tree = self._build_tree(x_data, y,
-                                         np.ones(self.all_centers.shape[0], dtype=np.int32),
-                                         np.ones(self.all_centers.shape[1], dtype=np.int32))
-            leaves = self.k
-        else:
-            self.tree = Node()
-            self.tree.value = 0
-            leaves = 1
+        self.all_centers = np.asarray(self.all_centers).astype(np.float64, copy=False)
+
+        self._n_bins = None if self.splitter == 'sort' else hist_bins(x_data)
+        if self.splitter == 'hist' and self._n_bins is None:
+            raise Exception('hist splitter requires integer data in [0, %d)' % MAX_HIST_BINS)
+        if self.incremental and hist_bins(x_data) is None:
+            raise Exception('incremental fit requires integer data in [0, %d)' % MAX_HIST_BINS)
+        leaves = self.k if self.base_tree == "IMM" else 1
+        # The sort based expansion needs the dot products of the samples with the centers, which the assignment
+        # computes anyway
+        keep_center_dot = self._n_bins is None and self.max_leaves > leaves
+        x_center_dot = None
+        with self._stage("labels"):
+            if labels is not None:
+                y = np.array(labels, dtype=np.int32)
+                if keep_center_dot:
+                    x_center_dot = center_dots(x_data, self.all_centers, n_jobs=self.n_jobs)
+            elif keep_center_dot:
+                y, x_center_dot = assign(x_data, self.all_centers, n_jobs=self.n_jobs, keep_center_dot=True)
+            else:
+                y = assign(x_data, self.all_centers, n_jobs=self.n_jobs)
+
+        build_start = time.perf_counter()
+        self._sampled_build = None
+        with self._stage("build"):
+            if self.base_tree == "IMM" and self.sample_size is not None and x_data.shape[0] > self.sample_size:
+                sampled = SampledBuild(self, x_data, y, self.sample_size, random_state=self.random_state)
+                self.tree = sampled.build(self.__split_valid_centers__)
+                self._sampled_build = sampled.report()
+            elif self.base_tree == "IMM" and self.presort:
+                self.tree = self._build_tree_presorted(x_data, y,
+                                                       presort_columns(x_data) if order is None else order.copy(),
+                                                       np.zeros(x_data.shape[0], dtype=np.int8),
+                                                       0, x_data.shape[0],
+                                                       np.ones(self.all_centers.shape[0], dtype=np.int32),
+                                                       np.ones(self.all_centers.shape[1], dtype=np.int32))
+            elif self.base_tree == "IMM":
+                self.tree = self._build_tree(x_data, y,
+                                             np.ones(self.all_centers.shape[0], dtype=np.int32),
+                                             np.ones(self.all_centers.shape[1], dtype=np.int32))
+            else:
+                self.tree = Node()
+                self.tree.value = 0
+
+        expand_start = time.perf_counter()
+        with self._stage("expand"):
+            if self.max_leaves > leaves:
+                self.__gather_leaves_data__(self.tree, x_data, y, x_center_dot)
+                x_center_dot = None
+                all_centers_norm_sqr = (np.linalg.norm(self.all_centers, axis=1) ** 2).astype(np.float64, copy=False)
+                self.__expand_tree__(leaves, all_centers_norm_sqr)
+                if self.light:
+                    self._leaves_data = {}
+
+        stats_start = time.perf_counter()
+        with self._stage("stats"):
+            self._flat = FlatTree.from_node(self.tree)
+            self._fit_evaluation = evaluate(self._flat, self.all_centers, x_data, y, n_jobs=self.n_jobs)
+            self.__fill_stats__(self._fit_evaluation, x_data.shape[1])
+            if self.incremental:
+                self._incremental_stats = IncrementalStats.from_data(self._flat, self.all_centers, x_data, y,
+                                                                     hist_bins(x_data), self.n_jobs)
+        self._fit_times = {"build": expand_start - build_start,
+                           "expand": stats_start - expand_start,
+                           "stats": time.perf_counter() - stats_start}
+
+        return self
 
-        if self.max_leaves > leaves:
-            self.__gather_leaves_data__(self.tree, x_data, y)
-            all_centers_norm_sqr = (np.linalg.norm(self.all_centers, axis=1) ** 2).astype(np.float64, copy=False)
-            self.__expand_tree__(leaves, all_centers_norm_sqr)
-            if self.light:
-                self._leaves_data = {}
+    def fit_sharded(self, shards, provider, transport=None):
+        """
+        Build a threshold tree from a training set split into shards on disk (see sharded.write_shards), which does
+        not need to fit in memory. Workers reduce each shard to histograms, so the shards must hold integer data in
+        [0, MAX_HIST_BINS); the tree is the one fit builds with the hist splitter on the whole data.
+        :param shards: Paths of the shards.
+        :param provider: Fitted CentroidProvider (see centroids.py), e.g. fitted on a sample of the data.
+        :param transport: Runs the shard tasks, see sharded.SerialTransport. Defaults to n_jobs local processes.
+        :return: Fitted threshold tree.
+        """
+        if not provider.is_fitted():
+            raise Exception('fit_sharded requires a fitted centroid provider')
+        assert provider.cluster_centers_.shape[0] == self.k
+        with ShardedFit(self, shards, transport) as sharded:
+            with self._stage("labels"):
+                sharded.prepare(provider, MAX_HIST_BINS)
+            self.all_centers = sharded.centers
+            self._n_bins = sharded.n_bins
+
+            build_start = time.perf_counter()
+            growing = sharded.new_tree()
+            with self._stage("build"):
+                if self.base_tree == "IMM":
+                    sharded.build_imm(growing, self.__split_valid_centers__)
+                    leaves = self.k
+                else:
+                    growing.value[0] = 0
+                    leaves = 1
 
-        self._feature_importance = np.zeros(x_data.shape[1])
-        self.__fill_stats__(self.tree, x_data, y)
+            expand_start = time.perf_counter()
+            with self._stage("expand"):
+                if self.max_leaves > leaves:
+                    sharded.expand(growing, leaves, surrogate_splitter, hist_center_dot)
 
+            stats_start = time.perf_counter()
+            with self._stage("stats"):
+                # Renumber the nodes breadth first, as compile does
+                self.tree = growing.to_flat().to_node(Node)
+                self._flat = FlatTree.from_node(self.tree)
+                self._fit_evaluation = evaluation_from_sums(self._flat, self.all_centers,
+                                                            sharded.evaluation_sums(self._flat))
+                self.__fill_stats__(self._fit_evaluation, self.all_centers.shape[1])
+        self._fit_times = {"build": expand_start - build_start,
+                           "expand": stats_start - expand_start,
+                           "stats": time.perf_counter() - stats_start}
         return self
 
-    def fit_predict(self, x_data, centroids, hardware_accel, kmeans):
+    def partial_fit(self, x_data, labels=None, tolerance=DEFAULT_DRIFT_TOLERANCE):
+        """
+        Add new samples to a tree fitted with incremental=True, without going over the previous ones again.
+        The samples are routed to their leaves and added to the node statistics. The bottom splits (parents of two
+        leaves) whose mistake rate drifted by more than tolerance since they were last optimized are searched again,
+        over all the samples they were given, for the cut between the centers of their two leaves with the fewest
+        mistakes, as in the IMM build. The centers of the leaves are kept, so every center keeps its leaves.
+        Node samples, mistakes and the fit evaluation then cover all the samples. The centers are kept.
+        :param x_data: The new samples, integer valued in [0, MAX_HIST_BINS).
+        :param labels: Optional closest center of each sample, if already known.
+        :param tolerance: Change of mistake rate above which a bottom split is optimized again.
+        :return: The updated tree. partial_fit_report tells which nodes changed.
+        """
+        if self._incremental_stats is None:
+            raise Exception('partial_fit requires a tree fitted with incremental=True')
+        x_data = convert_input(x_data, self.compact)
+        if hist_bins(x_data) is None:
+            raise Exception('partial_fit requires integer data in [0, %d)' % MAX_HIST_BINS)
+        if labels is None:
+            y = assign(x_data, self.all_centers, n_jobs=self.n_jobs)
+        else:
+            y = np.array(labels, dtype=np.int32)
+
+        stats = self._incremental_stats
+        reached = stats.add(self._flat, x_data, y)
+        drifted = stats.drifted(self._flat, reached, tolerance)
+        changed = [node for node in drifted if stats.reoptimize(self._flat, node)]
+        if len(changed) > 0:
+            # Same shape, so the rebuilt flat tree keeps the node indices the incremental statistics refer to
+            self.tree = self._flat.to_node(Node)
+            self._flat = FlatTree.from_node(self.tree)
+        self._fit_evaluation = stats.evaluation(self._flat)
+        self.__fill_stats__(self._fit_evaluation, x_data.shape[1])
+        self._partial_fit_report = {"samples": x_data.shape[0],
+                                    "total_samples": self._fit_evaluation["n"],
+                                    "drifted": drifted,
+                                    "changed": changed}
+        return self
+
+    def partial_fit_report(self):
+        """
+        :return: Dictionary describing the last partial_fit: the number of new samples ("samples") and of samples
+        overall ("total_samples"), the bottom splits that drifted past the tolerance ("drifted") and the ones that
+        were replaced ("changed"), as node indices in breadth-first order (the order of compile and plot).
+        """
+        return self._partial_fit_report
+
+    @classmethod
+    def sweep(cls, x_data, ks, max_leaves=None, n_jobs=1, random_state=None, **params):
+        """
+        Fit centroids and a tree for each number of clusters of ks in one call, sharing the work that does not
+        depend on k, see sweep.sweep_k.
+        :param x_data: The training input samples.
+        :param ks: The numbers of clusters.
+        :param max_leaves: Optional function of k giving the max_leaves of its tree. Defaults to k leaves.
+        :param n_jobs: Number of trees built concurrently.
+        :param random_state: Seed of the centroids.
+        :param params: Other constructor parameters of the trees.
+        :return: DataFrame of k-means cost, tree costs and timings per k, and dictionary of the fitted trees by k.
+        """
+        from .sweep import sweep_k
+        return sweep_k(x_data, ks, max_leaves, n_jobs, random_state, **params)
+
+    def fit_predict(self, x_data, centroids=None, hardware_accel=False, kmeans=None, provider=None):
         """
         Build a threshold tree from the training set x_data, and returns the predicted clusters.
         :param x_data: The training input samples.
         :param kmeans: Trained model of k-means clustering over the training data.
+        :param provider: Optional CentroidProvider, see fit.
         :return: The predicted clusters.
         """
-        self.fit(x_data, centroids, hardware_accel, kmeans)
+        self.fit(x_data, centroids, hardware_accel, kmeans, provider)
         return self.predict(x_data)
 
     def predict(self, x_data):
@@ -177,18 +528,70 @@ class Tree:
         :param x_data: The input samples.
         :return: The predicted clusters.
         """
-        x_data = convert_input(x_data)
-        return self._predict_subtree(self.tree, x_data)
+        x_data = convert_input(x_data, self.compact)
+        return self.compile().predict(x_data)
 
-    def _predict_subtree(self, node, x_data):
-        if node.is_leaf():
-            return np.full(x_data.shape[0], node.value)
-        else:
-            ans = np.zeros(x_data.shape[0])
-            left_mask = x_data[:, node.feature] <= node.value
-            ans[left_mask] = self._predict_subtree(node.left, x_data[left_mask])
-            ans[~left_mask] = self._predict_subtree(node.right, x_data[~left_mask])
-            return ans
+    def predict_stream(self, source, chunk_size=DEFAULT_STREAM_CHUNK_SIZE, drop_columns=None, out=None):
+        """
+        Predict clusters chunk by chunk, so memory use does not grow with the number of samples.
+        :param source: Path of a csv file, an array / DataFrame, or an iterable of arrays / DataFrames.
+        :param chunk_size: Maximal number of samples held in memory at once.
+        :param drop_columns: Names of csv columns that are not features (e.g. the label column).
+        :param out: Optional path (or open text file) the predicted clusters are appended to, one per line.
+        :return: Iterator over the predicted clusters of each chunk.
+        """
+        out_file = open(out, "w") if isinstance(out, str) else out
+        try:
+            for chunk in iter_chunks(source, chunk_size, drop_columns):
+                clusters = self.predict(chunk)
+                if out_file is not None:
+                    write_labels(out_file, clusters)
+                yield clusters
+        finally:
+            if isinstance(out, str):
+                out_file.close()
+
+    def predict_file(self, path, out_path, chunk_size=DEFAULT_STREAM_CHUNK_SIZE, drop_columns=None):
+        """
+        Predict clusters for every sample of a csv file and write them to out_path, one per line.
+        Only chunk_size samples are held in memory at once.
+        :param path: Path of the input csv file.
+        :param out_path: Path of the output file.
+        :param chunk_size: Maximal number of samples held in memory at once.
+        :param drop_columns: Names of csv columns that are not features (e.g. the label column).
+        :return: Number of samples predicted.
+        """
+        n = 0
+        for clusters in self.predict_stream(path, chunk_size, drop_columns, out_path):
+            n += clusters.shape[0]
+        return n
+
+    def compile(self):
+        """
+        Return the fitted tree compiled into flat arrays, which is what predict, score and surrogate_score run on.
+        :return: FlatTree of the fitted tree.
+        """
+        if self._flat is None:
+            self._flat = FlatTree.from_node(self.tree)
+        return self._flat
+
+    def evaluate(self, x_data, labels=None):
+        """
+        Evaluate the tree on x_data in a single chunked pass (see evaluation.evaluate): k-means cost, surrogate
+        cost, cost of the reference clustering, price of explainability, per-node samples and leaf mistakes, and
+        the confusion matrix of the reference clusters against the tree clusters.
+        :param x_data: The input samples.
+        :param labels: Optional reference cluster of each sample. Defaults to the closest center in all_centers.
+        :return: Dictionary of the statistics.
+        """
+        x_data = convert_input(x_data, self.compact)
+        return evaluate(self.compile(), self.all_centers, x_data, labels, n_jobs=self.n_jobs)
+
+    def fit_evaluation(self):
+        """
+        :return: The evaluation of the tree on its training set, computed at the end of fit (see evaluate).
+        """
+        return self._fit_evaluation
 
     def score(self, x_data):
         """
@@ -197,15 +600,7 @@ class Tree:
         :param x_data: The input samples.
         :return: k-means cost of x_data.
         """
-        x_data = convert_input(x_data)
-        clusters = self.predict(x_data)
-        cost = 0
-        for c in range(self.k):
-            cluster_data = x_data[clusters == c, :]
-            if cluster_data.shape[0] > 0:
-                center = cluster_data.mean(axis=0)
-                cost += np.linalg.norm(cluster_data - center) ** 2
-        return cost
+        return self.evaluate(x_data)["cost"]
 
     def surrogate_score(self, x_data):
         """
@@ -215,15 +610,7 @@ class Tree:
         :param x_data: The input samples.
         :return: k-means surrogate cost of x_data.
         """
-        x_data = convert_input(x_data)
-        clusters = self.predict(x_data)
-        cost = 0
-        for c in range(self.k):
-            cluster_data = x_data[clusters == c, :]
-            if cluster_data.shape[0] > 0:
-                center = self.all_centers[c]
-                cost += np.linalg.norm(cluster_data - center) ** 2
-        return cost
+        return self.evaluate(x_data)["surrogate_cost"]
 
     def _size(self):
         """
@@ -265,133 +652,153 @@ class Tree:
             dr = self.__max_depth__(node.right)
             return 1 + max(dl, dr)
 
-    def plot(self, filename="test", feature_names=None):
-        if not graphviz_available:
-            raise Exception("Required package is missing. Please install graphviz")
-
-        if self.tree is not None:
-            dot_str = ["digraph ClusteringTree {\n"]
-            queue = [self.tree]
-            nodes = []
-            edges = []
-            id = 0
-            while len(queue) > 0:
-                curr = queue.pop(0)
-                if curr.is_leaf():
-                    label = "%s\nsamples=\%d\nmistakes=\%d" % (str(curr.value), curr.samples, curr.mistakes)
-                else:
-                    feature_name = curr.feature if feature_names is None else feature_names[curr.feature]
-                    condition = "%s <= %.3f" % (feature_name, curr.value)
-                    label = "%s\nsamples=\%d" % (condition, curr.samples)
-                    queue.append(curr.left)
-                    queue.append(curr.right)
-                    edges.append((id, id + len(queue) - 1))
-                    edges.append((id, id + len(queue)))
-                nodes.append({"id": id,
-                              "label": label,
-                              "node": curr})
-                id += 1
-            for node in nodes:
-                dot_str.append("n_%d [label=\"%s\"];\n" % (node["id"], node["label"]))
-            for edge in edges:
-                dot_str.append("n_%d -> n_%d;\n" % (edge[0], edge[1]))
-            dot_str.append("}")
-            dot_str = "".join(dot_str)
-            try:
-                s = Source(dot_str, filename=filename + '.gv', format="png")
-                s.view()
-            except Exception as e:
-                print(dot_str)
-                raise e
+    def export_nodes(self, feature_names=None):
+        """
+        :param feature_names: Optional names of the features.
+        :return: The nodes of the tree in breadth-first order, as dictionaries that json can dump (see render.py).
+        """
+        nodes = bfs_nodes(self.tree)
+        return tree_nodes(self.compile(), [node.samples for node in nodes], [node.mistakes for node in nodes],
+                          feature_names)
+
+    def to_dot(self, feature_names=None):
+        """
+        :param feature_names: Optional names of the features, used in the node conditions.
+        :return: Graphviz DOT source of the tree.
+        """
+        return dot_source(self.export_nodes(feature_names))
+
+    def export(self, filename, feature_names=None):
+        """
+        Write the tree as DOT source to filename.gv and as json to filename.json, without rendering it.
+        :param filename: Output file name, without extension.
+        :param feature_names: Optional names of the features.
+        :return: The paths written.
+        """
+        return write_exports(self.export_nodes(feature_names), filename)
+
+    def plot(self, filename="test", feature_names=None, view=True, renderer=None):
+        """
+        Render the tree with graphviz into filename.gv.png.
+        :param filename: Output file name, without extension.
+        :param feature_names: Optional names of the features, used in the node conditions.
+        :param view: If True, open the rendered image.
+        :param renderer: Optional TreeRenderer (see render.py). If given, the tree is queued on it and rendered in
+        the background (view is ignored), and plot returns once the DOT source is built.
+        """
+        if self.tree is None:
+            return
+        dot = self.to_dot(feature_names)
+        if renderer is not None:
+            renderer.submit(dot, filename)
+        else:
+            render(dot, filename, view=view)
 
     def __expand_tree__(self, size, all_centers_norm_sqr):
-        if size < self.max_leaves:
+        """
+        Grow the tree best-first from size leaves up to max_leaves leaves.
+        Candidate splits are kept in a heap keyed on cost gain, so each step only evaluates the two leaves created by
+        the previous split. Ties go to the leaf that was created first.
+        :param size: Current number of leaves.
+        :param all_centers_norm_sqr: Squared norm of each center.
+        """
+        heap = []
+        order = count()
+        for leaf in self._leaves_data:
+            self.__push_leaf__(heap, order, leaf, all_centers_norm_sqr)
+
+        while size < self.max_leaves and len(heap) > 0:
             if self.verbose > 1:
                 print('expand tree. size %d/%d' % (size, self.max_leaves))
 
-            best_splitter = None
-            leaf_to_split = None
-            leaf_count = 1
-            for leaf in self._leaves_data:
-                if self.verbose > 1:
-                    print('-- expand leaf. %d/%d (samples=%d)' % (
-                        leaf_count, len(self._leaves_data), self._leaves_data[leaf][LEAF_DATA_KEY_X_DATA].shape[0]))
-                if LEAF_DATA_KEY_SPLITTER not in self._leaves_data[leaf]:
-                    self._leaves_data[leaf][LEAF_DATA_KEY_SPLITTER] = self.__expand_leaf__(leaf, all_centers_norm_sqr)
-                leaf_splitter = self._leaves_data[leaf][LEAF_DATA_KEY_SPLITTER]
-                if leaf_splitter is not None:
-                    if best_splitter is None:
-                        best_splitter = leaf_splitter
-                        leaf_to_split = leaf
-                    elif leaf_splitter["cost_gain"] < best_splitter["cost_gain"]:
-                        best_splitter = leaf_splitter
-                        leaf_to_split = leaf
-                leaf_count += 1
-            if best_splitter is not None:
-                col = best_splitter["col"]
-                threshold = best_splitter["threshold"]
-                self.__split_leaf__(leaf_to_split,
-                                    col,
-                                    threshold,
-                                    best_splitter["center_left"],
-                                    best_splitter["center_right"])
-
-                X = self._leaves_data[leaf_to_split][LEAF_DATA_KEY_X_DATA]
-                y = self._leaves_data[leaf_to_split][LEAF_DATA_KEY_Y]
-                X_center_dot = self._leaves_data[leaf_to_split][LEAF_DATA_KEY_X_CENTER_DOT]
+            _, _, leaf_to_split = heapq.heappop(heap)
+            best_splitter = self._leaves_data[leaf_to_split][LEAF_DATA_KEY_SPLITTER]
+            col = best_splitter["col"]
+            threshold = best_splitter["threshold"]
+            self.__split_leaf__(leaf_to_split,
+                                col,
+                                threshold,
+                                best_splitter["center_left"],
+                                best_splitter["center_right"])
+
+            X = self._leaves_data[leaf_to_split][LEAF_DATA_KEY_X_DATA]
+            y = self._leaves_data[leaf_to_split][LEAF_DATA_KEY_Y]
+            X_center_dot = self._leaves_data[leaf_to_split][LEAF_DATA_KEY_X_CENTER_DOT]
+            if X_center_dot is None:
+                left_X_center_dot = right_X_center_dot = None
+            record = self._node_record("split", X.shape[0])
+            with record.section("mask_copy"):
                 left_mask = X[:, col] <= threshold
+                if X_center_dot is not None:
+                    left_X_center_dot, right_X_center_dot = X_center_dot[left_mask], X_center_dot[~left_mask]
 
                 del self._leaves_data[leaf_to_split]
 
                 self._leaves_data[leaf_to_split.left] = {LEAF_DATA_KEY_X_DATA: X[left_mask],
                                                          LEAF_DATA_KEY_Y: y[left_mask],
-                                                         LEAF_DATA_KEY_X_CENTER_DOT: X_center_dot[left_mask]}
+                                                         LEAF_DATA_KEY_X_CENTER_DOT: left_X_center_dot}
                 self._leaves_data[leaf_to_split.right] = {LEAF_DATA_KEY_X_DATA: X[~left_mask],
                                                           LEAF_DATA_KEY_Y: y[~left_mask],
-                                                          LEAF_DATA_KEY_X_CENTER_DOT: X_center_dot[~left_mask]}
-                self.__expand_tree__(size + 1, all_centers_norm_sqr)
+                                                          LEAF_DATA_KEY_X_CENTER_DOT: right_X_center_dot}
+            record.finish(col, threshold)
+            self.__push_leaf__(heap, order, leaf_to_split.left, all_centers_norm_sqr)
+            self.__push_leaf__(heap, order, leaf_to_split.right, all_centers_norm_sqr)
+            size += 1
 
-    def __gather_leaves_data__(self, node, x_data, y):
+    def __push_leaf__(self, heap, order, leaf, all_centers_norm_sqr):
+        """
+        Find the best split of a leaf, and push it to the heap of candidate splits if there is one.
+        :param heap: Heap of (cost_gain, creation order, leaf) entries.
+        :param order: Counter giving the creation order of leaves.
+        :param leaf: The leaf to evaluate.
+        :param all_centers_norm_sqr: Squared norm of each center.
+        """
+        if self.verbose > 1:
+            print('-- expand leaf. (samples=%d)' % self._leaves_data[leaf][LEAF_DATA_KEY_X_DATA].shape[0])
+        splitter = self.__expand_leaf__(leaf, all_centers_norm_sqr)
+        self._leaves_data[leaf][LEAF_DATA_KEY_SPLITTER] = splitter
+        if splitter is not None:
+            heapq.heappush(heap, (splitter["cost_gain"], next(order), leaf))
+
+    def __gather_leaves_data__(self, node, x_data, y, x_center_dot):
         if node.is_leaf():
+            # The histogram kernels work from the data alone, only the sort based ones need the dot products
             self._leaves_data[node] = {LEAF_DATA_KEY_X_DATA: x_data,
                                        LEAF_DATA_KEY_Y: y,
-                                       LEAF_DATA_KEY_X_CENTER_DOT: np.dot(x_data, self.all_centers.T).astype(np.float64,
-                                                                                                             copy=False)}
+                                       LEAF_DATA_KEY_X_CENTER_DOT: x_center_dot}
         else:
             left_mask = x_data[:, node.feature] <= node.value
-            self.__gather_leaves_data__(node.left, x_data[left_mask], y[left_mask])
-            self.__gather_leaves_data__(node.right, x_data[~left_mask], y[~left_mask])
+            self.__gather_leaves_data__(node.left, x_data[left_mask], y[left_mask],
+                                        None if x_center_dot is None else x_center_dot[left_mask])
+            self.__gather_leaves_data__(node.right, x_data[~left_mask], y[~left_mask],
+                                        None if x_center_dot is None else x_center_dot[~left_mask])
 
     def __expand_leaf__(self, leaf, all_centers_norm_sqr):
         leaf_data = self._leaves_data[leaf]
-        mistakes_counter = Counter([curr_y for curr_y in leaf_data[LEAF_DATA_KEY_Y] if curr_y != leaf.value])
-        if len(mistakes_counter) == 0:
+        if np.count_nonzero(leaf_data[LEAF_DATA_KEY_Y] != leaf.value) == 0:
             return None
 
-        # Verify data type is float64 prior to cython call
-        X = leaf_data[LEAF_DATA_KEY_X_DATA].astype(np.float64, copy=False)
-        X_center_dot = leaf_data[LEAF_DATA_KEY_X_CENTER_DOT].astype(np.float64, copy=False)
+        # Verify data types prior to cython call. X is already float64 or a compact integer dtype.
+        X = leaf_data[LEAF_DATA_KEY_X_DATA]
         all_centers_norm_sqr = all_centers_norm_sqr.astype(np.float64, copy=False)
 
-        min_cut = get_min_surrogate_cut(X, X_center_dot, X_center_dot.sum(axis=0), all_centers_norm_sqr, self.n_jobs)
-
-        if min_cut is not None:
-            pre_split_cost = self.__get_leaf_pre_split_cost__(X_center_dot, all_centers_norm_sqr)
-            splitter = {"col": min_cut["col"],
-                        "threshold": min_cut["threshold"],
-                        "cost_gain": min_cut["cost"] - pre_split_cost,
-                        "center_left": min_cut["center_left"],
-                        "center_right": min_cut["center_right"]}
-            return splitter
+        record = self._node_record("expand", X.shape[0])
+        with record.section("cut_search"):
+            if self._n_bins is not None:
+                sums, counts = surrogate_histograms(X, self._n_bins, self.n_jobs)
+                min_cut = get_min_surrogate_cut_from_hist(sums, counts, self.all_centers, all_centers_norm_sqr,
+                                                          self.n_jobs)
+                X_sum_all_center_dot = hist_center_dot(self.all_centers, sums)
+            else:
+                X_center_dot = leaf_data[LEAF_DATA_KEY_X_CENTER_DOT].astype(np.float64, copy=False)
+                X_sum_all_center_dot = X_center_dot.sum(axis=0)
+                min_cut = get_min_surrogate_cut(X, X_center_dot, X_sum_all_center_dot, all_centers_norm_sqr,
+                                                self.n_jobs, record.timings)
+        if min_cut is None:
+            record.finish()
         else:
-            return None
-
-    def __get_leaf_pre_split_cost__(self, X_center_dot, all_centers_norm_sqr):
-        n = X_center_dot.shape[0]
-
-        cost_per_center = (n * all_centers_norm_sqr) - 2 * X_center_dot.sum(axis=0)
-        best_center = cost_per_center.argmin()
-        return cost_per_center[best_center]
+            record.finish(min_cut["col"], min_cut["threshold"])
+        return surrogate_splitter(min_cut, X.shape[0], X_sum_all_center_dot, all_centers_norm_sqr)
 
     def __split_leaf__(self, leaf, feature, value, left_cluster, right_cluster):
         leaf.feature = feature
@@ -403,21 +810,128 @@ class Tree:
         leaf.right = Node()
         leaf.right.value = right_cluster
 
-    def __fill_stats__(self, node, x_data, y):
-        node.samples = x_data.shape[0]
-        if not node.is_leaf():
-            self._feature_importance[node.feature] += 1
-            left_mask = x_data[:, node.feature] <= node.value
-            self.__fill_stats__(node.left, x_data[left_mask], y[left_mask])
-            self.__fill_stats__(node.right, x_data[~left_mask], y[~left_mask])
-        else:
-            node.mistakes = len([cluster for cluster in y if cluster != node.value])
+    def __fill_stats__(self, evaluation, n_features):
+        internal = self._flat.left != LEAF
+        self._feature_importance = np.bincount(self._flat.feature[internal], minlength=n_features).astype(np.float64)
+        for node, samples, mistakes in zip(bfs_nodes(self.tree), evaluation["samples"], evaluation["mistakes"]):
+            node.samples = int(samples)
+            if mistakes >= 0:
+                node.mistakes = int(mistakes)
 
     def feature_importance(self):
         return self._feature_importance
 
+    def fit_times(self):
+        """
+        :return: Wall time, in seconds, the last fit spent building the IMM tree ("build"), expanding it up to
+        max_leaves ("expand") and filling the node statistics ("stats").
+        """
+        return dict(self._fit_times)
+
+    def approximation_report(self, exact=None):
+        """
+        Describe the sampled build of the last fit (see sample_size and approximate.SampledBuild.report), with the
+        mistakes of the tree on the whole training set ("mistakes", samples whose leaf is not their closest center,
+        and "mistake_rate"), its k-means cost and surrogate cost.
+        :param exact: Optional tree fitted on the same data and centers without sample_size. If given, the report
+        also holds its costs and mistakes, and the relative gaps "cost_gap" and "surrogate_gap" (sampled / exact - 1).
+        :return: Dictionary of the statistics, or None if the last fit did not sample.
+        """
+        if self._sampled_build is None:
+            return None
+        report = dict(self._sampled_build)
+        for prefix, tree in (("", self), ("exact_", exact)):
+            if tree is None:
+                continue
+            evaluation = tree.fit_evaluation()
+            mistakes = int(evaluation["mistakes"][evaluation["mistakes"] > 0].sum())
+            report.update({prefix + "mistakes": mistakes,
+                           prefix + "mistake_rate": mistakes / evaluation["n"],
+                           prefix + "cost": evaluation["cost"],
+                           prefix + "surrogate_cost": evaluation["surrogate_cost"]})
+        if exact is not None:
+            report["cost_gap"] = report["cost"] / report["exact_cost"] - 1
+            report["surrogate_gap"] = report["surrogate_cost"] / report["exact_surrogate_cost"] - 1
+        return report
+
+    def params(self):
+        """
+        :return: The constructor parameters that determine the fitted tree (for a given data and centers), e.g. to
+        key a cache of fitted trees. The others (verbose, light, n_jobs, profiler, incremental) do not change it.
+        """
+        return {"k": self.k,
+                "max_leaves": self.max_leaves,
+                "base_tree": self.base_tree,
+                "splitter": self.splitter,
+                "compact": self.compact,
+                "presort": self.presort,
+                "sample_size": self.sample_size,
+                "random_state": self.random_state}
+
+    def to_arrays(self):
+        """
+        Return the fitted tree as a dictionary of arrays: the flat tree, per-node samples and mistakes (-1 for
+        internal nodes), all_centers and the feature importance.
+        :return: Dictionary of arrays.
+        """
+        flat = self.compile()
+        if self._tree is None:
+            samples, mistakes = self._node_samples, self._node_mistakes
+        else:
+            nodes = bfs_nodes(self._tree)
+            samples = np.array([node.samples for node in nodes], dtype=np.int64)
+            mistakes = np.array([-1 if node.mistakes is None else node.mistakes for node in nodes], dtype=np.int64)
+        return {"feature": flat.feature,
+                "threshold": flat.threshold,
+                "left": flat.left,
+                "right": flat.right,
+                "value": flat.value,
+                "samples": samples,
+                "mistakes": mistakes,
+                "all_centers": self.all_centers,
+                "feature_importance": self._feature_importance}
+
+    def from_arrays(self, arrays):
+        """
+        Restore a fitted tree from the output of to_arrays. The arrays are used as is (not copied), and the Node
+        objects are only built if the tree property is accessed.
+        :param arrays: Dictionary of arrays.
+        :return: The restored tree.
+        """
+        self.tree = None
+        self._flat = FlatTree(arrays["feature"], arrays["threshold"], arrays["left"], arrays["right"],
+                              arrays["value"])
+        self._node_samples = arrays["samples"]
+        self._node_mistakes = arrays["mistakes"]
+        self.all_centers = arrays["all_centers"]
+        self._feature_importance = arrays["feature_importance"]
+        return self
+
+    def save(self, path):
+        """
+        Save the fitted tree to a binary file (see tree_file.py): the flat tree, the per-node samples and
+        mistakes, all_centers and the feature importance, behind a versioned header.
+        :param path: Path of the file.
+        """
+        write_tree_file(path, self.params(), self.to_arrays())
+
+    @classmethod
+    def load(cls, path, mmap_mode='r', n_jobs=None):
+        """
+        Load a tree saved by save. By default the file is memory mapped, so every process loading the same file
+        shares one copy of the arrays, and predict runs on the flat arrays without building any Node.
+        :param path: Path of the file.
+        :param mmap_mode: Memory map mode (see numpy.memmap), or None to read the file into memory.
+        :param n_jobs: The number of jobs to run in parallel.
+        :return: The loaded tree.
+        """
+        params, arrays = read_tree_file(path, mmap_mode)
+        return cls(n_jobs=n_jobs, **params).from_arrays(arrays)
+
 
 class Node:
+    __slots__ = ('feature', 'value', 'samples', 'mistakes', 'left', 'right')
+
     def __init__(self):
         self.feature = None
         self.value = None
@@ -434,13 +948,93 @@ class Node:
         self.value = value
 
 
-def convert_input(data):
+def hist_center_dot(centers, sums):
+    """
+    :param centers: The centers.
+    :param sums: Surrogate histogram sums of the points of a leaf (see surrogate_histograms).
+    :return: The summed dot products of the points of the leaf with each center.
+    """
+    return centers @ sums[0].sum(axis=0).astype(np.float64)
+
+
+def surrogate_splitter(min_cut, n, X_sum_all_center_dot, all_centers_norm_sqr):
+    """
+    Turn the surrogate cut of a leaf into the splitter of the leaf, keyed on the cost gain of the split.
+    :param min_cut: Cut returned by the surrogate cut finders, or None.
+    :param n: Number of points in the leaf.
+    :param X_sum_all_center_dot: Summed dot products of the points of the leaf with each center.
+    :param all_centers_norm_sqr: Squared norm of each center.
+    :return: The splitter, or None if there is no cut.
+    """
+    if min_cut is None:
+        return None
+    pre_split_cost = ((n * all_centers_norm_sqr) - 2 * X_sum_all_center_dot).min()
+    cost_gain = min_cut["cost"] - pre_split_cost
+    if abs(cost_gain) <= SURROGATE_COST_RTOL * (n * all_centers_norm_sqr + 2 * np.abs(X_sum_all_center_dot)).max():
+        cost_gain = 0.0
+    return {"col": min_cut["col"],
+            "threshold": min_cut["threshold"],
+            "cost_gain": cost_gain,
+            "center_left": min_cut["center_left"],
+            "center_right": min_cut["center_right"]}
+
+
+def hist_bins(x_data):
+    """
+    Return the number of histogram bins needed for x_data, if the counting based cut finders can handle it.
+    :param x_data: The input samples.
+    :return: max(x_data) + 1 if x_data is integer valued in [0, MAX_HIST_BINS), None otherwise.
+    """
+    if x_data.size == 0:
+        return None
+    if x_data.dtype.kind == 'f' and not np.array_equal(x_data, np.floor(x_data)):
+        return None
+    min_val = x_data.min()
+    max_val = x_data.max()
+    if min_val < 0 or max_val >= MAX_HIST_BINS:
+        return None
+    return int(max_val) + 1
+
+
+def presort_columns(x_data):
+    """
+    Sort the rows of x_data by every column.
+    :param x_data: The input samples.
+    :return: int32 array of shape (d, n) where row col lists the samples sorted by column col.
+    """
+    order = np.empty((x_data.shape[1], x_data.shape[0]), dtype=np.int32)
+    for col in range(x_data.shape[1]):
+        order[col] = np.argsort(x_data[:, col], kind='stable')
+    return order
+
+
+def convert_input(data, compact=False):
     if isinstance(data, list):
-        data = np.array(data, dtype=np.float64)
-    elif isinstance(data, np.ndarray):
-        data = data.astype(np.float64, copy=False)
+        data = np.array(data)
     elif isinstance(data, pd.DataFrame):
-        data = data.values.astype(np.float64, copy=False)
-    else:
-        raise Exception(type(data) + ' is not supported type')
-    return data
+        data = data.values
+    elif not isinstance(data, np.ndarray):
+        raise Exception(str(type(data)) + ' is not supported type')
+    dtype = compact_dtype(data) if compact else np.float64
+    return data.astype(dtype, copy=False)
+
+
+def compact_dtype(data):
+    """
+    Return the narrowest dtype supported by the cut finders that holds data exactly.
+    :param data: The input samples.
+    :return: One of COMPACT_DTYPES, or float64 if data is not integer valued or does not fit.
+    """
+    if data.size == 0:
+        return np.float64
+    if data.dtype.kind == 'f' and not np.array_equal(data, np.floor(data)):
+        return np.float64
+    elif data.dtype.kind not in 'iuf':
+        return np.float64
+    min_val = data.min()
+    max_val = data.max()
+    for dtype in COMPACT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= min_val and max_val <= info.max:
+            return dtype
+    return np.float64
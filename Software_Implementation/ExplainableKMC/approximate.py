@@ -0,0 +1,209 @@
+import threading
+
+import numpy as np
+
+from .splitters import get_min_mistakes_cut
+from .splitters import get_min_mistakes_cut_hist
+
+# Number of standard deviations of sampling noise by which the best cut of a node must beat its runners-up, else
+# the sample of the node grows
+DEFAULT_CONFIDENCE = 2.0
+# Fewest rows of each center in the sample of a node (all of them if the center has fewer)
+MIN_CENTER_SAMPLES = 32
+# Factor the sampling rate of a node is multiplied by while its cut is ambiguous
+SAMPLE_GROWTH = 2.0
+# Largest growth of the sample of a node: cuts still within the noise of a sample this large are near ties, and
+# growing further would make the cost of the node depend on the number of rows again
+MAX_SAMPLE_GROWTH = 16.0
+
+
+def _mistakes_mask(x_col, center_col, threshold):
+    return (x_col <= threshold) != (center_col <= threshold)
+
+
+def _column_runner_up(x_col, center_col, valid_center_col, threshold):
+    """
+    Best cut of a column other than threshold, over the samples of a node.
+    :param x_col: The column of the samples.
+    :param center_col: The column of the center of each sample.
+    :param valid_center_col: The column of the valid centers of the node.
+    :param threshold: The cut to exclude.
+    :return: Threshold of the cut with the fewest mistakes, among those that separate the valid centers and split the
+    samples or the centers differently from threshold, or None.
+    """
+    candidates = np.union1d(x_col, valid_center_col)
+    candidates = candidates[(candidates >= valid_center_col.min()) & (candidates < valid_center_col.max())]
+    x_sorted = np.sort(x_col)
+    center_sorted = np.sort(center_col)
+    valid_sorted = np.sort(valid_center_col)
+    # Samples left of a cut that are not with their center, plus samples right of it that are not with their center
+    both_sorted = np.sort(np.maximum(x_col, center_col))
+    left = np.searchsorted(x_sorted, candidates, side='right')
+    mistakes = left + np.searchsorted(center_sorted, candidates, side='right') \
+        - 2 * np.searchsorted(both_sorted, candidates, side='right')
+    same = (left == np.searchsorted(x_sorted, threshold, side='right')) & \
+           (np.searchsorted(valid_sorted, candidates, side='right') == np.searchsorted(valid_sorted, threshold,
+                                                                                       side='right'))
+    if same.all():
+        return None
+    mistakes[same] = np.iinfo(mistakes.dtype).max
+    return candidates[np.argmin(mistakes)]
+
+
+class SampledBuild:
+
+    def __init__(self, tree, x_data, y, sample_size, confidence=DEFAULT_CONFIDENCE, random_state=None):
+        """
+        Approximate IMM build. The cut of each node is searched on a per-center stratified sample of about
+        sample_size of the rows reaching it, with the same cut finders as the exact build. The best cut is compared
+        with two runners-up, the best cut of the other columns and the best other threshold of its column: if it
+        does not beat one of them by confidence standard deviations of sampling noise, the node is searched again on
+        a sample SAMPLE_GROWTH times larger, up to MAX_SAMPLE_GROWTH times the first one or all its rows (where the
+        cut is exact).
+        Apart from grouping the rows by center once, the cost of a node depends on sample_size and not on the number
+        of rows. The tree statistics are computed on the whole data afterwards, by fit.
+        :param tree: The Tree being fitted, whose all_centers (and _n_bins, for the hist cut finder) are set.
+        :param x_data: The training input samples.
+        :param y: Closest center of each sample.
+        :param sample_size: Rows sampled per node.
+        :param confidence: See DEFAULT_CONFIDENCE.
+        :param random_state: Seed of the sampling.
+        """
+        self.tree = tree
+        self.x_data = x_data
+        self.y = y.astype(np.int32, copy=False)
+        self.sample_size = sample_size
+        self.confidence = confidence
+        k = tree.all_centers.shape[0]
+        self._rng = np.random.default_rng(random_state)
+        # Nodes may be built concurrently (see Tree._schedule_build), and numpy generators are not thread safe
+        self._rng_lock = threading.Lock()
+        # Rows grouped by center, the only pass over all the rows. numpy sorts 16 bit keys with a (linear time) radix
+        # sort.
+        grouped = np.argsort(self.y.astype(np.int16 if k <= np.iinfo(np.int16).max else np.int32), kind='stable')
+        self.center_counts = np.bincount(self.y, minlength=k)
+        bounds = np.concatenate([[0], np.cumsum(self.center_counts)])
+        self.center_rows = [grouped[bounds[c]:bounds[c + 1]] for c in range(k)]
+        # (rows of the final sample, sampling rate, grown, estimated mistakes) of each split node
+        self.nodes = []
+
+    def build(self, split_valid_centers):
+        """
+        :param split_valid_centers: Splits the valid centers of a node between its children, as Tree does.
+        :return: The root of the created tree.
+        """
+        self._split_valid_centers = split_valid_centers
+        return self.tree._schedule_build(self.__build_node__,
+                                         (np.ones(self.tree.all_centers.shape[0], dtype=np.int32), ()))
+
+    def __sample__(self, rate, valid_centers, path):
+        """
+        :param path: (col, threshold, goes_left) conditions from the root to the node.
+        :return: Sorted rows of a stratified sample at rate, drawn afresh, that reach the node: the rows of its valid centers
+        on the side of every condition of the path, with their center (the rows an IMM split drops as mistakes are
+        dropped here too).
+        """
+        samples = []
+        with self._rng_lock:
+            for rows, valid in zip(self.center_rows, valid_centers):
+                size = max(min(MIN_CENTER_SAMPLES, rows.shape[0]), int(np.ceil(rate * rows.shape[0])))
+                if valid:
+                    samples.append(rows if size >= rows.shape[0] else
+                                   rows[self._rng.choice(rows.shape[0], size, replace=False)])
+        rows = np.sort(np.concatenate(samples))
+        for col, threshold, goes_left in path:
+            keep = ((self.x_data[rows, col] <= threshold) == goes_left) & \
+                   ((self.tree.all_centers[self.y[rows], col] <= threshold) == goes_left)
+            rows = rows[keep]
+        return rows
+
+    def __find_cut__(self, x_data, y, valid_centers, valid_cols, n_jobs):
+        if self.tree._n_bins is not None:
+            return get_min_mistakes_cut_hist(x_data, y, self.tree.all_centers, valid_centers, valid_cols,
+                                             self.tree._n_bins, n_jobs)
+        return get_min_mistakes_cut(x_data, y, self.tree.all_centers, valid_centers, valid_cols, n_jobs)
+
+    def __runners_up__(self, x_data, y, valid_centers, valid_cols, cut, n_jobs):
+        """
+        :return: (col, threshold) of the best cut of the other columns and of the best other cut of the column of cut.
+        """
+        runners_up = []
+        other_cols = valid_cols.copy()
+        other_cols[cut["col"]] = 0
+        other = self.__find_cut__(x_data, y, valid_centers, other_cols, n_jobs)
+        if other is not None:
+            runners_up.append((other["col"], other["threshold"]))
+        centers = self.tree.all_centers[:, cut["col"]]
+        threshold = _column_runner_up(x_data[:, cut["col"]], centers[y], centers[valid_centers.astype(bool)],
+                                      cut["threshold"])
+        if threshold is not None:
+            runners_up.append((cut["col"], threshold))
+        return runners_up
+
+    def __ambiguous__(self, x_data, y, cut, runner_up, rate):
+        best = _mistakes_mask(x_data[:, cut["col"]], self.tree.all_centers[y, cut["col"]], cut["threshold"])
+        other = _mistakes_mask(x_data[:, runner_up[0]], self.tree.all_centers[y, runner_up[0]], runner_up[1])
+        # Only the samples that are a mistake of exactly one of the cuts make their difference: it is a paired
+        # comparison, whose noise is that of their count (with a finite population correction, none at rate 1)
+        discordant = np.count_nonzero(best != other)
+        gap = np.count_nonzero(other) - np.count_nonzero(best)
+        return gap < self.confidence * np.sqrt(discordant * (1.0 - rate))
+
+    def __build_node__(self, node, n_jobs, valid_centers, path):
+        population = self.center_counts[valid_centers.astype(bool)].sum()
+        initial_rate = rate = min(1.0, self.sample_size / max(population, 1))
+        max_rate = min(1.0, initial_rate * MAX_SAMPLE_GROWTH)
+        valid_cols = np.ones(self.tree.all_centers.shape[1], dtype=np.int32)
+        while True:
+            rows = self.__sample__(rate, valid_centers, path)
+            y = self.y[rows]
+            if rows.shape[0] == 0:
+                node.value = 0
+                return []
+            elif valid_centers.sum() == 1:
+                node.value = np.argmax(valid_centers)
+                return []
+            elif np.unique(y).shape[0] == 1:
+                node.value = y[0]
+                return []
+
+            x_data = self.x_data[rows]
+            record = self.tree._node_record("build", rows.shape[0])
+            with record.section("cut_search"):
+                cut = self.__find_cut__(x_data, y, valid_centers, valid_cols, n_jobs)
+                runners_up = []
+                if cut is not None and rate < max_rate:
+                    runners_up = self.__runners_up__(x_data, y, valid_centers, valid_cols, cut, n_jobs)
+            if cut is None:
+                node.value = np.argmax(valid_centers)
+                record.finish()
+                return []
+            record.finish(cut["col"], cut["threshold"])
+            if not any(self.__ambiguous__(x_data, y, cut, runner_up, rate) for runner_up in runners_up):
+                break
+            rate = min(max_rate, rate * SAMPLE_GROWTH)
+
+        col, threshold = cut["col"], cut["threshold"]
+        self.nodes.append((rows.shape[0], rate, rate > initial_rate, cut["mistakes"] / rate))
+        node.set_condition(col, threshold)
+        left_valid_centers, right_valid_centers = self._split_valid_centers(valid_centers, col, threshold)
+        node.left = type(node)()
+        node.right = type(node)()
+        return [(node.left, (left_valid_centers, path + ((col, threshold, True),))),
+                (node.right, (right_valid_centers, path + ((col, threshold, False),)))]
+
+    def report(self):
+        """
+        :return: Dictionary describing the sampled build: "sample_size", the number of split nodes ("nodes"), of
+        them searched on a grown sample ("grown") and on all their rows ("exact"), the rows the final searches ran
+        on ("sample_rows", summed over the nodes, and "max_node_rows") and the IMM mistakes of the cuts estimated
+        from their samples ("estimated_mistakes").
+        """
+        rows = [node[0] for node in self.nodes]
+        return {"sample_size": self.sample_size,
+                "nodes": len(self.nodes),
+                "grown": sum(1 for node in self.nodes if node[2]),
+                "exact": sum(1 for node in self.nodes if node[1] >= 1.0),
+                "sample_rows": int(sum(rows)),
+                "max_node_rows": int(max(rows)) if len(rows) > 0 else 0,
+                "estimated_mistakes": float(sum(node[3] for node in self.nodes))}
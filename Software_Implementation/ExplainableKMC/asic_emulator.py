@@ -0,0 +1,304 @@
+import math
+import re
+
+import numpy as np
+
+from . import hw_codec
+from .flat_tree import DEFAULT_CHUNK_SIZE
+
+# Software model of the datapath of Hardware_Implementation/kmeans_1way.sv. Each stage reproduces the bit widths
+# and truncations of the RTL, including its quirks:
+# - e2cd takes the absolute value of AGE by testing bit 3 of its 5 bit difference, not the sign bit.
+# - dc keeps the *larger* distance of each pair (Din1 >= Din2), the lower index winning ties.
+# - cecau accumulators and element counts are never cleared, so each update averages everything seen since reset.
+# - cecau averages RTCSERVICE and IJSSERVICE from the SPHSERVICE sum, and stores services as 2 bit values.
+# - the adjusted centroid is a 44 bit concatenation truncated to 39 bits, so fields above bit 14 do not land where
+#   e2cd reads them.
+# Centroid updates are applied between batches, so the 8 elements in flight when the RTL updates its centroid
+# register file are compared against the new centroids rather than the old ones.
+
+MAX_ELEMENT = (1 << hw_codec.ELEMENT_BITS) - 1
+
+# e2cd: (field, width of the difference register, bit tested for the sign, width of the absolute value)
+ECD_FIELDS = [("AGE", 5, 3, 4),
+              ("EDUC", 4, 3, 3),
+              ("ETHNIC", 4, 3, 3),
+              ("RACE", 4, 3, 3),
+              ("MARSTAT", 4, 3, 3),
+              ("EMPLOY", 4, 3, 3),
+              ("DETNLF", 4, 3, 3),
+              ("GENDER", 3, 2, 2),
+              ("SAP", 3, 2, 2),
+              ("VETERAN", 3, 2, 2),
+              ("LIVARAG", 3, 2, 2)]
+
+ECD_XOR_FIELDS = ["SPHSERVICE", "CMPSERVICE", "OPISERVICE", "RTCSERVICE", "IJSSERVICE"]
+
+# cecau: (field, width of the accumulator, field whose sum is averaged, width of the new value, averaged doubled),
+# in the order they are concatenated into the adjusted centroid, lsb first.
+CECAU_FIELDS = [("AGE", 23, "AGE", 4, False),
+                ("EDUC", 22, "EDUC", 3, False),
+                ("ETHNIC", 22, "ETHNIC", 3, False),
+                ("RACE", 22, "RACE", 3, False),
+                ("GENDER", 22, "GENDER", 2, False),
+                ("SPHSERVICE", 22, "SPHSERVICE", 2, True),
+                ("CMPSERVICE", 22, "CMPSERVICE", 2, True),
+                ("OPISERVICE", 22, "OPISERVICE", 2, True),
+                ("RTCSERVICE", 22, "SPHSERVICE", 2, True),
+                ("IJSSERVICE", 22, "SPHSERVICE", 2, True),
+                (hw_codec.LABEL_FIELD, 0, None, hw_codec.LABEL_BITS, False),
+                ("MARSTAT", 22, "MARSTAT", 3, False),
+                ("SAP", 22, "SAP", 2, False),
+                ("EMPLOY", 22, "EMPLOY", 3, False),
+                ("DETNLF", 22, "DETNLF", 3, False),
+                ("VETERAN", 22, "VETERAN", 2, False),
+                ("LIVARAG", 22, "LIVARAG", 2, False)]
+
+# Reset values of centroid_rf.
+RESET_CENTROIDS = ["010110110110100000110101100000010111000",
+                   "111001101001000001110010011010011000111",
+                   "001000101101100010010100101000000100000",
+                   "110000101000010011111001100110001000011",
+                   "010010000000010100110101100101000001000",
+                   "001010000001100101010110001010110011110",
+                   "100100010100010110100100011000010111000",
+                   "110010101101010111010011010000110100111",
+                   "000110010010101000100000000010001011011",
+                   "111010101100001001000101101000001001001",
+                   "001010101001001010011111000110001001110",
+                   "000010000000011011001010010000110110100",
+                   "110000100100001100010100100000000010000",
+                   "010100100010011101100101010000010001010"]
+
+# Defaults of sys_defs.svh and of the pc module.
+DEFAULT_K = 14
+DEFAULT_M = 524288
+BATCH_SIZE = 128
+PC_ITERATIONS = 300
+
+# Pipeline depth, in cycles: e2cd (2), dc (4), cecau accumulate (1), pc + cecau update (2).
+PIPELINE_LATENCY = 9
+RESET_CYCLES = 2
+CLOCK_NS = 10
+
+
+def load_sys_defs(path):
+    """
+    Read the integer `define macros of sys_defs.svh.
+    :param path: Path of sys_defs.svh.
+    :return: Dictionary of macro name to value, e.g. {"K": 14, "m": 524288, "dpw": 32}.
+    """
+    defines = {}
+    with open(path) as f:
+        for line in f:
+            match = re.match(r"\s*`define\s+(\w+)\s+(\d+)", line)
+            if match is not None:
+                defines[match.group(1)] = int(match.group(2))
+    return defines
+
+
+def _fields(packed, names):
+    lsb_width = {name: (lsb, width) for name, lsb, width in hw_codec.ELEMENT_FIELDS}
+    values = {}
+    for name in names:
+        lsb, width = lsb_width[name]
+        values[name] = ((packed >> np.uint64(lsb)) & np.uint64((1 << width) - 1)).astype(np.int64)
+    return values
+
+
+def ecd_distances(elements, centroids):
+    """
+    e2cd: distance of each element to each centroid.
+    :param elements: Array of n packed elements.
+    :param centroids: Array of k packed centroids.
+    :return: int64 array of shape (n, k).
+    """
+    names = [field[0] for field in ECD_FIELDS] + ECD_XOR_FIELDS
+    e = _fields(np.asarray(elements, dtype=np.uint64), names)
+    c = _fields(np.asarray(centroids, dtype=np.uint64), names)
+
+    distances = np.zeros((len(elements), len(centroids)), dtype=np.int64)
+    for name, reg_width, sign_bit, abs_width in ECD_FIELDS:
+        diff = e[name][:, None] - c[name][None, :]
+        negative = ((diff & ((1 << reg_width) - 1)) >> sign_bit) & 1
+        distances += np.where(negative, -diff, diff) & ((1 << abs_width) - 1)
+    for name in ECD_XOR_FIELDS:
+        distances += e[name][:, None] ^ c[name][None, :]
+    return distances
+
+
+def dc_select(distances):
+    """
+    dc: index chosen for each element by the comparator tree.
+    :param distances: Array of shape (n, k).
+    :return: int64 array of n indices.
+    """
+    return np.argmax(distances, axis=1)
+
+
+def label_elements(elements, labels, k):
+    """
+    dc: insert the chosen index into bits [23:20] of the elements, as {element[38:24], label_idx, element[19:0]}.
+    :param elements: Array of n packed elements.
+    :param labels: Chosen index of each element.
+    :param k: Number of centroids, which sets the width of the index.
+    :return: Array of n packed elements.
+    """
+    klen = max(1, math.ceil(math.log2(k)))
+    elements = np.asarray(elements, dtype=np.uint64)
+    high = (elements >> np.uint64(hw_codec.LABEL_LSB + hw_codec.LABEL_BITS)) << np.uint64(hw_codec.LABEL_LSB + klen)
+    low = elements & np.uint64((1 << hw_codec.LABEL_LSB) - 1)
+    labels = np.asarray(labels, dtype=np.uint64) << np.uint64(hw_codec.LABEL_LSB)
+    return (high | labels | low) & np.uint64(MAX_ELEMENT)
+
+
+class ASICEmulator:
+
+    def __init__(self, k=DEFAULT_K, m=DEFAULT_M, batch_size=BATCH_SIZE, n_iter=PC_ITERATIONS, init=None,
+                 stop_when_stable=False, clock_ns=CLOCK_NS):
+        """
+        Bit accurate software model of the kmeans_1way ASIC.
+        Elements are streamed in order (wrapping around the data), and the centroids are recalculated after every
+        batch_size elements, n_iter times.
+        :param k: Number of centroids (`K of sys_defs.svh).
+        :param m: Number of elements (`m of sys_defs.svh), which sets the width of the element counters.
+        :param batch_size: Elements between centroid updates (the range of the pc element counter).
+        :param n_iter: Number of centroid updates (the pc iteration count).
+        :param init: Initial centroids, as packed words. Defaults to the reset values of centroid_rf.
+        :param stop_when_stable: Stop once a whole pass over the data left the centroids unchanged.
+        :param clock_ns: Clock period used to estimate the run time.
+        """
+        if init is None:
+            if k > len(RESET_CENTROIDS):
+                raise Exception("Initial centroids must be given when k > %d" % len(RESET_CENTROIDS))
+            init = [int(word, 2) for word in RESET_CENTROIDS[:k]]
+        init = np.asarray(init, dtype=np.uint64)
+        if init.shape[0] != k:
+            raise Exception("Expected %d initial centroids, got %d" % (k, init.shape[0]))
+        if k > 1 << hw_codec.LABEL_BITS:
+            raise Exception("The label field holds at most %d centroids" % (1 << hw_codec.LABEL_BITS))
+
+        self.k = k
+        self.m = m
+        self.batch_size = batch_size
+        self.n_iter = n_iter
+        self.init = init
+        self.stop_when_stable = stop_when_stable
+        self.clock_ns = clock_ns
+
+        self.centroid_words_ = None
+        self.cluster_centers_ = None
+        self.n_iter_ = None
+        self.n_cycles_ = None
+
+    @classmethod
+    def from_sys_defs(cls, path, **kwargs):
+        """
+        :param path: Path of sys_defs.svh, from which K and m are read.
+        """
+        defines = load_sys_defs(path)
+        return cls(k=defines.get("K", DEFAULT_K), m=defines.get("m", DEFAULT_M), **kwargs)
+
+    @staticmethod
+    def to_elements(x_data):
+        """
+        :param x_data: Packed elements, or an array of the csv columns (with or without MH1).
+        :return: Array of packed elements.
+        """
+        x_data = np.asarray(x_data)
+        if x_data.ndim == 1:
+            return x_data.astype(np.uint64)
+        if x_data.shape[1] == len(hw_codec.FEATURE_FIELDS):
+            return hw_codec.pack(x_data, hw_codec.FEATURE_FIELDS)
+        return hw_codec.pack(x_data)
+
+    def fit(self, x_data):
+        """
+        Run the clustering.
+        :param x_data: Packed elements, or an array of the csv columns (with or without MH1).
+        :return: The fitted emulator.
+        """
+        elements = self.to_elements(x_data)
+        n = elements.shape[0]
+        if n == 0:
+            raise Exception("No elements to cluster")
+
+        n_counter_bits = max(1, math.ceil(math.log2(self.m)))
+        names = [field[2] for field in CECAU_FIELDS if field[2] is not None]
+        sums = {name: np.zeros(self.k, dtype=np.int64) for name in names}
+        counts = np.zeros(self.k, dtype=np.int64)
+
+        centroids = self.init.copy()
+        updates_per_pass = max(1, math.ceil(n / self.batch_size))
+        stable = 0
+        n_iter = 0
+        start = 0
+        while n_iter < self.n_iter:
+            batch = np.take(elements, np.arange(start, start + self.batch_size), mode='wrap')
+            start = (start + self.batch_size) % n
+
+            labels = dc_select(ecd_distances(batch, centroids))
+            labelled = label_elements(batch, labels, self.k)
+
+            # cecau accumulate
+            values = _fields(labelled, names)
+            for name, width, source, _, _ in CECAU_FIELDS:
+                if source == name:
+                    sums[name] = (sums[name] + np.bincount(labels, values[name], self.k).astype(np.int64)) \
+                                 & ((1 << width) - 1)
+            counts = (counts + np.bincount(labels, minlength=self.k)) & ((1 << n_counter_bits) - 1)
+
+            new_centroids = self._recalculate(sums, counts, centroids)
+            n_iter += 1
+            stable = stable + 1 if np.array_equal(new_centroids, centroids) else 0
+            centroids = new_centroids
+            if self.stop_when_stable and stable >= updates_per_pass:
+                break
+
+        self.centroid_words_ = centroids
+        self.cluster_centers_ = hw_codec.decode_centroids(hw_codec.format_elements(centroids))
+        self.n_iter_ = n_iter
+        self.n_cycles_ = RESET_CYCLES + n_iter * self.batch_size + PIPELINE_LATENCY
+        return self
+
+    def _recalculate(self, sums, counts, centroids):
+        # cecau update: average of each field, or the low bits of the current centroid for empty clusters
+        widths = {name: width for name, width, _, _, _ in CECAU_FIELDS}
+        word = np.zeros(self.k, dtype=np.uint64)
+        shift = 0
+        nonempty = counts > 0
+        safe_counts = np.where(nonempty, counts, 1)
+        for name, _, source, new_width, doubled in CECAU_FIELDS:
+            mask = (1 << new_width) - 1
+            if source is None:
+                value = np.arange(self.k, dtype=np.int64) & mask
+            else:
+                total = sums[source]
+                if doubled:
+                    total = (total << 1) & ((1 << widths[source]) - 1)
+                value = np.where(nonempty, total // safe_counts, centroids.astype(np.int64)) & mask
+            word |= value.astype(np.uint64) << np.uint64(shift)
+            shift += new_width
+        return word & np.uint64(MAX_ELEMENT)
+
+    def predict(self, x_data):
+        """
+        Index the ASIC assigns to each element against the fitted centroids.
+        :param x_data: Packed elements, or an array of the csv columns (with or without MH1).
+        :return: Array of indices.
+        """
+        elements = self.to_elements(x_data)
+        labels = np.empty(elements.shape[0], dtype=np.int64)
+        for start in range(0, elements.shape[0], DEFAULT_CHUNK_SIZE):
+            end = start + DEFAULT_CHUNK_SIZE
+            labels[start:end] = dc_select(ecd_distances(elements[start:end], self.centroid_words_))
+        return labels
+
+    def report(self):
+        """
+        :return: Dictionary with the number of centroid updates run, the estimated cycle count and run time.
+        """
+        return {"k": self.k,
+                "n_iter": self.n_iter_,
+                "cycles": self.n_cycles_,
+                "time": None if self.n_cycles_ is None else self.n_cycles_ * self.clock_ns * 1e-9}
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .flat_tree import DEFAULT_CHUNK_SIZE
+
+
+def _assign_chunk(x_data, centers, centers_norm_sqr, labels, center_dot):
+    x_data = np.asarray(x_data).astype(np.float64, copy=False)
+    if center_dot is None:
+        center_dot = x_data @ centers.T
+    else:
+        np.matmul(x_data, centers.T, out=center_dot)
+    # argmin of ||c||^2 - 2 x.c is the closest center, ||x||^2 being the same for every center
+    labels[:] = np.argmin(centers_norm_sqr[None, :] - 2 * center_dot, axis=1)
+
+
+def assign(x_data, centers, chunk_size=DEFAULT_CHUNK_SIZE, n_jobs=1, keep_center_dot=False):
+    """
+    Label each sample with its closest center.
+    Samples are processed chunk by chunk, so only a chunk is ever converted to float64 (inputs may be float32 or
+    compact integers) and the temporary distances are bounded by chunk_size x k.
+    :param x_data: The input samples, as a 2d array.
+    :param centers: The k centers, of shape (k, d).
+    :param chunk_size: Number of samples assigned together.
+    :param n_jobs: Number of threads assigning chunks concurrently.
+    :param keep_center_dot: If True, also return the (n, k) float64 dot products of the samples with the centers,
+    which the sort based surrogate cut finder needs.
+    :return: int32 labels, and the dot products if keep_center_dot.
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    centers_norm_sqr = np.einsum('ij,ij->i', centers, centers)
+    n = x_data.shape[0]
+    labels = np.empty(n, dtype=np.int32)
+    center_dot = np.empty((n, centers.shape[0]), dtype=np.float64) if keep_center_dot else None
+
+    def assign_chunk(start):
+        end = min(start + chunk_size, n)
+        _assign_chunk(x_data[start:end], centers, centers_norm_sqr, labels[start:end],
+                      None if center_dot is None else center_dot[start:end])
+
+    _map_chunks(assign_chunk, n, chunk_size, n_jobs)
+    if keep_center_dot:
+        return labels, center_dot
+    return labels
+
+
+def center_dots(x_data, centers, chunk_size=DEFAULT_CHUNK_SIZE, n_jobs=1):
+    """
+    The dot products of the samples with the centers, without the labels, e.g. when the labels are already known.
+    Same chunking and threads as assign.
+    :param x_data: The input samples, as a 2d array.
+    :param centers: The k centers, of shape (k, d).
+    :param chunk_size: Number of samples processed together.
+    :param n_jobs: Number of threads processing chunks concurrently.
+    :return: float64 array of shape (n, k).
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    n = x_data.shape[0]
+    center_dot = np.empty((n, centers.shape[0]), dtype=np.float64)
+
+    def dot_chunk(start):
+        end = min(start + chunk_size, n)
+        np.matmul(np.asarray(x_data[start:end]).astype(np.float64, copy=False), centers.T, out=center_dot[start:end])
+
+    _map_chunks(dot_chunk, n, chunk_size, n_jobs)
+    return center_dot
+
+
+def _map_chunks(process_chunk, n, chunk_size, n_jobs):
+    starts = range(0, n, chunk_size)
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(process_chunk, starts))
+    else:
+        for start in starts:
+            process_chunk(start)
+
+
+def closest_distances(x_data, centers, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    :param x_data: The input samples, as a 2d array.
+    :param centers: The k centers, of shape (k, d).
+    :param chunk_size: Number of samples processed together.
+    :return: Squared distance of each sample to its closest center.
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    centers_norm_sqr = np.einsum('ij,ij->i', centers, centers)
+    distances = np.empty(x_data.shape[0], dtype=np.float64)
+    for start in range(0, x_data.shape[0], chunk_size):
+        x_chunk = np.asarray(x_data[start:start + chunk_size]).astype(np.float64, copy=False)
+        center_dist = centers_norm_sqr[None, :] - 2 * (x_chunk @ centers.T)
+        # Rounding may leave the distance of a sample to itself slightly negative
+        distances[start:start + chunk_size] = np.maximum(np.einsum('ij,ij->i', x_chunk, x_chunk)
+                                                         + center_dist.min(axis=1), 0.0)
+    return distances
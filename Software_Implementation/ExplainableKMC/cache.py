@@ -0,0 +1,129 @@
+import hashlib
+import os
+
+import numpy as np
+
+DEFAULT_CACHE_BYTES = 2 ** 30
+
+
+def hash_array(data):
+    """
+    Fast content hash of an array (its dtype, shape and bytes).
+    :param data: The array.
+    :return: Hex digest.
+    """
+    data = np.ascontiguousarray(data)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(data.dtype).encode())
+    h.update(str(data.shape).encode())
+    h.update(memoryview(data).cast('B'))
+    return h.hexdigest()
+
+
+def cache_key(*parts):
+    """
+    Build a cache key out of arrays, strings, numbers, and nested lists / tuples / dicts of those.
+    :param parts: The inputs the cached artifact depends on.
+    :return: Hex digest.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(_key_bytes(part))
+    return h.hexdigest()
+
+
+def _key_bytes(part):
+    if isinstance(part, np.ndarray):
+        return b'a' + hash_array(part).encode()
+    elif isinstance(part, dict):
+        return b'd' + b''.join(_key_bytes(key) + _key_bytes(part[key]) for key in sorted(part))
+    elif isinstance(part, (list, tuple)):
+        return b'l' + b''.join(_key_bytes(item) for item in part) + b';'
+    else:
+        return b's' + repr(part).encode() + b';'
+
+
+class ArtifactCache:
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_BYTES):
+        """
+        Content addressed on-disk cache of arrays (centroids, labels, fitted trees...).
+        Each artifact is stored as an npz file named after its kind and key. Once the total size exceeds max_bytes,
+        the least recently used artifacts are evicted.
+        :param directory: Cache directory. Created if missing.
+        :param max_bytes: Size bound of the cache directory.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, '%s-%s.npz' % (kind, key))
+
+    def load(self, kind, key):
+        """
+        :param kind: Kind of artifact, e.g. "centroids".
+        :param key: Key of the artifact, see cache_key.
+        :return: Dictionary of the stored arrays, or None on a miss.
+        """
+        path = self._path(kind, key)
+        try:
+            with np.load(path) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Mark as recently used
+        os.utime(path)
+        self.hits += 1
+        return arrays
+
+    def store(self, kind, key, arrays):
+        """
+        Store arrays under (kind, key), then evict least recently used artifacts if the cache is too large.
+        :param kind: Kind of artifact.
+        :param key: Key of the artifact.
+        :param arrays: Dictionary of arrays.
+        """
+        path = self._path(kind, key)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+
+    def get_or_compute(self, kind, key, compute):
+        """
+        Return the cached arrays of (kind, key), computing and storing them on a miss.
+        :param kind: Kind of artifact.
+        :param key: Key of the artifact.
+        :param compute: Function returning the dictionary of arrays.
+        :return: Dictionary of arrays.
+        """
+        arrays = self.load(kind, key)
+        if arrays is None:
+            arrays = compute()
+            self.store(kind, key, arrays)
+        return arrays
+
+    def _evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+
+    def stats(self):
+        """
+        :return: Dictionary with hit and miss counts.
+        """
+        return {"hits": self.hits, "misses": self.misses}
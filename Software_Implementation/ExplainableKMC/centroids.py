@@ -0,0 +1,242 @@
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin_min
+
+from .asic_emulator import ASICEmulator
+from .assignment import assign
+from .hw_codec import read_centroids
+from .streaming import DEFAULT_STREAM_CHUNK_SIZE, iter_chunks
+
+
+class CentroidProvider:
+    """
+    Base class of the centroid stage of the pipeline.
+    After fit, cluster_centers_ holds the centroids, fit_time_ the wall time fit took in seconds,
+    inertia_ the sum of squared distances of the samples to their closest centroid and n_iter_ the number of
+    iterations run (0 if the centroids were not iterated on).
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self.cluster_centers_ = None
+        self.fit_time_ = None
+        self.inertia_ = None
+        self.n_iter_ = None
+
+    def fit(self, x_data):
+        """
+        Compute the centroids of x_data.
+        :param x_data: The training input samples (a DataFrame is used through its values).
+        :return: The fitted provider.
+        """
+        if isinstance(x_data, pd.DataFrame):
+            x_data = x_data.values
+        start = time.perf_counter()
+        self._fit(x_data)
+        self.fit_time_ = time.perf_counter() - start
+        return self
+
+    def _fit(self, x_data):
+        raise NotImplementedError()
+
+    def is_fitted(self):
+        return self.cluster_centers_ is not None
+
+    def params(self):
+        """
+        :return: The parameters that determine the fitted centroids (for a given data), e.g. to key a cache.
+        """
+        params = {"provider": self.name}
+        if hasattr(self, "kmeans"):
+            params.update(self.kmeans.get_params())
+        return params
+
+    def restore(self, cluster_centers, inertia, n_iter):
+        """
+        Set the fitted state, e.g. from a cache, instead of calling fit.
+        """
+        self.cluster_centers_ = cluster_centers
+        self.inertia_ = inertia
+        self.n_iter_ = n_iter
+        self.fit_time_ = 0.0
+        return self
+
+    def predict(self, x_data):
+        """
+        Return the index of the closest centroid of each sample.
+        :param x_data: The input samples.
+        :return: The closest centroid of each sample.
+        """
+        if isinstance(x_data, pd.DataFrame):
+            x_data = x_data.values
+        return assign(x_data, self.cluster_centers_)
+
+    def report(self):
+        """
+        :return: Dictionary with the provider name, the number of clusters, fit time, inertia and iterations.
+        """
+        return {"provider": self.name,
+                "k": None if self.cluster_centers_ is None else self.cluster_centers_.shape[0],
+                "fit_time": self.fit_time_,
+                "inertia": self.inertia_,
+                "n_iter": self.n_iter_}
+
+
+class BatchKMeansProvider(CentroidProvider):
+    """
+    Exact (full batch) k-means.
+    """
+
+    name = 'batch'
+
+    def __init__(self, k, max_iter=500, n_init=1, random_state=None):
+        super().__init__()
+        self.kmeans = KMeans(k, max_iter=max_iter, n_init=n_init, random_state=random_state)
+
+    def _fit(self, x_data):
+        self.kmeans.fit(x_data)
+        self.cluster_centers_ = self.kmeans.cluster_centers_
+        self.inertia_ = self.kmeans.inertia_
+        self.n_iter_ = self.kmeans.n_iter_
+
+
+class MiniBatchKMeansProvider(CentroidProvider):
+    """
+    Mini-batch k-means, updated chunk by chunk, so the data does not have to be resident.
+    fit accepts anything predict_stream does: a csv path, an array, or an iterable of arrays.
+    inertia_ is accumulated over the last pass, each chunk being scored right after the model was updated with it.
+    """
+
+    name = 'minibatch'
+
+    def __init__(self, k, batch_size=4096, chunk_size=DEFAULT_STREAM_CHUNK_SIZE, n_passes=1, drop_columns=None,
+                 random_state=None):
+        super().__init__()
+        self.kmeans = MiniBatchKMeans(k, batch_size=batch_size, random_state=random_state, n_init=1)
+        self.chunk_size = chunk_size
+        self.n_passes = n_passes
+        self.drop_columns = drop_columns
+
+    def params(self):
+        params = super().params()
+        params.update({"chunk_size": self.chunk_size, "n_passes": self.n_passes})
+        return params
+
+    def _fit(self, source):
+        n_iter = 0
+        for _ in range(self.n_passes):
+            inertia = 0.0
+            for chunk in iter_chunks(source, self.chunk_size, self.drop_columns):
+                chunk = np.asarray(chunk, dtype=np.float64)
+                for start in range(0, chunk.shape[0], self.kmeans.batch_size):
+                    self.kmeans.partial_fit(chunk[start:start + self.kmeans.batch_size])
+                    n_iter += 1
+                inertia += -self.kmeans.score(chunk)
+        self.cluster_centers_ = self.kmeans.cluster_centers_
+        self.inertia_ = inertia
+        self.n_iter_ = n_iter
+
+
+class WarmStartKMeansProvider(CentroidProvider):
+    """
+    k-means started from previously computed centroids, e.g. the ones computed by the ASIC.
+    A good start usually converges within a handful of iterations.
+    """
+
+    name = 'warm_start'
+
+    def __init__(self, init_centers, max_iter=500, tol=1e-4):
+        super().__init__()
+        init_centers = np.asarray(init_centers, dtype=np.float64)
+        self.kmeans = KMeans(init_centers.shape[0], init=init_centers, n_init=1, max_iter=max_iter, tol=tol)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(load_centroids(path), **kwargs)
+
+    def _fit(self, x_data):
+        self.kmeans.fit(x_data)
+        self.cluster_centers_ = self.kmeans.cluster_centers_
+        self.inertia_ = self.kmeans.inertia_
+        self.n_iter_ = self.kmeans.n_iter_
+
+
+class FixedCentroidProvider(CentroidProvider):
+    """
+    Centroids that are used as given, e.g. the output of the ASIC. fit only measures their inertia.
+    """
+
+    name = 'fixed'
+
+    def __init__(self, centers):
+        super().__init__()
+        self.centers = np.asarray(centers, dtype=np.float64)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_centroids(path))
+
+    @classmethod
+    def from_asic_output(cls, path, k=None):
+        """
+        :param path: Centroids dumped by a testbench as binary strings, see hw_codec.read_centroids.
+        :param k: If given, only the last k centroids of the dump are used.
+        """
+        return cls(read_centroids(path, k))
+
+    def params(self):
+        return {"provider": self.name, "centers": self.centers}
+
+    def _fit(self, x_data):
+        self.cluster_centers_ = self.centers
+        _, distances = pairwise_distances_argmin_min(x_data, self.centers)
+        self.inertia_ = float(np.dot(distances, distances))
+        self.n_iter_ = 0
+
+
+class ASICEmulatorProvider(CentroidProvider):
+    """
+    Centroids the kmeans_1way ASIC would compute, from its software model (see asic_emulator).
+    n_iter_ is the number of centroid updates run, and the estimated cycle count is kept in n_cycles_.
+    """
+
+    name = 'asic_emulator'
+
+    def __init__(self, k=14, **kwargs):
+        super().__init__()
+        self.emulator = ASICEmulator(k, **kwargs)
+        self.n_cycles_ = None
+
+    def params(self):
+        params = {"provider": self.name}
+        params.update({key: value for key, value in vars(self.emulator).items() if not key.endswith("_")})
+        return params
+
+    def _fit(self, x_data):
+        self.emulator.fit(x_data)
+        self.cluster_centers_ = self.emulator.cluster_centers_
+        _, distances = pairwise_distances_argmin_min(x_data, self.cluster_centers_)
+        self.inertia_ = float(np.dot(distances, distances))
+        self.n_iter_ = self.emulator.n_iter_
+        self.n_cycles_ = self.emulator.n_cycles_
+
+
+def load_centroids(path):
+    """
+    Read centroids from a text file holding one bracketed, comma separated centroid per line,
+    like Centroids.txt. Any other line (e.g. the raw hardware output) is ignored.
+    :param path: Path of the centroids file.
+    :return: Array of shape (k, d).
+    """
+    centers = []
+    with open(path) as f:
+        for line in f:
+            match = re.match(r"\s*\[([^\]]*)\]", line)
+            if match is not None:
+                centers.append([float(value) for value in match.group(1).split(",")])
+    return np.array(centers, dtype=np.float64)
@@ -0,0 +1,322 @@
+import ctypes
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+from . import hw_codec
+from .flat_tree import LEAF
+
+BACKENDS = ['python', 'c', 'sv']
+
+# C types of the dtypes the generated C kernels are specialized for (the compact dtypes of Tree, and float64).
+C_TYPES = {np.dtype(np.uint8): 'uint8_t',
+           np.dtype(np.int8): 'int8_t',
+           np.dtype(np.uint16): 'uint16_t',
+           np.dtype(np.int16): 'int16_t',
+           np.dtype(np.int32): 'int32_t',
+           np.dtype(np.float64): 'double'}
+
+C_FLAGS = ['-O3', '-shared', '-fPIC']
+
+
+def _feature_name(feature_names, feature):
+    return str(feature) if feature_names is None else feature_names[feature]
+
+
+def python_source(flat, name='predict_tree', feature_names=None):
+    """
+    Generate a straight-line NumPy function predicting the clusters of the tree, one np.where per internal node.
+    Nodes are evaluated children first, so every line only refers to constants or to lines above it.
+    :param flat: FlatTree of the fitted tree (see Tree.compile).
+    :param name: Name of the generated function.
+    :param feature_names: Optional names of the features, written as comments.
+    :return: Source of a module defining name(x_data).
+    """
+    lines = ["import numpy as np", "", "", "def %s(x_data):" % name]
+    if flat.left[0] == LEAF:
+        lines.append("    return np.full(x_data.shape[0], %d)" % int(flat.value[0]))
+        return "\n".join(lines) + "\n"
+
+    def operand(node):
+        return str(int(flat.value[node])) if flat.left[node] == LEAF else "v%d" % node
+
+    for node in range(flat.n_nodes - 1, -1, -1):
+        if flat.left[node] == LEAF:
+            continue
+        feature = int(flat.feature[node])
+        lines.append("    v%d = np.where(x_data[:, %d] <= %r, %s, %s)  # %s" % (
+            node, feature, float(flat.threshold[node]), operand(flat.left[node]), operand(flat.right[node]),
+            _feature_name(feature_names, feature)))
+    lines.append("    return v0")
+    return "\n".join(lines) + "\n"
+
+
+def compile_python(flat, name='predict_tree', feature_names=None):
+    """
+    :return: The function generated by python_source.
+    """
+    namespace = {}
+    exec(compile(python_source(flat, name, feature_names), '<%s>' % name, 'exec'), namespace)
+    return namespace[name]
+
+
+def _c_threshold(threshold, dtype):
+    # x <= t is x <= floor(t) for integer x, which keeps the comparison in integer arithmetic
+    if dtype.kind in 'iu':
+        return "%dLL" % math.floor(threshold)
+    return repr(float(threshold))
+
+
+def c_source(flat, dtype=np.float64, name='exkmc_predict', feature_names=None):
+    """
+    Generate a C kernel predicting the clusters of the tree, as nested if / else on each sample.
+    The generated function is
+    void name(const T *x, int64_t n, int64_t row_stride, int64_t col_stride, int32_t *out)
+    where feature f of sample i is x[i * row_stride + f * col_stride], so both C and Fortran ordered arrays are
+    read in place.
+    :param flat: FlatTree of the fitted tree (see Tree.compile).
+    :param dtype: dtype of the samples, one of C_TYPES.
+    :param name: Name of the generated function.
+    :param feature_names: Optional names of the features, written as comments.
+    :return: Source of the C file.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in C_TYPES:
+        raise Exception('%s is not a supported dtype' % dtype)
+    lines = ["#include <stdint.h>", "",
+             "void %s(const %s *x, int64_t n, int64_t row_stride, int64_t col_stride, int32_t *out)"
+             % (name, C_TYPES[dtype]),
+             "{",
+             "    for (int64_t i = 0; i < n; i++) {",
+             "        const %s *row = x + i * row_stride;" % C_TYPES[dtype]]
+
+    def emit(node, indent):
+        pad = "    " * indent
+        if flat.left[node] == LEAF:
+            lines.append("%sout[i] = %d;" % (pad, int(flat.value[node])))
+            return
+        feature = int(flat.feature[node])
+        lines.append("%sif (row[%d * col_stride] <= %s) {  /* %s */" % (
+            pad, feature, _c_threshold(flat.threshold[node], dtype), _feature_name(feature_names, feature)))
+        emit(flat.left[node], indent + 1)
+        lines.append("%s} else {" % pad)
+        emit(flat.right[node], indent + 1)
+        lines.append("%s}" % pad)
+
+    emit(0, 2)
+    lines += ["    }", "}"]
+    return "\n".join(lines) + "\n"
+
+
+class CKernel:
+
+    def __init__(self, flat, dtype=np.float64, directory=None, compiler=None, name='exkmc_predict'):
+        """
+        C kernel of a fitted tree (see c_source), compiled into a shared library and called through ctypes.
+        :param flat: FlatTree of the fitted tree (see Tree.compile).
+        :param dtype: dtype of the samples the kernel is specialized for.
+        :param directory: Directory the source and the library are written to. Defaults to a temporary directory.
+        :param compiler: C compiler. Defaults to $CC, or cc.
+        :param name: Name of the generated function.
+        """
+        self.dtype = np.dtype(dtype)
+        self.directory = tempfile.mkdtemp(prefix='exkmc_codegen_') if directory is None else directory
+        compiler = os.environ.get('CC', 'cc') if compiler is None else compiler
+        if shutil.which(compiler) is None:
+            raise Exception('C compiler %s not found' % compiler)
+
+        source_path = os.path.join(self.directory, name + '.c')
+        self.library_path = os.path.join(self.directory, 'lib%s.so' % name)
+        with open(source_path, 'w') as f:
+            f.write(c_source(flat, self.dtype, name))
+        result = subprocess.run([compiler] + C_FLAGS + ['-o', self.library_path, source_path],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception('Compiling %s failed:\n%s' % (source_path, result.stderr))
+
+        self._function = getattr(ctypes.CDLL(self.library_path), name)
+        self._function.restype = None
+        self._function.argtypes = [ctypes.c_void_p, ctypes.c_int64, ctypes.c_int64, ctypes.c_int64,
+                                   ctypes.c_void_p]
+
+    def predict(self, x_data):
+        """
+        Predict clusters for x_data.
+        :param x_data: The input samples, as a 2d array of the dtype of the kernel, in any memory order.
+        :return: The predicted clusters, as int32.
+        """
+        x_data = np.asarray(x_data)
+        if x_data.dtype != self.dtype:
+            raise Exception('The kernel was compiled for %s, got %s' % (self.dtype, x_data.dtype))
+        out = np.empty(x_data.shape[0], dtype=np.int32)
+        row_stride, col_stride = (stride // x_data.itemsize for stride in x_data.strides)
+        self._function(x_data.ctypes.data, x_data.shape[0], row_stride, col_stride, out.ctypes.data)
+        return out
+
+
+def sv_conditions(flat, fields=hw_codec.FEATURE_FIELDS):
+    """
+    Translate the conditions of the tree to the fields of a hardware element. Field values are unsigned, so
+    x <= t becomes field <= floor(t), and is constant when floor(t) is out of the range of the field.
+    :param flat: FlatTree of the fitted tree, fitted on the (unscaled) integer features of the element.
+    :param fields: Layout of the element, as (name, lsb, width), in the order of the features of the tree.
+    :return: (field, integer threshold, constant) of each node, constant being None unless the condition does
+    not depend on the element. Leaves get None.
+    """
+    conditions = []
+    for node in range(flat.n_nodes):
+        if flat.left[node] == LEAF:
+            conditions.append(None)
+            continue
+        feature = int(flat.feature[node])
+        if feature >= len(fields):
+            raise Exception('Feature %d has no field in the element layout' % feature)
+        field = fields[feature]
+        threshold = math.floor(flat.threshold[node])
+        constant = None
+        if threshold < 0:
+            constant = False
+        elif threshold >= (1 << field[2]) - 1:
+            constant = True
+        conditions.append((field, threshold, constant))
+    return conditions
+
+
+def label_bits(flat):
+    """
+    :return: Width of the label output of the generated SystemVerilog module.
+    """
+    return max(1, int(flat.value.max()).bit_length())
+
+
+def sv_source(flat, fields=hw_codec.FEATURE_FIELDS, name='exkmc_tree'):
+    """
+    Generate a combinational SystemVerilog module assigning its cluster to a hardware element, laid out as
+    element_in of kmeans_1way.sv (see hw_codec.ELEMENT_FIELDS).
+    :param flat: FlatTree of the fitted tree, fitted on the (unscaled) integer features of the element.
+    :param fields: Layout of the element, as (name, lsb, width), in the order of the features of the tree.
+    :param name: Name of the generated module.
+    :return: Source of the module.
+    """
+    conditions = sv_conditions(flat, fields)
+    bits = label_bits(flat)
+    lines = ["module %s(" % name,
+             "    input logic [%d:0] element_in," % (hw_codec.ELEMENT_BITS - 1),
+             "    output logic [%d:0] label" % (bits - 1),
+             ");", "",
+             "always_comb begin"]
+
+    def emit(node, indent):
+        pad = "    " * indent
+        if flat.left[node] == LEAF:
+            lines.append("%slabel = %d'd%d;" % (pad, bits, int(flat.value[node])))
+            return
+        (field_name, lsb, width), threshold, constant = conditions[node]
+        if constant is None:
+            condition = "element_in[%d:%d] <= %d'd%d" % (lsb + width - 1, lsb, width, threshold)
+        else:
+            condition = "1'b%d" % constant
+        lines.append("%sif (%s) begin  // %s <= %d" % (pad, condition, field_name, threshold))
+        emit(flat.left[node], indent + 1)
+        lines.append("%send else begin" % pad)
+        emit(flat.right[node], indent + 1)
+        lines.append("%send" % pad)
+
+    emit(0, 1)
+    lines += ["end", "", "endmodule"]
+    return "\n".join(lines) + "\n"
+
+
+def sv_predict(flat, elements, fields=hw_codec.FEATURE_FIELDS):
+    """
+    Model of the module generated by sv_source: evaluates its field comparisons on packed elements.
+    :param flat: FlatTree of the fitted tree.
+    :param elements: uint64 array of packed elements (see hw_codec.pack).
+    :param fields: Layout of the element, as given to sv_source.
+    :return: The label output for each element.
+    """
+    shift = np.zeros(flat.n_nodes, dtype=np.uint64)
+    mask = np.zeros(flat.n_nodes, dtype=np.uint64)
+    # A constant condition compares 0 against 0 (true) or -1 (false)
+    thresholds = np.zeros(flat.n_nodes, dtype=np.int64)
+    for node, condition in enumerate(sv_conditions(flat, fields)):
+        if condition is None:
+            continue
+        (_, lsb, width), threshold, constant = condition
+        if constant is None:
+            shift[node], mask[node], thresholds[node] = lsb, (1 << width) - 1, threshold
+        else:
+            thresholds[node] = 0 if constant else -1
+
+    elements = np.asarray(elements, dtype=np.uint64)
+    curr = np.zeros(elements.shape[0], dtype=np.int32)
+    rows = np.arange(elements.shape[0])
+    while rows.shape[0] > 0 and flat.left[0] != LEAF:
+        nodes = curr[rows]
+        values = ((elements[rows] >> shift[nodes]) & mask[nodes]).astype(np.int64)
+        curr[rows] = np.where(values <= thresholds[nodes], flat.left[nodes], flat.right[nodes])
+        rows = rows[flat.left[curr[rows]] != LEAF]
+    return flat.value[curr]
+
+
+def write_sources(tree, directory, feature_names=None, dtype=np.float64, fields=hw_codec.FEATURE_FIELDS):
+    """
+    Write the Python, C and SystemVerilog code of a fitted tree to directory, as exkmc_tree.py, exkmc_tree.c and
+    exkmc_tree.sv.
+    :param tree: The fitted Tree.
+    :param directory: Output directory.
+    :param feature_names: Optional names of the features, written as comments.
+    :param dtype: dtype of the samples the C kernel is specialized for.
+    :param fields: Layout of the element, for the SystemVerilog module.
+    :return: The paths written.
+    """
+    flat = tree.compile()
+    os.makedirs(directory, exist_ok=True)
+    sources = {"exkmc_tree.py": python_source(flat, feature_names=feature_names),
+               "exkmc_tree.c": c_source(flat, dtype, feature_names=feature_names),
+               "exkmc_tree.sv": sv_source(flat, fields)}
+    paths = []
+    for filename, source in sources.items():
+        paths.append(os.path.join(directory, filename))
+        with open(paths[-1], 'w') as f:
+            f.write(source)
+    return paths
+
+
+def check_equivalence(tree, x_data, backends=None, fields=hw_codec.FEATURE_FIELDS, compiler=None):
+    """
+    Run every backend on x_data and compare its predictions with Tree.predict.
+    The SystemVerilog backend is checked through sv_predict on the packed elements of x_data, which requires the
+    features of x_data to fit their fields.
+    :param tree: The fitted Tree.
+    :param x_data: The input samples, as a 2d array.
+    :param backends: Backends to check, among BACKENDS. Defaults to all of them.
+    :param fields: Layout of the element, for the SystemVerilog backend.
+    :param compiler: C compiler, see CKernel.
+    :return: Dictionary mapping each backend to its number of mismatching samples.
+    """
+    backends = BACKENDS if backends is None else backends
+    flat = tree.compile()
+    x_data = np.asarray(x_data)
+    expected = tree.predict(x_data)
+    mismatches = {}
+    for backend in backends:
+        if backend == 'python':
+            predicted = compile_python(flat)(x_data)
+        elif backend == 'c':
+            dtype = x_data.dtype if x_data.dtype in C_TYPES else np.dtype(np.float64)
+            kernel = CKernel(flat, dtype, compiler=compiler)
+            try:
+                predicted = kernel.predict(x_data.astype(dtype, copy=False))
+            finally:
+                shutil.rmtree(kernel.directory, ignore_errors=True)
+        elif backend == 'sv':
+            predicted = sv_predict(flat, hw_codec.pack(x_data, fields), fields)
+        else:
+            raise Exception(backend + ' is not a supported backend')
+        mismatches[backend] = int(np.count_nonzero(predicted != expected))
+    return mismatches
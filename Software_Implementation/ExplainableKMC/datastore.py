@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+import zipfile
+
+import numpy as np
+
+from .streaming import DEFAULT_STREAM_CHUNK_SIZE, iter_csv_chunks
+
+STORE_VERSION = 1
+
+# Integer dtypes of the store, narrowest first
+STORE_DTYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32, np.int64]
+
+LABEL_COLUMN = 'MH1'
+
+FEATURES_FILE = 'features.npy'
+LABEL_FILE = 'label.npy'
+META_FILE = 'meta.json'
+
+
+def default_store_dir(source):
+    """
+    :param source: Path of a csv file, or of a zip archive holding one.
+    :return: Store directory next to the source, e.g. Data/Mental_Health_Cleaned_524288.store for either
+    Data/Mental_Health_Cleaned_524288.csv or Data/Mental_Health_Cleaned_524288.zip.
+    """
+    return os.path.splitext(source)[0] + '.store'
+
+
+def narrow_dtype(min_val, max_val):
+    """
+    :return: The narrowest integer dtype holding every value in [min_val, max_val].
+    """
+    for dtype in STORE_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= min_val and max_val <= info.max:
+            return np.dtype(dtype)
+    raise Exception('Values in [%d, %d] do not fit in int64' % (min_val, max_val))
+
+
+def _csv_member(archive):
+    members = [name for name in archive.namelist()
+               if name.lower().endswith('.csv') and not name.startswith('__MACOSX/')]
+    if len(members) != 1:
+        raise Exception('Expected a single csv file in the archive, found %d' % len(members))
+    return members[0]
+
+
+def iter_source_chunks(source, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+    """
+    Read a csv file, or the csv file inside a zip archive, in chunks. The archive is decompressed as it is read.
+    :param source: Path of a csv file or of a zip archive holding one.
+    :param chunk_size: Maximal number of rows per chunk.
+    :return: Iterator over DataFrame chunks.
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            with archive.open(_csv_member(archive)) as f:
+                for chunk in iter_csv_chunks(f, chunk_size):
+                    yield chunk
+    else:
+        for chunk in iter_csv_chunks(source, chunk_size):
+            yield chunk
+
+
+class ColumnStore:
+
+    def __init__(self, source, directory=None, label=LABEL_COLUMN, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+        """
+        Binary, column major copy of an integer csv dataset, built once and memory mapped afterwards.
+        The feature columns are stored as one Fortran ordered array of the narrowest integer dtype holding them,
+        so the features are read without parsing nor copying, and each column is contiguous. The label column is
+        stored on its own, so leaving it out does not copy the features.
+        The store is rebuilt whenever the source changes (size or modification time).
+        :param source: Path of the csv file, or of a zip archive holding it.
+        :param directory: Store directory. Defaults to default_store_dir(source).
+        :param label: Name of the label column, or None.
+        :param chunk_size: Rows parsed at a time while building the store.
+        """
+        self.source = source
+        self.directory = default_store_dir(source) if directory is None else directory
+        self.label = label
+        self.chunk_size = chunk_size
+
+    def _source_stat(self):
+        stat = os.stat(self.source)
+        return {"source": os.path.abspath(self.source), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def meta(self):
+        """
+        :return: The metadata of the store (columns, dtype, number of rows, source stat), or None if not built.
+        """
+        try:
+            with open(os.path.join(self.directory, META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_stale(self):
+        """
+        :return: True if the store is missing, or was built from another version of the source.
+        """
+        meta = self.meta()
+        if meta is None or meta.get("version") != STORE_VERSION or meta.get("label") != self.label:
+            return True
+        return any(meta.get(key) != value for key, value in self._source_stat().items())
+
+    def build(self):
+        """
+        Parse the source chunk by chunk and write the store. The store is written aside and moved in place once
+        complete, so a reader never sees a partial store.
+        """
+        stat = self._source_stat()
+        chunks = []
+        labels = []
+        columns = None
+        min_val, max_val = 0, 0
+        for chunk in iter_source_chunks(self.source, self.chunk_size):
+            if columns is None:
+                columns = [column for column in chunk.columns if column != self.label]
+            values = chunk[columns].values
+            if values.dtype.kind not in 'iu':
+                raise Exception('%s holds non integer values' % self.source)
+            if values.size > 0:
+                min_val, max_val = min(min_val, values.min()), max(max_val, values.max())
+            # Narrow each chunk right away, so the parsed data never sits in memory as int64
+            chunks.append(values.astype(narrow_dtype(values.min(), values.max()) if values.size > 0 else np.uint8))
+            if self.label is not None:
+                labels.append(chunk[self.label].values)
+        if columns is None:
+            raise Exception('%s is empty' % self.source)
+
+        n = sum(chunk.shape[0] for chunk in chunks)
+        dtype = narrow_dtype(min_val, max_val)
+        tmp_directory = self.directory + '.tmp'
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+
+        features = np.lib.format.open_memmap(os.path.join(tmp_directory, FEATURES_FILE), mode='w+', dtype=dtype,
+                                             shape=(n, len(columns)), fortran_order=True)
+        start = 0
+        for chunk in chunks:
+            features[start:start + chunk.shape[0]] = chunk
+            start += chunk.shape[0]
+        features.flush()
+        del features
+
+        meta = {"version": STORE_VERSION, "columns": columns, "label": self.label, "n_rows": n,
+                "dtype": np.dtype(dtype).name}
+        if self.label is not None:
+            label = np.concatenate(labels)
+            label = label.astype(narrow_dtype(label.min(), label.max()) if n > 0 else np.uint8)
+            np.save(os.path.join(tmp_directory, LABEL_FILE), label)
+        meta.update(stat)
+        with open(os.path.join(tmp_directory, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(tmp_directory, self.directory)
+
+    def ensure(self):
+        """
+        Build the store if it is stale.
+        :return: The store.
+        """
+        if self.is_stale():
+            self.build()
+        return self
+
+    def features(self, mmap_mode='r'):
+        """
+        :param mmap_mode: Memory map mode (see numpy.load), or None to read the features into memory.
+        :return: The feature block of shape (n, d), in Fortran order, and the names of its columns.
+        """
+        self.ensure()
+        features = np.load(os.path.join(self.directory, FEATURES_FILE), mmap_mode=mmap_mode)
+        return features, self.meta()["columns"]
+
+    def labels(self, mmap_mode='r'):
+        """
+        :param mmap_mode: Memory map mode (see numpy.load), or None to read the labels into memory.
+        :return: The label column.
+        """
+        if self.label is None:
+            raise Exception('The store has no label column')
+        self.ensure()
+        return np.load(os.path.join(self.directory, LABEL_FILE), mmap_mode=mmap_mode)
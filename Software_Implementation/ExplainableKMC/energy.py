@@ -0,0 +1,258 @@
+import glob
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+POWERCAP_DIR = '/sys/class/powercap'
+
+# Columns of Intel Power Gadget logs (e.g. PowerData/PwrData.csv)
+PWR_ELAPSED_COLUMN = 'Elapsed Time (sec)'
+PWR_ENERGY_COLUMN = 'Cumulative Processor Energy_0(Joules)'
+PWR_POWER_COLUMN = 'Processor Power_0(Watt)'
+
+DEFAULT_INTERVAL = 0.1
+
+
+class RaplSampler:
+    """
+    Energy counters of Linux powercap (Intel RAPL): the package domains under /sys/class/powercap, summed.
+    Counters wrap around at max_energy_range_uj, which read accounts for as long as it is called more often than a
+    wrap (minutes at full load).
+    """
+
+    name = 'rapl'
+
+    def __init__(self, powercap_dir=POWERCAP_DIR):
+        self.domains = sorted(glob.glob(os.path.join(powercap_dir, 'intel-rapl:[0-9]*')))
+        self.domains = [domain for domain in self.domains if ':' not in os.path.basename(domain)[len('intel-rapl:'):]]
+        if len(self.domains) == 0:
+            raise Exception('No RAPL domain found under %s' % powercap_dir)
+        self._ranges = [self.__read_uj__(domain, 'max_energy_range_uj') for domain in self.domains]
+        self._last = [self.__read_uj__(domain, 'energy_uj') for domain in self.domains]
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def available(cls, powercap_dir=POWERCAP_DIR):
+        """
+        :return: True if RAPL counters exist and can be read (they are often root only).
+        """
+        try:
+            cls(powercap_dir)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def __read_uj__(domain, name):
+        with open(os.path.join(domain, name)) as f:
+            return int(f.read())
+
+    def read(self):
+        """
+        :return: Energy consumed since the sampler was created, in joules.
+        """
+        with self._lock:
+            for i, domain in enumerate(self.domains):
+                value = self.__read_uj__(domain, 'energy_uj')
+                delta = value - self._last[i]
+                self._total += delta if delta >= 0 else delta + self._ranges[i]
+                self._last[i] = value
+            return self._total * 1e-6
+
+
+class ReplaySampler:
+    """
+    Replays the cumulative processor energy of an Intel Power Gadget log, from its start when the sampler is
+    created. The log is looped if the measured code runs longer than it.
+    """
+
+    name = 'replay'
+
+    def __init__(self, path, clock=time.perf_counter):
+        """
+        :param path: Power Gadget csv, e.g. PowerData/PwrData.csv.
+        :param clock: Clock giving the replay time, in seconds.
+        """
+        frame = read_power_gadget(path)
+        self.elapsed = frame[PWR_ELAPSED_COLUMN].values - frame[PWR_ELAPSED_COLUMN].values[0]
+        self.energy = frame[PWR_ENERGY_COLUMN].values - frame[PWR_ENERGY_COLUMN].values[0]
+        if self.elapsed[-1] <= 0:
+            raise Exception('%s holds less than two samples' % path)
+        self.clock = clock
+        self._origin = clock()
+
+    def read(self):
+        cycles, offset = divmod(self.clock() - self._origin, self.elapsed[-1])
+        return cycles * self.energy[-1] + float(np.interp(offset, self.elapsed, self.energy))
+
+
+class SyntheticSampler:
+    """
+    Stand-in for machines without counters: a constant idle power, plus a power per busy core taken from the CPU
+    time of this process (all of its threads). Stages that compute harder consume more, as on real hardware.
+    """
+
+    name = 'synthetic'
+
+    def __init__(self, idle_watts=5.0, core_watts=15.0):
+        self.idle_watts = idle_watts
+        self.core_watts = core_watts
+        self._origin = (time.perf_counter(), time.process_time())
+
+    def read(self):
+        return (self.idle_watts * (time.perf_counter() - self._origin[0])
+                + self.core_watts * (time.process_time() - self._origin[1]))
+
+
+def default_sampler(replay_path=None):
+    """
+    :param replay_path: Optional Power Gadget csv to replay when there are no RAPL counters.
+    :return: A RaplSampler if the counters can be read, else a ReplaySampler of replay_path if given, else a
+    SyntheticSampler.
+    """
+    if RaplSampler.available():
+        return RaplSampler()
+    if replay_path is not None:
+        return ReplaySampler(replay_path)
+    return SyntheticSampler()
+
+
+def read_power_gadget(path):
+    """
+    Read the samples of an Intel Power Gadget log, without the summary it ends with.
+    :return: DataFrame of the samples, with stripped column names.
+    """
+    with open(path) as f:
+        lines = []
+        for line in f:
+            if line.strip() == '':
+                break
+            lines.append(line)
+    frame = pd.read_csv(io.StringIO(''.join(lines)), skipinitialspace=True)
+    frame.columns = [column.strip() for column in frame.columns]
+    return frame
+
+
+class EnergyMeter:
+
+    def __init__(self, sampler, interval=DEFAULT_INTERVAL):
+        """
+        Measures the energy of pipeline stages. The sampler is read at the boundaries of each stage, which gives its
+        energy, and every interval seconds by a background thread while a stage runs, which gives its power trace.
+        :param sampler: Object whose read() returns the cumulative energy in joules (RaplSampler, ReplaySampler,
+        SyntheticSampler).
+        :param interval: Seconds between background samples.
+        """
+        self.sampler = sampler
+        self.interval = interval
+        self.stages = []
+        # (seconds since the meter was created, cumulative joules)
+        self.samples = []
+        self._origin = time.perf_counter()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = None
+
+    def _sample(self):
+        sample = (time.perf_counter() - self._origin, self.sampler.read())
+        with self._lock:
+            self.samples.append(sample)
+        return sample
+
+    def __loop__(self):
+        with self._lock:
+            while self._running > 0:
+                self._wake.wait(self.interval)
+                if self._running > 0:
+                    self._lock.release()
+                    try:
+                        self._sample()
+                    finally:
+                        self._lock.acquire()
+            self._thread = None
+
+    def stage(self, name):
+        """
+        :param name: Name of the stage, e.g. "kmeans".
+        :return: Context manager measuring the stage.
+        """
+        return _EnergyStage(self, name)
+
+    def _start(self):
+        with self._lock:
+            self._running += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.__loop__, daemon=True)
+                self._thread.start()
+        return self._sample()
+
+    def _stop(self, name, start):
+        end = self._sample()
+        with self._lock:
+            self._running -= 1
+            self._wake.notify_all()
+        duration = end[0] - start[0]
+        joules = end[1] - start[1]
+        self.stages.append({"name": name,
+                            "start": start[0],
+                            "duration": duration,
+                            "joules": joules,
+                            "watts": joules / duration if duration > 0 else 0.0})
+
+    def report(self):
+        """
+        :return: DataFrame with the duration, energy (joules) and average power (watts) of each stage, and a
+        total row.
+        """
+        frame = pd.DataFrame(self.stages, columns=["name", "start", "duration", "joules", "watts"])
+        total = {"name": "total", "start": frame["start"].min() if len(frame) > 0 else 0.0,
+                 "duration": frame["duration"].sum(), "joules": frame["joules"].sum()}
+        total["watts"] = total["joules"] / total["duration"] if total["duration"] > 0 else 0.0
+        return pd.concat([frame, pd.DataFrame([total])], ignore_index=True)
+
+    def summary(self):
+        """
+        :return: Table of the time, energy and average power of each stage name, summed over its runs.
+        """
+        report = self.report()
+        stages = report[report["name"] != "total"].groupby("name", sort=False)[["duration", "joules"]].sum()
+        stages.loc["total"] = stages.sum()
+        lines = ["%-12s %10s %10s %10s" % ("stage", "time (s)", "energy (J)", "power (W)")]
+        for name, row in stages.iterrows():
+            watts = row["joules"] / row["duration"] if row["duration"] > 0 else 0.0
+            lines.append("%-12s %10.3f %10.3f %10.3f" % (name, row["duration"], row["joules"], watts))
+        return "\n".join(lines)
+
+    def power_trace(self):
+        """
+        :return: Times (s) and average power (W) between consecutive samples.
+        """
+        with self._lock:
+            samples = np.array(sorted(self.samples))
+        if samples.shape[0] < 2:
+            return np.zeros(0), np.zeros(0)
+        dt = np.diff(samples[:, 0])
+        valid = dt > 0
+        return samples[1:, 0][valid], np.diff(samples[:, 1])[valid] / dt[valid]
+
+
+class _EnergyStage:
+
+    def __init__(self, meter, name):
+        self.meter = meter
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = self.meter._start()
+        return self
+
+    def __exit__(self, *exc):
+        self.meter._stop(self.name, self.start)
+        return False
@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .assignment import assign
+from .flat_tree import DEFAULT_CHUNK_SIZE, LEAF
+
+
+def _cluster_sums(x_data, clusters, k):
+    sums = np.empty((k, x_data.shape[1]))
+    for col in range(x_data.shape[1]):
+        sums[:, col] = np.bincount(clusters, weights=x_data[:, col], minlength=k)
+    return sums
+
+
+def _evaluate_chunk(flat, centers, x_data, labels):
+    """
+    Statistics of one chunk, as sums that add up over chunks. The costs are derived from them at the end: the
+    per-cluster sums of the samples give both the distances to the cluster means and to the centers.
+    """
+    k = centers.shape[0]
+    leaves = flat.apply(x_data)
+    clusters = flat.value[leaves].astype(np.intp)
+    x_data = x_data.astype(np.float64, copy=False)
+    if labels is None:
+        labels = assign(x_data, centers)
+    labels = np.asarray(labels).astype(np.intp, copy=False)
+
+    return {"norm_sqr": np.einsum('ij,ij->', x_data, x_data),
+            "counts": np.bincount(clusters, minlength=k),
+            "sums": _cluster_sums(x_data, clusters, k),
+            "reference_counts": np.bincount(labels, minlength=k),
+            "reference_sums": _cluster_sums(x_data, labels, k),
+            "leaf_samples": np.bincount(leaves, minlength=flat.n_nodes),
+            "leaf_mistakes": np.bincount(leaves[clusters != labels], minlength=flat.n_nodes),
+            "confusion": np.bincount(labels * k + clusters, minlength=k * k)}
+
+
+def evaluate(flat, centers, x_data, labels=None, chunk_size=DEFAULT_CHUNK_SIZE, n_jobs=1):
+    """
+    Evaluate a threshold tree in one pass over x_data, chunk by chunk. Every statistic is a sum over samples, so
+    each chunk is reduced with bincount and the chunks are added up.
+    :param flat: FlatTree of the fitted tree.
+    :param centers: The k reference centers, of shape (k, d).
+    :param x_data: The input samples, as a 2d array.
+    :param labels: Optional reference cluster of each sample. Defaults to the closest center.
+    :param chunk_size: Number of samples evaluated together. Bounds the size of temporary arrays.
+    :param n_jobs: Number of threads evaluating chunks concurrently.
+    :return: Dictionary with
+    "cost": the k-means cost of the tree clusters, each sample to the mean of its cluster,
+    "surrogate_cost": the cost of the tree clusters, each sample to the center of its cluster,
+    "reference_cost": the cost of the reference clusters, each sample to the center of its reference cluster,
+    "price_of_explainability": cost / reference_cost,
+    "surrogate_price": surrogate_cost / reference_cost,
+    "samples": the number of samples reaching each node, in the order of flat,
+    "mistakes": the number of samples of each leaf whose reference cluster is not the leaf's (-1 for internal
+    nodes),
+    "confusion": the (k, k) matrix counting samples per reference cluster (rows) and tree cluster (columns),
+    "n": the number of samples.
+    """
+    return evaluation_from_sums(flat, centers, evaluation_sums(flat, centers, x_data, labels, chunk_size, n_jobs))
+
+
+def evaluation_sums(flat, centers, x_data, labels=None, chunk_size=DEFAULT_CHUNK_SIZE, n_jobs=1):
+    """
+    The statistics of evaluate before they are reduced. They are sums over samples, so the sums of several parts
+    of the data add up (see add_sums) to the ones of the whole data.
+    Same parameters as evaluate.
+    :return: Dictionary of sums.
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    n = x_data.shape[0]
+
+    def chunk_stats(start):
+        end = min(start + chunk_size, n)
+        # A plain view, so a memmap does not go through the subclass machinery on every index
+        return _evaluate_chunk(flat, centers, np.asarray(x_data[start:end]),
+                               None if labels is None else labels[start:end])
+
+    starts = range(0, n, chunk_size)
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            chunks = list(pool.map(chunk_stats, starts))
+    else:
+        chunks = [chunk_stats(start) for start in starts]
+    if len(chunks) == 0:
+        chunks = [chunk_stats(0)]
+    return add_sums(chunks)
+
+
+def add_sums(parts):
+    """
+    :param parts: Outputs of evaluation_sums over parts of the data.
+    :return: The sums over the whole data.
+    """
+    return {key: sum(part[key] for part in parts) for key in parts[0]}
+
+
+def evaluation_from_sums(flat, centers, totals):
+    """
+    Reduce the output of evaluation_sums into the statistics returned by evaluate.
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    centers_norm_sqr = np.einsum('ij,ij->i', centers, centers)
+
+    # sum ||x - m_c||^2 = sum ||x||^2 - ||S_c||^2 / n_c for the means m_c, and
+    # sum ||x - c||^2 = sum ||x||^2 - 2 c.S_c + n_c ||c||^2 for the centers c, S_c being the sum of cluster c
+    counts, sums = totals["counts"], totals["sums"]
+    filled = counts > 0
+    cost = totals["norm_sqr"] - (np.einsum('ij,ij->i', sums, sums)[filled] / counts[filled]).sum()
+    surrogate_cost = totals["norm_sqr"] - 2 * np.einsum('ij,ij->', centers, sums) + counts @ centers_norm_sqr
+    reference_cost = (totals["norm_sqr"] - 2 * np.einsum('ij,ij->', centers, totals["reference_sums"])
+                      + totals["reference_counts"] @ centers_norm_sqr)
+    # Rounding may leave a cost of 0 slightly negative
+    cost, surrogate_cost, reference_cost = (max(float(value), 0.0) for value in (cost, surrogate_cost,
+                                                                                 reference_cost))
+
+    # Leaves were counted directly, internal nodes add up their children (which come after them)
+    samples = totals["leaf_samples"].astype(np.int64)
+    internal = flat.left != LEAF
+    for node in np.flatnonzero(internal)[::-1]:
+        samples[node] = samples[flat.left[node]] + samples[flat.right[node]]
+    mistakes = totals["leaf_mistakes"].astype(np.int64)
+    mistakes[internal] = -1
+    return {"cost": cost,
+            "surrogate_cost": surrogate_cost,
+            "reference_cost": reference_cost,
+            "price_of_explainability": cost / reference_cost if reference_cost > 0 else np.nan,
+            "surrogate_price": surrogate_cost / reference_cost if reference_cost > 0 else np.nan,
+            "samples": samples,
+            "mistakes": mistakes,
+            "confusion": totals["confusion"].reshape(centers.shape[0], centers.shape[0]),
+            "n": int(totals["counts"].sum())}
@@ -0,0 +1,142 @@
+from collections import deque
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 65536
+
+LEAF = -1
+
+
+class FlatTree:
+
+    def __init__(self, feature, threshold, left, right, value):
+        """
+        Array-backed representation of a fitted threshold tree.
+        Node i is a leaf iff left[i] == right[i] == -1, in which case value[i] holds its cluster.
+        Otherwise, samples with x[feature[i]] <= threshold[i] are routed to left[i], and the rest to right[i].
+        :param feature: Split feature of each node (-1 for leaves).
+        :param threshold: Split threshold of each node (0 for leaves).
+        :param left: Index of the left child of each node (-1 for leaves).
+        :param right: Index of the right child of each node (-1 for leaves).
+        :param value: Cluster of each leaf (0 for internal nodes).
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+
+    @classmethod
+    def from_node(cls, root):
+        """
+        Compile a tree of Node objects into flat parallel arrays.
+        Nodes are numbered in breadth-first order, the same order used by Tree.plot.
+        :param root: Root node of the tree.
+        :return: The compiled tree.
+        """
+        nodes = bfs_nodes(root)
+        n_nodes = len(nodes)
+        feature = np.full(n_nodes, LEAF, dtype=np.int32)
+        threshold = np.zeros(n_nodes, dtype=np.float64)
+        left = np.full(n_nodes, LEAF, dtype=np.int32)
+        right = np.full(n_nodes, LEAF, dtype=np.int32)
+        value = np.zeros(n_nodes, dtype=np.float64)
+
+        next_child = 1
+        for i, node in enumerate(nodes):
+            if node.is_leaf():
+                value[i] = node.value
+            else:
+                feature[i] = node.feature
+                threshold[i] = node.value
+                left[i] = next_child
+                right[i] = next_child + 1
+                next_child += 2
+
+        return cls(feature, threshold, left, right, value)
+
+    def to_node(self, node_class, samples=None, mistakes=None):
+        """
+        Rebuild a tree of node objects out of the flat arrays.
+        :param node_class: Class of the nodes to create (Tree's Node).
+        :param samples: Optional per-node sample counts.
+        :param mistakes: Optional per-node mistake counts.
+        :return: Root of the rebuilt tree.
+        """
+        nodes = [node_class() for _ in range(self.n_nodes)]
+        for i, node in enumerate(nodes):
+            if self.left[i] == LEAF:
+                node.value = int(self.value[i])
+            else:
+                node.set_condition(int(self.feature[i]), float(self.threshold[i]))
+                node.left = nodes[self.left[i]]
+                node.right = nodes[self.right[i]]
+            if samples is not None:
+                node.samples = int(samples[i])
+            if mistakes is not None and mistakes[i] >= 0:
+                node.mistakes = int(mistakes[i])
+        return nodes[0]
+
+    @property
+    def n_nodes(self):
+        return self.feature.shape[0]
+
+    def is_leaf(self):
+        """
+        :return: Boolean array marking the leaves of the tree.
+        """
+        return self.left == LEAF
+
+    def apply(self, x_data, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Return the index of the leaf each sample ends up in.
+        Samples are routed level by level, by row index, so no copy of x_data is ever made.
+        :param x_data: The input samples, as a 2d array.
+        :param chunk_size: Number of samples routed together. Bounds the size of temporary arrays.
+        :return: Leaf index of each sample.
+        """
+        n = x_data.shape[0]
+        leaves = np.zeros(n, dtype=np.int32)
+        if self.left[0] == LEAF:
+            return leaves
+
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            self._apply_chunk(x_data, start, end, leaves)
+        return leaves
+
+    def _apply_chunk(self, x_data, start, end, leaves):
+        rows = np.arange(start, end)
+        curr = np.zeros(end - start, dtype=np.int32)
+        while rows.shape[0] > 0:
+            go_left = x_data[rows, self.feature[curr]] <= self.threshold[curr]
+            curr = np.where(go_left, self.left[curr], self.right[curr])
+            leaves[rows] = curr
+            internal = self.left[curr] != LEAF
+            rows = rows[internal]
+            curr = curr[internal]
+
+    def predict(self, x_data, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Predict clusters for x_data.
+        :param x_data: The input samples, as a 2d array.
+        :param chunk_size: Number of samples routed together.
+        :return: The predicted clusters.
+        """
+        return self.value[self.apply(x_data, chunk_size)]
+
+
+def bfs_nodes(root):
+    """
+    :param root: Root node of a tree.
+    :return: List of the nodes of the tree in breadth-first order.
+    """
+    nodes = []
+    queue = deque([root])
+    while len(queue) > 0:
+        curr = queue.popleft()
+        nodes.append(curr)
+        if not curr.is_leaf():
+            queue.append(curr.left)
+            queue.append(curr.right)
+    return nodes
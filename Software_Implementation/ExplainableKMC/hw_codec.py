@@ -0,0 +1,237 @@
+import numpy as np
+
+# Layout of element_in[38:0] of kmeans_1way.sv, as (name, lsb, width), in the column order of the cleaned csv.
+ELEMENT_FIELDS = [("AGE", 0, 4),
+                  ("EDUC", 4, 3),
+                  ("ETHNIC", 7, 3),
+                  ("RACE", 10, 3),
+                  ("GENDER", 13, 2),
+                  ("SPHSERVICE", 15, 1),
+                  ("CMPSERVICE", 16, 1),
+                  ("OPISERVICE", 17, 1),
+                  ("RTCSERVICE", 18, 1),
+                  ("IJSSERVICE", 19, 1),
+                  ("MH1", 20, 4),
+                  ("MARSTAT", 24, 3),
+                  ("SAP", 27, 2),
+                  ("EMPLOY", 29, 3),
+                  ("DETNLF", 32, 3),
+                  ("VETERAN", 35, 2),
+                  ("LIVARAG", 37, 2)]
+
+ELEMENT_BITS = 39
+
+# Bits [23:20] hold the label (MH1) of training elements, and the cluster index of centroids.
+LABEL_FIELD = "MH1"
+LABEL_LSB = 20
+LABEL_BITS = 4
+
+FEATURE_FIELDS = [field for field in ELEMENT_FIELDS if field[0] != LABEL_FIELD]
+
+# formatted_centroids drops the label bits: {centroid[38:24], centroid[19:0]}.
+FORMATTED_BITS = ELEMENT_BITS - LABEL_BITS
+
+# Bytes per element of binary stimulus files, read MSB first by $fread into a [38:0] register.
+ELEMENT_BYTES = 5
+
+
+def pack(data, fields=ELEMENT_FIELDS):
+    """
+    Pack rows of field values into hardware elements.
+    :param data: Integer array of shape (n, len(fields)), e.g. the cleaned csv (or its features only, with FEATURE_FIELDS).
+    :param fields: Layout of the element, as (name, lsb, width).
+    :return: uint64 array of n packed elements.
+    """
+    data = np.asarray(data)
+    if data.ndim != 2 or data.shape[1] != len(fields):
+        raise Exception("Expected an array of shape (n, %d), got %s" % (len(fields), data.shape))
+
+    packed = np.zeros(data.shape[0], dtype=np.uint64)
+    for col, (name, lsb, width) in enumerate(fields):
+        values = data[:, col]
+        if values.shape[0] > 0 and (values.min() < 0 or values.max() >= 1 << width):
+            raise Exception("Values of %s do not fit in %d bits" % (name, width))
+        packed |= values.astype(np.uint64) << np.uint64(lsb)
+    return packed
+
+
+def unpack(packed, fields=ELEMENT_FIELDS, dtype=np.uint8):
+    """
+    Unpack hardware elements into rows of field values.
+    :param packed: Array of packed elements.
+    :param fields: Layout of the element, as (name, lsb, width).
+    :param dtype: dtype of the result.
+    :return: Array of shape (n, len(fields)).
+    """
+    packed = np.asarray(packed, dtype=np.uint64)
+    data = np.empty((packed.shape[0], len(fields)), dtype=dtype)
+    for col, (_, lsb, width) in enumerate(fields):
+        data[:, col] = (packed >> np.uint64(lsb)) & np.uint64((1 << width) - 1)
+    return data
+
+
+def set_label(packed, labels):
+    """
+    :param packed: Array of packed elements.
+    :param labels: Label of each element (or a single label), e.g. the cluster index of centroids.
+    :return: The elements with their label bits replaced.
+    """
+    mask = np.uint64(((1 << LABEL_BITS) - 1) << LABEL_LSB)
+    labels = np.asarray(labels, dtype=np.uint64) & np.uint64((1 << LABEL_BITS) - 1)
+    return (np.asarray(packed, dtype=np.uint64) & ~mask) | (labels << np.uint64(LABEL_LSB))
+
+
+def format_elements(packed):
+    """
+    Drop the label bits of elements, the way the ASIC outputs its centroids.
+    :param packed: Array of packed elements.
+    :return: Array of FORMATTED_BITS wide words.
+    """
+    packed = np.asarray(packed, dtype=np.uint64)
+    high = packed >> np.uint64(LABEL_LSB + LABEL_BITS)
+    low = packed & np.uint64((1 << LABEL_LSB) - 1)
+    return (high << np.uint64(LABEL_LSB)) | low
+
+
+def unformat_elements(formatted):
+    """
+    Inverse of format_elements. The label bits are set to 0.
+    :param formatted: Array of FORMATTED_BITS wide words.
+    :return: Array of packed elements.
+    """
+    formatted = np.asarray(formatted, dtype=np.uint64)
+    high = formatted >> np.uint64(LABEL_LSB)
+    low = formatted & np.uint64((1 << LABEL_LSB) - 1)
+    return (high << np.uint64(LABEL_LSB + LABEL_BITS)) | low
+
+
+def to_bits(packed, width=ELEMENT_BITS):
+    """
+    :param packed: Array of n words.
+    :param width: Number of bits of each word.
+    :return: uint8 array of shape (n, width) holding the bits of each word, MSB first.
+    """
+    packed = np.ascontiguousarray(packed, dtype='>u8')
+    bits = np.unpackbits(packed.view(np.uint8).reshape(-1, 8), axis=1)
+    return bits[:, 64 - width:]
+
+
+def from_bits(bits):
+    """
+    Inverse of to_bits.
+    :param bits: uint8 array of shape (n, width) of 0/1, MSB first.
+    :return: uint64 array of n words.
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    padded = np.zeros((bits.shape[0], 64), dtype=np.uint8)
+    padded[:, 64 - bits.shape[1]:] = bits
+    return np.packbits(padded, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def write_elements(path, packed, width=ELEMENT_BITS):
+    """
+    Write words as binary strings, one per line, as read by the testbenches with $fscanf(file, "%b\\n", element).
+    :param path: Path of the stimulus file, e.g. element_data_small.txt.
+    :param packed: Array of words.
+    :param width: Number of bits written per word.
+    """
+    bits = to_bits(packed, width)
+    text = np.empty((bits.shape[0], width + 1), dtype=np.uint8)
+    text[:, :width] = bits + ord('0')
+    text[:, width] = ord('\n')
+    with open(path, 'wb') as f:
+        f.write(text.tobytes())
+
+
+def read_elements(path, width=ELEMENT_BITS):
+    """
+    Read a file of binary strings, one per line, e.g. element_data_small.txt or a testbench dump.
+    :param path: Path of the file.
+    :param width: Number of bits per line.
+    :return: uint64 array of the words.
+    """
+    with open(path, 'rb') as f:
+        text = f.read().replace(b'\r', b'').strip()
+    if len(text) == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    text = np.frombuffer(text + b'\n', dtype=np.uint8)
+    if text.shape[0] % (width + 1) != 0:
+        raise Exception("%s does not hold lines of %d bits" % (path, width))
+    text = text.reshape(-1, width + 1)
+    bits = text[:, :width] - ord('0')
+    if np.any(text[:, width] != ord('\n')) or np.any(bits > 1):
+        raise Exception("%s does not hold lines of %d bits" % (path, width))
+    return from_bits(bits)
+
+
+def write_elements_binary(path, packed, n_bytes=ELEMENT_BYTES):
+    """
+    Write words as raw big endian bytes, n_bytes per word, as read by $fread into a memory of [38:0] registers.
+    :param path: Path of the stimulus file.
+    :param packed: Array of words.
+    :param n_bytes: Bytes per word.
+    """
+    data = np.ascontiguousarray(packed, dtype='>u8').view(np.uint8).reshape(-1, 8)
+    with open(path, 'wb') as f:
+        f.write(np.ascontiguousarray(data[:, 8 - n_bytes:]).tobytes())
+
+
+def read_elements_binary(path, n_bytes=ELEMENT_BYTES):
+    """
+    Inverse of write_elements_binary.
+    :param path: Path of the stimulus file.
+    :param n_bytes: Bytes per word.
+    :return: uint64 array of the words.
+    """
+    data = np.fromfile(path, dtype=np.uint8)
+    if data.shape[0] % n_bytes != 0:
+        raise Exception("Size of %s is not a multiple of %d bytes" % (path, n_bytes))
+    padded = np.zeros((data.shape[0] // n_bytes, 8), dtype=np.uint8)
+    padded[:, 8 - n_bytes:] = data.reshape(-1, n_bytes)
+    return padded.view('>u8').ravel().astype(np.uint64)
+
+
+def decode_centroids(formatted):
+    """
+    Decode centroids output by the ASIC (formatted_centroids words) into the clusters array Tree.fit accepts.
+    :param formatted: Array of FORMATTED_BITS wide words, e.g. read from the waveform as hex.
+    :return: Array of shape (k, len(FEATURE_FIELDS)).
+    """
+    formatted = np.asarray(formatted, dtype=np.uint64)
+    if formatted.shape[0] > 0 and formatted.max() >= np.uint64(1 << FORMATTED_BITS):
+        raise Exception("Centroids are %d bits wide" % FORMATTED_BITS)
+    return unpack(unformat_elements(formatted), FEATURE_FIELDS, dtype=np.float64)
+
+
+def encode_centroids(centers):
+    """
+    Inverse of decode_centroids. Centers are truncated to integers, as in the ASIC.
+    :param centers: Array of shape (k, len(FEATURE_FIELDS)).
+    :return: Array of formatted_centroids words.
+    """
+    return format_elements(pack(np.asarray(centers).astype(np.int64), FEATURE_FIELDS))
+
+
+def read_centroids(path, k=None):
+    """
+    Read centroids dumped by a testbench as binary strings: either one FORMATTED_BITS word per line,
+    or the k words of formatted_centroids concatenated on one line (centroid 0 first).
+    Any other line is ignored.
+    :param path: Path of the dump.
+    :param k: If given, only the last k centroids of the file (the final ones) are returned.
+    :return: Array of shape (k, len(FEATURE_FIELDS)).
+    """
+    words = []
+    with open(path) as f:
+        for line in f:
+            line = "".join(line.split())
+            if len(line) == 0 or len(line) % FORMATTED_BITS != 0 or line.strip("01") != "":
+                continue
+            for start in range(0, len(line), FORMATTED_BITS):
+                words.append(int(line[start:start + FORMATTED_BITS], 2))
+    if len(words) == 0:
+        raise Exception("No centroids found in %s" % path)
+    if k is not None:
+        words = words[-k:]
+    return decode_centroids(np.array(words, dtype=np.uint64))
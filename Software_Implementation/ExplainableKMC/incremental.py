@@ -0,0 +1,210 @@
+import numpy as np
+
+from .evaluation import evaluation_from_sums
+from .flat_tree import LEAF
+from .splitters import get_min_mistakes_cut_from_hist
+from .splitters import mistakes_histograms
+from .splitters import surrogate_histograms
+
+# Change of the mistake rate of a split, since it was last optimized, above which partial_fit optimizes it again
+DEFAULT_DRIFT_TOLERANCE = 0.01
+
+
+def _cluster_sums(x_data, clusters, n_clusters):
+    sums = np.zeros((n_clusters, x_data.shape[1]), dtype=np.int64)
+    for col in range(x_data.shape[1]):
+        sums[:, col] = np.bincount(clusters, weights=x_data[:, col], minlength=n_clusters).astype(np.int64)
+    return sums
+
+
+class IncrementalStats:
+
+    def __init__(self, flat, centers, n_bins, n_jobs=1):
+        """
+        Sufficient statistics of the data a fitted tree was trained on, that new batches add up to.
+        Every node keeps its number of samples, their sum and their number per reference cluster. The parents of two
+        leaves ("bottom splits") also keep the histograms of the cut finders (see hist_cut_finder.pyx), over all the
+        samples they were given: any cut of their samples can be evaluated from them, and the split replaced without
+        the data. Everything is integer counts and sums, so the data must be integer valued in [0, MAX_HIST_BINS).
+        Memory: the histograms of a bottom split hold (d * d + d * k + d) * n_bins int64, the surrogate sums (which
+        give the sums of the leaves of a new cut) dominating as d grows, e.g. 62 KB for 16 features, 14 centers and
+        16 bins. A tree has at most max_leaves / 2 bottom splits. Each batch runs both histogram kernels over the
+        samples reaching each bottom split.
+        :param flat: FlatTree of the fitted tree.
+        :param centers: The k centers.
+        :param n_bins: Number of histogram bins (max value + 1).
+        :param n_jobs: Number of threads of the histogram kernels.
+        """
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.centers_norm_sqr = np.einsum('ij,ij->i', self.centers, self.centers)
+        self.n_bins = n_bins
+        self.n_jobs = n_jobs
+        k, d = self.centers.shape
+        self.samples = np.zeros(flat.n_nodes, dtype=np.int64)
+        self.sums = np.zeros((flat.n_nodes, d), dtype=np.int64)
+        self.label_counts = np.zeros((flat.n_nodes, k), dtype=np.int64)
+        self.parent = np.full(flat.n_nodes, LEAF, dtype=np.int32)
+        internal = np.flatnonzero(flat.left != LEAF)
+        self.parent[flat.left[internal]] = internal
+        self.parent[flat.right[internal]] = internal
+        bottom = internal[(flat.left[flat.left[internal]] == LEAF) & (flat.left[flat.right[internal]] == LEAF)]
+        # bottom split -> [surrogate sums, surrogate counts, samples per value and reference cluster]
+        self.histograms = {int(node): [np.zeros((d, n_bins, d), dtype=np.int64),
+                                       np.zeros((d, n_bins), dtype=np.int64),
+                                       np.zeros((d, n_bins, k), dtype=np.int64)] for node in bottom}
+        # Mistake rate of each bottom split when it was last optimized
+        self.reference_rate = {}
+        # Sums over all samples, that do not depend on the tree
+        self.norm_sqr = 0.0
+        self.reference_counts = np.zeros(k, dtype=np.int64)
+        self.reference_sums = np.zeros((k, d), dtype=np.int64)
+
+    @classmethod
+    def from_data(cls, flat, centers, x_data, labels, n_bins, n_jobs=1):
+        """
+        :return: The statistics of the data a tree was fitted on, every split taken as optimized.
+        """
+        stats = cls(flat, centers, n_bins, n_jobs)
+        stats.add(flat, x_data, labels)
+        for node in stats.histograms:
+            stats.reference_rate[node] = stats.mistake_rate(flat, node)
+        return stats
+
+    def add(self, flat, x_data, labels):
+        """
+        Add a batch of samples. Only the batch is routed and counted.
+        :param flat: FlatTree of the tree.
+        :param x_data: The samples, integer valued in [0, MAX_HIST_BINS).
+        :param labels: Their reference cluster.
+        :return: The bottom splits the batch reached.
+        """
+        k = self.centers.shape[0]
+        labels = labels.astype(np.intp, copy=False)
+        n_bins = int(x_data.max()) + 1 if x_data.size > 0 else 0
+        if n_bins > self.n_bins:
+            self.__grow_bins__(n_bins)
+
+        leaves = flat.apply(x_data)
+        x_float = x_data.astype(np.float64)
+        self.norm_sqr += np.einsum('ij,ij->', x_float, x_float)
+        self.reference_counts += np.bincount(labels, minlength=k)
+        self.reference_sums += _cluster_sums(x_float, labels, k)
+        self.samples += np.bincount(leaves, minlength=flat.n_nodes)
+        self.sums += _cluster_sums(x_float, leaves, flat.n_nodes)
+        self.label_counts += np.bincount(leaves * k + labels, minlength=flat.n_nodes * k).reshape(flat.n_nodes, k)
+        # Internal nodes add up their children, which come after them
+        for node in np.flatnonzero(flat.left != LEAF)[::-1]:
+            for stats in (self.samples, self.sums, self.label_counts):
+                stats[node] = stats[flat.left[node]] + stats[flat.right[node]]
+
+        reached = []
+        parents = self.parent[leaves]
+        valid_cols = np.ones(x_data.shape[1], dtype=np.int32)
+        for node, histograms in self.histograms.items():
+            rows = np.flatnonzero(parents == node)
+            if rows.shape[0] == 0:
+                continue
+            sums, counts = surrogate_histograms(x_data[rows], self.n_bins, self.n_jobs)
+            histograms[0] += sums
+            histograms[1] += counts
+            histograms[2] += mistakes_histograms(x_data[rows], labels[rows].astype(np.int32), k, valid_cols,
+                                                 self.n_bins, self.n_jobs)
+            reached.append(node)
+        return reached
+
+    def __grow_bins__(self, n_bins):
+        pad = n_bins - self.n_bins
+        for histograms in self.histograms.values():
+            histograms[0] = np.pad(histograms[0], ((0, 0), (0, pad), (0, 0)))
+            histograms[1] = np.pad(histograms[1], ((0, 0), (0, pad)))
+            histograms[2] = np.pad(histograms[2], ((0, 0), (0, pad), (0, 0)))
+        self.n_bins = n_bins
+
+    def mistake_rate(self, flat, node):
+        """
+        :return: Fraction of the samples of a bottom split whose reference cluster is not the one of their leaf.
+        """
+        if self.samples[node] == 0:
+            return 0.0
+        correct = sum(self.label_counts[child, int(flat.value[child])] for child in (flat.left[node], flat.right[node]))
+        return 1.0 - correct / self.samples[node]
+
+    def drifted(self, flat, nodes, tolerance):
+        """
+        :return: The bottom splits of nodes whose mistake rate moved by more than tolerance.
+        """
+        return [node for node in nodes
+                if abs(self.mistake_rate(flat, node) - self.reference_rate.get(node, 0.0)) > tolerance]
+
+    def __side_stats__(self, node, col, threshold):
+        sums, counts, label_counts = self.histograms[node]
+        left_bins = max(min(int(np.floor(threshold)) + 1, self.n_bins), 0)
+        left = (counts[col, :left_bins].sum(), sums[col, :left_bins].sum(axis=0),
+                label_counts[col, :left_bins].sum(axis=0))
+        total = (counts[col].sum(), sums[col].sum(axis=0), label_counts[col].sum(axis=0))
+        return left, tuple(whole - part for whole, part in zip(total, left))
+
+    def __mistakes__(self, label_counts, col, threshold, centers):
+        # Samples of the left center right of the cut, plus samples of the right center left of it
+        left_bins = max(min(int(np.floor(threshold)) + 1, self.n_bins), 0)
+        return label_counts[col, left_bins:, centers[0]].sum() + label_counts[col, :left_bins, centers[1]].sum()
+
+    def reoptimize(self, flat, node):
+        """
+        Search the cut of a bottom split again over all its samples, keeping the centers of its two leaves: only the
+        column and threshold change, so every center keeps its leaves (one each in the IMM tree). The cut is the one
+        the IMM build would pick between the two centers, with the fewest samples of either center on the other
+        side, and replaces the split if it makes fewer such mistakes. Splits between leaves of the same center are
+        kept, their cut does not change any prediction. The flat arrays are updated in place.
+        :return: True if the split changed.
+        """
+        label_counts = self.histograms[node][2]
+        left, right = flat.left[node], flat.right[node]
+        centers = (int(flat.value[left]), int(flat.value[right]))
+        changed = False
+        if centers[0] != centers[1]:
+            k, d = self.centers.shape
+            valid_centers = np.zeros(k, dtype=np.int32)
+            valid_centers[list(centers)] = 1
+            # Samples of the other clusters are mistakes whatever the cut, leave them out
+            hist = label_counts * valid_centers.astype(np.int64)
+            cut = get_min_mistakes_cut_from_hist(hist, self.centers, valid_centers, np.ones(d, dtype=np.int32),
+                                                 self.n_jobs)
+            current = (int(flat.feature[node]), float(flat.threshold[node]))
+            if cut is not None and (cut["col"], float(cut["threshold"])) != current and \
+                    cut["mistakes"] < self.__mistakes__(label_counts, current[0], current[1], centers):
+                col, threshold = cut["col"], float(cut["threshold"])
+                # As in the IMM build, each center goes to the side of the cut it lies on
+                if self.centers[centers[0], col] > threshold:
+                    centers = centers[::-1]
+                flat.feature[node], flat.threshold[node] = col, threshold
+                flat.value[left], flat.value[right] = centers
+                for child, (n, s, counts) in zip((left, right), self.__side_stats__(node, col, threshold)):
+                    self.samples[child], self.sums[child], self.label_counts[child] = n, s, counts
+                changed = True
+        self.reference_rate[node] = self.mistake_rate(flat, node)
+        return changed
+
+    def evaluation(self, flat):
+        """
+        :return: The evaluation (see evaluation.evaluate) of the tree over all the samples added.
+        """
+        k = self.centers.shape[0]
+        leaves = np.flatnonzero(flat.left == LEAF)
+        values = flat.value[leaves].astype(np.intp)
+        leaf_samples = np.zeros(flat.n_nodes, dtype=np.int64)
+        leaf_samples[leaves] = self.samples[leaves]
+        leaf_mistakes = np.zeros(flat.n_nodes, dtype=np.int64)
+        leaf_mistakes[leaves] = self.samples[leaves] - self.label_counts[leaves, values]
+        confusion = np.zeros((k, k), dtype=np.int64)
+        np.add.at(confusion.T, values, self.label_counts[leaves])
+        totals = {"norm_sqr": self.norm_sqr,
+                  "counts": np.bincount(values, weights=self.samples[leaves], minlength=k).astype(np.int64),
+                  "sums": _cluster_sums(self.sums[leaves], values, k).astype(np.float64),
+                  "reference_counts": self.reference_counts,
+                  "reference_sums": self.reference_sums.astype(np.float64),
+                  "leaf_samples": leaf_samples,
+                  "leaf_mistakes": leaf_mistakes,
+                  "confusion": confusion.ravel()}
+        return evaluation_from_sums(flat, self.centers, totals)
+
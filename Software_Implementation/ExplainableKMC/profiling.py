@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+
+class Profiler:
+
+    def __init__(self, track_memory=True):
+        """
+        Opt-in instrumentation of Tree fitting (see the profiler argument of Tree).
+        Records, for each fit stage, its wall time and the memory it allocated, and for each tree node, its sample
+        count, the time spent in the cut search (and the argsort part of it, for the sort based kernels), the time
+        spent masking and copying data for the children, and the chosen column and threshold.
+        :param track_memory: Trace allocations with tracemalloc during stages. It slows allocations down a little.
+        """
+        self.track_memory = track_memory
+        self.stages = []
+        self.nodes = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _now(self):
+        return time.perf_counter() - self._origin
+
+    def stage(self, name):
+        """
+        :param name: Name of the stage, e.g. "build".
+        :return: Context manager recording the stage.
+        """
+        return _Stage(self, name)
+
+    def node(self, phase, samples):
+        """
+        Start recording a node. The record is stored once finish is called on it.
+        :param phase: "build" (IMM node), "expand" (candidate split of a leaf) or "split" (applied leaf split).
+        :param samples: Number of samples reaching the node.
+        :return: The node record.
+        """
+        return _NodeRecord(self, phase, samples)
+
+    def _add(self, records, record):
+        with self._lock:
+            records.append(record)
+
+    def trace_events(self):
+        """
+        :return: The stages and nodes as Chrome trace events (complete "X" events, timestamps in microseconds).
+        """
+        pid = os.getpid()
+        threads = {}
+        events = []
+        for record in self.stages:
+            events.append({"name": record["name"], "cat": "stage", "ph": "X", "pid": pid,
+                           "tid": threads.setdefault(record["thread"], len(threads)),
+                           "ts": record["start"] * 1e6, "dur": record["duration"] * 1e6,
+                           "args": {key: record[key] for key in ("allocated", "peak")}})
+        for record in self.nodes:
+            args = {key: value for key, value in record.items() if key not in ("phase", "start", "duration", "thread")}
+            events.append({"name": record["phase"], "cat": "node", "ph": "X", "pid": pid,
+                           "tid": threads.setdefault(record["thread"], len(threads)),
+                           "ts": record["start"] * 1e6, "dur": record["duration"] * 1e6, "args": args})
+        for thread, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": "thread %d" % tid}})
+        return events
+
+    def export_chrome_trace(self, path):
+        """
+        Write the records as a Chrome trace (open with chrome://tracing or https://ui.perfetto.dev).
+        :param path: Path of the JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+
+    def summary(self, top=10):
+        """
+        :param top: Number of slowest nodes listed.
+        :return: Text tables of the stages, of the nodes aggregated per phase, and of the slowest nodes.
+        """
+        lines = ["%-10s %12s %16s %14s" % ("stage", "time (s)", "allocated (MB)", "peak (MB)")]
+        for record in self.stages:
+            lines.append("%-10s %12.6f %16s %14s" % (record["name"], record["duration"],
+                                                     _megabytes(record["allocated"]), _megabytes(record["peak"])))
+
+        lines.append("")
+        lines.append("%-8s %7s %12s %12s %12s %12s %12s" % ("phase", "nodes", "samples", "time (s)", "cut (s)",
+                                                            "argsort (s)", "mask (s)"))
+        for phase in ("build", "expand", "split"):
+            records = [record for record in self.nodes if record["phase"] == phase]
+            if len(records) > 0:
+                lines.append("%-8s %7d %12d %12.6f %12.6f %12.6f %12.6f" % (
+                    phase, len(records), sum(record["samples"] for record in records),
+                    sum(record["duration"] for record in records), sum(record["cut_search"] for record in records),
+                    sum(record["argsort"] for record in records), sum(record["mask_copy"] for record in records)))
+
+        lines.append("")
+        lines.append("%-8s %10s %6s %10s %12s %12s %12s" % ("phase", "samples", "col", "threshold", "time (s)",
+                                                            "cut (s)", "argsort (s)"))
+        for record in sorted(self.nodes, key=lambda record: -record["duration"])[:top]:
+            lines.append("%-8s %10d %6s %10s %12.6f %12.6f %12.6f" % (
+                record["phase"], record["samples"], "-" if record["col"] is None else record["col"],
+                "-" if record["threshold"] is None else "%.3f" % record["threshold"],
+                record["duration"], record["cut_search"], record["argsort"]))
+        return "\n".join(lines)
+
+
+def _megabytes(size):
+    return "-" if size is None else "%.3f" % (size / 2 ** 20)
+
+
+class _Stage:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started_tracing = False
+        if self.profiler.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+            self.memory_before = tracemalloc.get_traced_memory()[0]
+        self.start = self.profiler._now()
+        return self
+
+    def __exit__(self, *exc):
+        duration = self.profiler._now() - self.start
+        allocated = peak = None
+        if self.profiler.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            allocated = current - self.memory_before
+            peak = peak - self.memory_before
+            if self.started_tracing:
+                tracemalloc.stop()
+        self.profiler._add(self.profiler.stages, {"name": self.name, "start": self.start, "duration": duration,
+                                                  "allocated": allocated, "peak": peak,
+                                                  "thread": threading.get_ident()})
+        return False
+
+
+class _NodeRecord:
+
+    def __init__(self, profiler, phase, samples):
+        self.profiler = profiler
+        self.record = {"phase": phase, "samples": int(samples), "col": None, "threshold": None,
+                       "cut_search": 0.0, "argsort": 0.0, "mask_copy": 0.0}
+        # Filled by the sort based cut finders: seconds spent sorting, and scanning, summed over columns
+        self.timings = np.zeros(2)
+        self.start = profiler._now()
+
+    def section(self, name):
+        """
+        :param name: "cut_search" or "mask_copy".
+        :return: Context manager adding its wall time to the section.
+        """
+        return _Section(self, name)
+
+    def finish(self, col=None, threshold=None):
+        self.record["col"] = None if col is None else int(col)
+        self.record["threshold"] = None if threshold is None else float(threshold)
+        self.record["argsort"] = float(self.timings[0])
+        self.record["start"] = self.start
+        self.record["duration"] = self.profiler._now() - self.start
+        self.record["thread"] = threading.get_ident()
+        self.profiler._add(self.profiler.nodes, self.record)
+
+
+class _Section:
+
+    def __init__(self, node, name):
+        self.node = node
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.node.record[self.name] += time.perf_counter() - self.start
+        return False
+
+
+class _NullContext:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullNodeRecord:
+    # Stands in for a node record when profiling is off, so the hot path only pays for a couple of no-op calls.
+    timings = None
+
+    def section(self, name):
+        return NULL_CONTEXT
+
+    def finish(self, col=None, threshold=None):
+        pass
+
+
+NULL_CONTEXT = _NullContext()
+NULL_NODE_RECORD = _NullNodeRecord()
@@ -0,0 +1,153 @@
+import json
+import queue
+import threading
+
+from .flat_tree import LEAF
+
+try:
+    from graphviz import Source
+    graphviz_available = True
+except Exception:
+    graphviz_available = False
+
+
+def tree_nodes(flat, samples=None, mistakes=None, feature_names=None):
+    """
+    Describe every node of a tree, in the breadth-first order of flat.
+    :param flat: FlatTree of the tree.
+    :param samples: Optional number of samples of each node.
+    :param mistakes: Optional number of mistakes of each node (negative or None for internal nodes).
+    :param feature_names: Optional names of the features.
+    :return: List of dictionaries, one per node, that json can dump.
+    """
+    nodes = []
+    for i in range(flat.n_nodes):
+        node = {"id": i}
+        if flat.left[i] == LEAF:
+            node["value"] = int(flat.value[i])
+            if mistakes is not None and mistakes[i] is not None and mistakes[i] >= 0:
+                node["mistakes"] = int(mistakes[i])
+        else:
+            feature = int(flat.feature[i])
+            node.update({"feature": feature,
+                         "feature_name": str(feature if feature_names is None else feature_names[feature]),
+                         "threshold": float(flat.threshold[i]),
+                         "left": int(flat.left[i]),
+                         "right": int(flat.right[i])})
+        if samples is not None and samples[i] is not None:
+            node["samples"] = int(samples[i])
+        nodes.append(node)
+    return nodes
+
+
+def _dot_label(node):
+    if "value" in node:
+        lines = [str(node["value"])]
+    else:
+        lines = ["%s <= %.3f" % (node["feature_name"], node["threshold"])]
+    lines += ["%s=%d" % (key, node[key]) for key in ("samples", "mistakes") if key in node]
+    return "\\n".join(line.replace("\\", "\\\\").replace("\"", "\\\"") for line in lines)
+
+
+def dot_source(nodes):
+    """
+    :param nodes: Output of tree_nodes.
+    :return: Graphviz DOT source of the tree.
+    """
+    dot = ["digraph ClusteringTree {\n"]
+    dot += ["n_%d [label=\"%s\"];\n" % (node["id"], _dot_label(node)) for node in nodes]
+    for node in nodes:
+        if "left" in node:
+            dot.append("n_%d -> n_%d;\n" % (node["id"], node["left"]))
+            dot.append("n_%d -> n_%d;\n" % (node["id"], node["right"]))
+    dot.append("}")
+    return "".join(dot)
+
+
+def write_exports(nodes, filename):
+    """
+    Write the DOT source of a tree to filename.gv and its nodes to filename.json. Nothing is rendered.
+    :param nodes: Output of tree_nodes.
+    :param filename: Output file name, without extension.
+    :return: The paths written.
+    """
+    with open(filename + ".gv", "w") as f:
+        f.write(dot_source(nodes))
+    with open(filename + ".json", "w") as f:
+        json.dump({"nodes": nodes}, f, indent=1)
+    return [filename + ".gv", filename + ".json"]
+
+
+def render(dot, filename, format="png", view=False):
+    """
+    Render DOT source with graphviz into filename.gv.<format>, in the calling thread.
+    :param view: If True, open the rendered image in the desktop viewer.
+    :return: Path of the rendered file.
+    """
+    if not graphviz_available:
+        raise Exception("Required package is missing. Please install graphviz")
+    source = Source(dot, filename=filename + '.gv', format=format)
+    return source.view() if view else source.render()
+
+
+class TreeRenderer:
+
+    def __init__(self, format="png", n_workers=1):
+        """
+        Renders trees with graphviz on background threads, so the caller only pays for building the DOT source.
+        Trees are queued with submit and rendered in order; a viewer is never opened. Rendering errors (e.g. no
+        dot executable) are collected in errors instead of being raised, the .gv source being written regardless.
+        :param format: Output format of graphviz (png, svg, pdf...).
+        :param n_workers: Number of rendering threads. Each render runs the dot executable, which does not hold the
+        interpreter.
+        """
+        if not graphviz_available:
+            raise Exception("Required package is missing. Please install graphviz")
+        self.format = format
+        self.rendered = []
+        self.errors = []
+        self._queue = queue.Queue()
+        self._workers = [threading.Thread(target=self.__work__, daemon=True) for _ in range(n_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, dot, filename):
+        """
+        Queue DOT source for rendering into filename.gv.<format>, and return immediately.
+        """
+        self._queue.put((dot, filename))
+
+    def __work__(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                dot, filename = task
+                self.rendered.append(render(dot, filename, self.format))
+            except Exception as e:
+                self.errors.append((task[1], e))
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """
+        Wait until every submitted tree is rendered.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Render the remaining trees and stop the threads.
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
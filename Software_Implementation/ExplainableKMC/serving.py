@@ -0,0 +1,250 @@
+import asyncio
+import collections
+import json
+import time
+
+import numpy as np
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH_SIZE = 256
+# Seconds the first request of a batch may wait for others
+DEFAULT_MAX_WAIT = 0.002
+# Requests waiting for a batch, beyond which connections stop being read until the batches catch up
+DEFAULT_MAX_QUEUE = 4096
+# Number of most recent request latencies the percentiles are computed over
+LATENCY_WINDOW = 100000
+
+# Protocol: newline delimited JSON over TCP or a Unix socket. A request is {"id": <any>, "x": [<features>]}, its
+# response {"id": <id>, "cluster": c, "leaf": l, "samples": s, "mistakes": m}, with the training samples and
+# mistakes of the leaf. {"stats": true} returns the counters of the server. Requests may be pipelined on a
+# connection: lookups are answered in request order, but errors and stats right away, hence the ids.
+
+
+class ServingStats:
+
+    def __init__(self):
+        """
+        Latency and throughput counters of an InferenceServer. Latencies run from the moment a request is read to
+        the moment its response is written, so they include the time spent waiting for a batch.
+        """
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def add_batch(self, received, done):
+        self.batches += 1
+        self.requests += len(received)
+        self.max_batch = max(self.max_batch, len(received))
+        self.latencies.extend(done - t for t in received)
+
+    def summary(self):
+        """
+        :return: Dictionary of the counters: requests, errors, batches, mean and max batch size, throughput
+        (requests per second since the server started) and latency percentiles in milliseconds.
+        """
+        elapsed = time.perf_counter() - self.start
+        summary = {"requests": self.requests,
+                   "errors": self.errors,
+                   "batches": self.batches,
+                   "mean_batch": self.requests / self.batches if self.batches > 0 else 0.0,
+                   "max_batch": self.max_batch,
+                   "throughput": self.requests / elapsed if elapsed > 0 else 0.0}
+        latencies = np.array(self.latencies) * 1e3
+        for q in (50, 95, 99):
+            summary["p%d_ms" % q] = float(np.percentile(latencies, q)) if latencies.shape[0] > 0 else 0.0
+        return summary
+
+
+class InferenceServer:
+
+    def __init__(self, tree, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        """
+        Local asyncio server answering single record cluster lookups with a fitted tree (see the protocol above).
+        Requests of all connections are queued and routed together through the flat tree in micro-batches: a batch
+        closes when it holds max_batch_size requests, or max_wait seconds after its first request. Routing a batch
+        costs a few numpy calls per tree level whatever its size, so batching is what keeps the per-request cost
+        down to parsing its line. Responses are preformatted per leaf, only the id is encoded per request.
+        The queue of requests is bounded: when max_queue requests wait, connections are not read any further until
+        it drains, and each batch waits for its responses to be flushed, so slow clients push back on their own
+        requests instead of growing the server memory.
+        :param tree: A fitted (or loaded, see Tree.load) Tree.
+        :param max_batch_size: Largest number of requests routed together.
+        :param max_wait: Seconds a request may wait for a batch to fill.
+        :param max_queue: Largest number of requests waiting for a batch.
+        """
+        self.flat = tree.compile()
+        self.n_features = tree.all_centers.shape[1]
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.stats = ServingStats()
+        arrays = tree.to_arrays()
+        self._responses = [(',"cluster":%d,"leaf":%d,"samples":%d,"mistakes":%d}\n'
+                            % (self.flat.value[i], i, arrays["samples"][i], arrays["mistakes"][i])).encode()
+                           for i in range(self.flat.n_nodes)]
+        self._queue = None
+        self._batcher = None
+        self._server = None
+        # writer -> task of each open connection
+        self._connections = {}
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        """
+        Start listening, on host:port or on the Unix socket path if given.
+        :return: The asyncio server.
+        """
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._batcher = asyncio.ensure_future(self.__batch_loop__())
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self.__handle__, path=path)
+        else:
+            self._server = await asyncio.start_server(self.__handle__, host=host, port=port)
+        return self._server
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """
+        Stop listening and close the open connections.
+        """
+        self._server.close()
+        connections = list(self._connections.items())
+        for writer, _ in connections:
+            writer.close()
+        await asyncio.gather(*[task for _, task in connections], return_exceptions=True)
+        await self._server.wait_closed()
+        self._batcher.cancel()
+
+    async def __handle__(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            async for line in reader:
+                received = time.perf_counter()
+                request = None
+                try:
+                    request = json.loads(line)
+                    if request.get("stats"):
+                        writer.write((json.dumps(self.stats.summary()) + "\n").encode())
+                    else:
+                        x = np.asarray(request["x"], dtype=np.float64)
+                        if x.shape != (self.n_features,):
+                            raise Exception("expected %d features, got shape %s" % (self.n_features, x.shape))
+                        await self._queue.put((received, json.dumps(request.get("id")).encode(), x, writer))
+                except Exception as e:
+                    self.stats.errors += 1
+                    writer.write((json.dumps({"id": request.get("id") if isinstance(request, dict) else None,
+                                              "error": str(e)}) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def __next_batch__(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def __batch_loop__(self):
+        while True:
+            batch = await self.__next_batch__()
+            received, ids, xs, writers = zip(*batch)
+            try:
+                leaves = self.flat.apply(np.stack(xs))
+                responses = [b'{"id":' + request_id + self._responses[leaf] for request_id, leaf in zip(ids, leaves)]
+            except Exception as e:
+                # Fail the requests of the batch, not the server
+                self.stats.errors += len(batch)
+                error = (',"error":%s}\n' % json.dumps(str(e))).encode()
+                responses = [b'{"id":' + request_id + error for request_id in ids]
+            else:
+                self.stats.add_batch(received, time.perf_counter())
+            for response, writer in zip(responses, writers):
+                if not writer.is_closing():
+                    writer.write(response)
+            # Flow control: the next batch waits until the clients took their responses
+            await asyncio.gather(*[writer.drain() for writer in set(writers) if not writer.is_closing()],
+                                 return_exceptions=True)
+
+
+async def serve(tree, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                max_wait=DEFAULT_MAX_WAIT, max_queue=DEFAULT_MAX_QUEUE):
+    """
+    Serve tree until cancelled (see InferenceServer).
+    """
+    server = InferenceServer(tree, max_batch_size, max_wait, max_queue)
+    await server.start(host, port, path)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+async def _open(host, port, path):
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def query_stats(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+    """
+    :return: The counters of a running server (see ServingStats.summary).
+    """
+    reader, writer = await _open(host, port, path)
+    writer.write(b'{"stats": true}\n')
+    response = json.loads(await reader.readline())
+    writer.close()
+    return response
+
+
+async def generate_load(x_data, n_requests, concurrency, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+    """
+    Load generator: concurrency clients, each on its own connection, send the rows of x_data (cycled) as single
+    record requests, one at a time, until n_requests are answered.
+    :param x_data: Samples to send, as a 2d array.
+    :param n_requests: Total number of requests.
+    :param concurrency: Number of concurrent clients, hence of requests in flight.
+    :return: Dictionary with the per-request latencies (seconds), the clusters answered (in row order of the
+    requests sent), the wall time and the throughput (requests per second).
+    """
+    rows = [json.dumps(row.tolist()) for row in np.asarray(x_data)]
+    latencies = np.zeros(n_requests)
+    clusters = np.zeros(n_requests, dtype=np.int64)
+    next_request = iter(range(n_requests))
+
+    async def client():
+        reader, writer = await _open(host, port, path)
+        try:
+            for i in next_request:
+                start = time.perf_counter()
+                writer.write(('{"id":%d,"x":%s}\n' % (i, rows[i % len(rows)])).encode())
+                response = json.loads(await reader.readline())
+                latencies[i] = time.perf_counter() - start
+                if "error" in response:
+                    raise Exception("request %d failed: %s" % (i, response["error"]))
+                clusters[i] = response["cluster"]
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    wall = time.perf_counter() - start
+    return {"latencies": latencies, "clusters": clusters, "wall": wall, "throughput": n_requests / wall}
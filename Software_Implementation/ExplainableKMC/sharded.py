@@ -0,0 +1,382 @@
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+
+import numpy as np
+
+from .evaluation import add_sums, evaluation_sums
+from .flat_tree import FlatTree, LEAF
+from .splitters import get_min_mistakes_cut_from_hist
+from .splitters import get_min_surrogate_cut_from_hist
+from .splitters import mistakes_histograms
+from .splitters import surrogate_histograms
+from .streaming import DEFAULT_STREAM_CHUNK_SIZE, iter_chunks
+
+# Fit of a threshold tree over data stored as several shards on disk, that does not need to fit in memory.
+# Workers compute per-shard histograms (see hist_cut_finder.pyx) for the nodes being split, the coordinator adds
+# them up and scans the sums with the same kernels as Tree, so the tree is the one Tree.fit builds on the whole data
+# with the hist splitter. The tree is grown in passes over the shards: one per level of the IMM tree, then one per
+# split of the expansion.
+
+SHARD_PATTERN = 'shard_%05d.npy'
+LABELS_SUFFIX = '.labels.npy'
+
+# Row of a sample that left the IMM tree as a mistake
+DROPPED = -2
+
+
+class ShardCache:
+
+    def __init__(self):
+        """
+        Shards (and their labels) memory mapped by a process, so the tasks of a fit do not map them again. A shard
+        is mapped again if its files changed since, e.g. when another fit labeled it.
+        """
+        self._shards = {}
+
+    def load(self, path):
+        """
+        :return: The memory mapped samples and labels of the shard at path.
+        """
+        version = tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, (path, path + LABELS_SUFFIX)))
+        entry = self._shards.get(path)
+        if entry is None or entry[0] != version:
+            entry = (version, np.load(path, mmap_mode='r'), np.load(path + LABELS_SUFFIX, mmap_mode='r'))
+            self._shards[path] = entry
+        return entry[1], entry[2]
+
+    def forget(self, path):
+        self._shards.pop(path, None)
+
+    def close(self):
+        """
+        Drop the mapped shards (the memory maps are closed once the arrays handed out are released too).
+        """
+        self._shards.clear()
+
+
+class SerialTransport:
+    """
+    Runs the shard tasks one after the other in the calling process.
+    A transport runs a module level function over a list of argument tuples, and returns the results in order.
+    The function is called with the ShardCache of the process running it, then the arguments. The cache lives as
+    long as the transport. ProcessPoolTransport runs the tasks on local worker processes; a transport to remote
+    workers only needs the same map and close methods, the shards being paths the workers can open.
+    """
+
+    def __init__(self):
+        self.shards = ShardCache()
+
+    def map(self, function, tasks):
+        return [function(self.shards, *task) for task in tasks]
+
+    def close(self):
+        self.shards.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class ProcessPoolTransport(SerialTransport):
+
+    def __init__(self, n_workers=None):
+        """
+        Runs the shard tasks on a pool of local worker processes. Each worker has its own ShardCache, which goes
+        away with the worker when the pool is closed.
+        :param n_workers: Number of worker processes. Defaults to the number of CPUs.
+        """
+        self.pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker)
+
+    def map(self, function, tasks):
+        futures = [self.pool.submit(_run_in_worker, function, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def write_shards(source, directory, rows_per_shard=DEFAULT_STREAM_CHUNK_SIZE * 8, drop_columns=None):
+    """
+    Split a dataset into shards of at most rows_per_shard rows, one npy file each. The source is read chunk by
+    chunk, so it does not need to fit in memory.
+    :param source: Path of a csv file, an array / DataFrame, or an iterable of arrays / DataFrames.
+    :param directory: Directory the shards are written to.
+    :param rows_per_shard: Maximal number of rows of a shard.
+    :param drop_columns: Names of csv columns that are not features (e.g. the label column).
+    :return: The paths of the shards.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for shard in iter_chunks(source, rows_per_shard, drop_columns):
+        paths.append(os.path.join(directory, SHARD_PATTERN % len(paths)))
+        np.save(paths[-1], np.asarray(shard))
+    return paths
+
+
+# ShardCache of a worker process of a ProcessPoolTransport, set by the initializer of the pool
+_worker_shards = None
+
+
+def _init_worker():
+    global _worker_shards
+    _worker_shards = ShardCache()
+
+
+def _run_in_worker(function, *task):
+    return function(_worker_shards, *task)
+
+
+def _shard_prepare(shards, path, provider):
+    """
+    Label the samples of a shard with their closest center, and save the labels next to it.
+    :return: Number of samples, smallest and largest value, and whether the shard only holds integers.
+    """
+    shards.forget(path)
+    x_data = np.load(path, mmap_mode='r')
+    labels = np.asarray(provider.predict(x_data), dtype=np.int32)
+    np.save(path + LABELS_SUFFIX, labels)
+    if x_data.size == 0:
+        return x_data.shape[0], 0, 0, True
+    integer = x_data.dtype.kind in 'iu' or bool(np.array_equal(x_data, np.floor(x_data)))
+    return x_data.shape[0], x_data.min(), x_data.max(), integer
+
+
+def route(x_data, feature, threshold, left, right, labels=None, centers=None):
+    """
+    Route samples down a (partial) tree.
+    :param x_data: The samples.
+    :param feature, threshold, left, right: Arrays of the tree, as in FlatTree. Nodes still to be split are leaves.
+    :param labels: If given with centers, samples going to the other side of a split than their center are
+    mistakes, dropped as in the IMM build.
+    :param centers: The centers.
+    :return: Node reached by each sample, DROPPED for mistakes.
+    """
+    nodes = np.zeros(x_data.shape[0], dtype=np.int64)
+    rows = np.arange(x_data.shape[0])
+    while rows.shape[0] > 0:
+        curr = nodes[rows]
+        internal = left[curr] != LEAF
+        rows, curr = rows[internal], curr[internal]
+        if rows.shape[0] == 0:
+            break
+        go_left = x_data[rows, feature[curr]] <= threshold[curr]
+        if labels is not None:
+            kept = go_left == (centers[labels[rows], feature[curr]] <= threshold[curr])
+            nodes[rows[~kept]] = DROPPED
+            rows, curr, go_left = rows[kept], curr[kept], go_left[kept]
+        nodes[rows] = np.where(go_left, left[curr], right[curr])
+    return nodes
+
+
+def _shard_mistakes_histograms(shards, path, arrays, node_ids, centers, n_bins):
+    """
+    :return: mistakes_histograms of the samples of the shard reaching each node of node_ids in the IMM build.
+    """
+    x_data, labels = shards.load(path)
+    nodes = route(x_data, *arrays, labels=labels, centers=centers)
+    valid_cols = np.ones(x_data.shape[1], dtype=np.int32)
+    histograms = []
+    for node in node_ids:
+        rows = np.flatnonzero(nodes == node)
+        histograms.append(mistakes_histograms(x_data[rows], labels[rows], centers.shape[0], valid_cols, n_bins, 1))
+    return histograms
+
+
+def _shard_surrogate_histograms(shards, path, arrays, leaf_ids, leaf_values, n_bins):
+    """
+    :return: surrogate_histograms of the samples of the shard reaching each leaf of leaf_ids, and their number of
+    samples labeled with another cluster than the leaf value.
+    """
+    x_data, labels = shards.load(path)
+    nodes = route(x_data, *arrays)
+    stats = []
+    for leaf, value in zip(leaf_ids, leaf_values):
+        rows = np.flatnonzero(nodes == leaf)
+        sums, counts = surrogate_histograms(x_data[rows], n_bins, 1)
+        stats.append((sums, counts, int(np.count_nonzero(labels[rows] != value))))
+    return stats
+
+
+def _shard_evaluation_sums(shards, path, flat, centers):
+    x_data, labels = shards.load(path)
+    return evaluation_sums(flat, centers, x_data, labels)
+
+
+class _GrowingTree:
+    # Tree under construction, as growable flat arrays. Node ids are creation order, not breadth-first order.
+
+    def __init__(self):
+        self.feature = []
+        self.threshold = []
+        self.left = []
+        self.right = []
+        self.value = []
+        self.add()
+
+    def add(self, value=None):
+        for array, initial in ((self.feature, LEAF), (self.threshold, 0.0), (self.left, LEAF), (self.right, LEAF),
+                               (self.value, value)):
+            array.append(initial)
+        return len(self.feature) - 1
+
+    def split(self, node, col, threshold, left_value=None, right_value=None):
+        self.feature[node] = col
+        self.threshold[node] = threshold
+        self.left[node] = self.add(left_value)
+        self.right[node] = self.add(right_value)
+        return self.left[node], self.right[node]
+
+    def arrays(self):
+        return (np.array(self.feature, dtype=np.int32), np.array(self.threshold, dtype=np.float64),
+                np.array(self.left, dtype=np.int32), np.array(self.right, dtype=np.int32))
+
+    def leaves(self, node=0):
+        # Leaves in depth first, left first order, the order Tree gathers its leaves data in
+        stack = [node]
+        while len(stack) > 0:
+            node = stack.pop()
+            if self.left[node] == LEAF:
+                yield node
+            else:
+                stack.append(self.right[node])
+                stack.append(self.left[node])
+
+    def to_flat(self):
+        feature, threshold, left, right = self.arrays()
+        return FlatTree(feature, threshold, left, right, np.array(self.value, dtype=np.float64))
+
+
+class ShardedFit:
+
+    def __init__(self, tree, shards, transport=None):
+        """
+        Fit of a Tree over data split into shards (see write_shards). The tree is the same as the one Tree.fit
+        builds with the hist splitter on the whole data, given the same centers.
+        :param tree: The Tree to fit (its k, max_leaves, base_tree and n_jobs are used).
+        :param shards: Paths of the shards, npy files holding integer samples in [0, MAX_HIST_BINS).
+        :param transport: Runs the shard tasks (see SerialTransport). Defaults to a ProcessPoolTransport of n_jobs
+        workers, closed with the fit (see close). A given transport is left open, with the shards it mapped.
+        """
+        self.tree = tree
+        self.shards = list(shards)
+        self._own_transport = transport is None
+        self.transport = ProcessPoolTransport(tree.n_jobs) if transport is None else transport
+        self.centers = None
+        self.n_bins = None
+
+    def close(self):
+        """
+        Close the transport created by the fit, which unmaps the shards its workers opened.
+        """
+        if self._own_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _map(self, function, *args):
+        # Results come back in shard order, so they always add up in the same order
+        return self.transport.map(function, [(path,) + args for path in self.shards])
+
+    def new_tree(self):
+        return _GrowingTree()
+
+    def prepare(self, provider, max_bins):
+        """
+        Label every shard with the closest centers of the fitted provider, and check the shards hold integer data
+        that the histogram kernels can count.
+        """
+        stats = self._map(_shard_prepare, provider)
+        if not all(integer for _, _, _, integer in stats) or min(min_val for _, min_val, _, _ in stats) < 0:
+            raise Exception('Sharded fit requires non negative integer data')
+        max_val = max(max_val for _, _, max_val, _ in stats)
+        if max_val >= max_bins:
+            raise Exception('Sharded fit requires data in [0, %d)' % max_bins)
+        self.centers = provider.cluster_centers_.astype(np.float64)
+        self.n_bins = int(max_val) + 1
+        return sum(n for n, _, _, _ in stats)
+
+    def build_imm(self, growing, split_valid_centers):
+        """
+        Build the IMM tree level by level: each pass over the shards gathers the histograms of every node of the
+        current level.
+        :param growing: The _GrowingTree, holding only its root.
+        :param split_valid_centers: Splits the valid centers of a node between its children, as Tree does.
+        """
+        k = self.centers.shape[0]
+        valid_cols = np.ones(self.centers.shape[1], dtype=np.int32)
+        level = [(0, np.ones(k, dtype=np.int32))]
+        while len(level) > 0:
+            node_ids = [node for node, _ in level]
+            histograms = [sum(parts) for parts in zip(*self._map(_shard_mistakes_histograms, growing.arrays(),
+                                                                 node_ids, self.centers, self.n_bins))]
+            next_level = []
+            for (node, valid_centers), hist in zip(level, histograms):
+                # Every histogram column counts all samples of the node, per center
+                centers_count = hist[0].sum(axis=0)
+                if centers_count.sum() == 0:
+                    growing.value[node] = 0
+                    continue
+                elif valid_centers.sum() == 1:
+                    growing.value[node] = np.argmax(valid_centers)
+                    continue
+                elif np.count_nonzero(centers_count) == 1:
+                    growing.value[node] = np.argmax(centers_count)
+                    continue
+                cut = get_min_mistakes_cut_from_hist(hist, self.centers, valid_centers, valid_cols, self.tree.n_jobs)
+                if cut is None:
+                    growing.value[node] = np.argmax(valid_centers)
+                    continue
+                left, right = growing.split(node, cut["col"], cut["threshold"])
+                left_valid_centers, right_valid_centers = split_valid_centers(valid_centers, cut["col"],
+                                                                              cut["threshold"])
+                next_level += [(left, left_valid_centers), (right, right_valid_centers)]
+            level = next_level
+
+    def _splitters(self, growing, leaves, centers_norm_sqr, surrogate_splitter, hist_center_dot):
+        stats = [[sum(parts) for parts in zip(*leaf_parts)] for leaf_parts in
+                 zip(*self._map(_shard_surrogate_histograms, growing.arrays(), leaves,
+                                [growing.value[leaf] for leaf in leaves], self.n_bins))]
+        splitters = []
+        for sums, counts, mistakes in stats:
+            if mistakes == 0:
+                splitters.append(None)
+                continue
+            min_cut = get_min_surrogate_cut_from_hist(sums, counts, self.centers, centers_norm_sqr, self.tree.n_jobs)
+            splitters.append(surrogate_splitter(min_cut, counts[0].sum(), hist_center_dot(self.centers, sums),
+                                                centers_norm_sqr))
+        return splitters
+
+    def expand(self, growing, size, surrogate_splitter, hist_center_dot):
+        """
+        Grow the tree best-first up to max_leaves leaves, as Tree does: each split takes one pass over the shards,
+        to evaluate the two new leaves.
+        """
+        centers_norm_sqr = np.linalg.norm(self.centers, axis=1) ** 2
+        heap = []
+        order = count()
+
+        def push(leaves):
+            for leaf, splitter in zip(leaves, self._splitters(growing, leaves, centers_norm_sqr, surrogate_splitter,
+                                                              hist_center_dot)):
+                if splitter is not None:
+                    heapq.heappush(heap, (splitter["cost_gain"], next(order), leaf, splitter))
+
+        push(list(growing.leaves()))
+        while size < self.tree.max_leaves and len(heap) > 0:
+            _, _, leaf, splitter = heapq.heappop(heap)
+            push(list(growing.split(leaf, splitter["col"], splitter["threshold"], splitter["center_left"],
+                                    splitter["center_right"])))
+            size += 1
+
+    def evaluation_sums(self, flat):
+        return add_sums(self._map(_shard_evaluation_sums, flat, self.centers))
@@ -1,2 +1,10 @@
 from cut_finder import get_min_mistakes_cut
+from cut_finder import get_min_mistakes_cut_presorted
+from cut_finder import partition_presorted
 from cut_finder import get_min_surrogate_cut
+from hist_cut_finder import get_min_mistakes_cut_hist
+from hist_cut_finder import get_min_surrogate_cut_hist
+from hist_cut_finder import mistakes_histograms
+from hist_cut_finder import get_min_mistakes_cut_from_hist
+from hist_cut_finder import surrogate_histograms
+from hist_cut_finder import get_min_surrogate_cut_from_hist
@@ -7,13 +7,24 @@ import numpy as np
 cimport numpy as np
 cimport cython
 from cython.parallel import prange
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, calloc, free, qsort
+from openmp cimport omp_get_wtime
 
 ctypedef np.int32_t NP_INT_t
 ctypedef np.float64_t NP_FLOAT_t
 
+# Input samples may be kept in a narrow integer dtype (see Tree's compact mode) to avoid float64 copies.
+ctypedef fused DATA_t:
+    np.uint8_t
+    np.uint16_t
+    np.int8_t
+    np.int16_t
+    np.int32_t
+    np.float64_t
+
 cdef extern from "<math.h>" nogil:
     const float INFINITY
+    double fabs(double x)
 
 
 cdef extern from "<limits.h>":
@@ -21,14 +32,36 @@ cdef extern from "<limits.h>":
     const int INT_MAX
 
 
+# Columns of integer values spanning at most this many values (or as many as the column has rows) are sorted by
+# counting, the others with qsort.
+cdef int COUNTING_SORT_MIN_RANGE = 65536
+
+
+# Surrogate costs closer than this (relative to the cost scale of a leaf, see surrogate_cost_tolerance) are ties,
+# and ties go to the lowest column, then the lowest threshold. The sort and the histogram kernels sum the same dot
+# products in different orders, so exactly tied cuts (e.g. the ones keeping the same center on both sides) only
+# differ by rounding. Same value as in hist_cut_finder.pyx and Tree.py.
+cdef NP_FLOAT_t SURROGATE_COST_RTOL = 1e-9
+
+
+# A value of the column being sorted, with the index of its row (or center)
+cdef struct Sort_Item:
+    NP_FLOAT_t value
+    NP_INT_t index
+
+
+# mistakes is the number of data points the cut separates from their center
 cdef struct IMM_Cut:
     int col
     float threshold
+    long long mistakes
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def get_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, NP_INT_t[:] valid_cols, int njobs):
+def get_min_mistakes_cut(const DATA_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, NP_INT_t[:] valid_cols, int njobs, NP_FLOAT_t[:] timings=None):
+    # If timings is given, the seconds spent sorting and scanning columns are added to timings[0] and timings[1]
+    # (summed over columns, so across threads when running in parallel).
     cdef int n = X.shape[0]
     cdef int k = centers.shape[0]
     cdef int d = valid_cols.shape[0]
@@ -39,6 +72,15 @@ def get_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] cente
     cdef int best_col = -1
     cdef NP_FLOAT_t best_threshold
     cdef int min_mistakes = INT_MAX
+    cdef NP_FLOAT_t *cols_sort_time = NULL
+    cdef NP_FLOAT_t *cols_scan_time = NULL
+
+    if timings is not None:
+        cols_sort_time = <NP_FLOAT_t *> malloc(d * sizeof(NP_FLOAT_t))
+        cols_scan_time = <NP_FLOAT_t *> malloc(d * sizeof(NP_FLOAT_t))
+        for col in range(d):
+            cols_sort_time[col] = 0
+            cols_scan_time[col] = 0
 
     # Count the number of data points for each center.
     # This information will be helpful for fast mistakes calculation, once a threshold pass a center.
@@ -49,14 +91,16 @@ def get_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] cente
 
     if njobs is None or njobs <= 1:
         # Iterate over valid coordinates
-        for col in range(d):
-            if valid_cols[col] == 1:
-                update_col_min_mistakes_cut(X, y, centers, valid_centers, centers_count, cols_thresholds, cols_mistakes, col, n, d, k)
+        # The GIL is released so that other threads (e.g. sibling subtree builds) can run meanwhile.
+        with nogil:
+            for col in range(d):
+                if valid_cols[col] == 1:
+                    update_col_min_mistakes_cut(X, y, centers, valid_centers, centers_count, cols_thresholds, cols_mistakes, col, n, d, k, cols_sort_time, cols_scan_time)
     else:
         # Iterate over valid coordinates
         for col in prange(d, nogil=True, num_threads=njobs):
             if valid_cols[col] == 1:
-                update_col_min_mistakes_cut(X, y, centers, valid_centers, centers_count, cols_thresholds, cols_mistakes, col, n, d, k)
+                update_col_min_mistakes_cut(X, y, centers, valid_centers, centers_count, cols_thresholds, cols_mistakes, col, n, d, k, cols_sort_time, cols_scan_time)
 
     for col in range(d):
         # This is a valid column
@@ -71,6 +115,13 @@ def get_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] cente
     if best_col != -1:
         best_threshold = cols_thresholds[best_col]
 
+    if timings is not None:
+        for col in range(d):
+            timings[0] += cols_sort_time[col]
+            timings[1] += cols_scan_time[col]
+        free(cols_sort_time)
+        free(cols_scan_time)
+
     free(cols_thresholds)
     free(cols_mistakes)
     free(centers_count)
@@ -78,12 +129,123 @@ def get_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] cente
     if best_col == -1:
         return None
     else:
-        return IMM_Cut(best_col, best_threshold)
+        return IMM_Cut(best_col, best_threshold, min_mistakes)
+
+
+cdef int compare_sort_items(const void *a, const void *b) noexcept nogil:
+    # Equal values are ordered by index, so that the order does not depend on the qsort implementation
+    cdef const Sort_Item *item_a = <const Sort_Item *> a
+    cdef const Sort_Item *item_b = <const Sort_Item *> b
+    if item_a.value < item_b.value:
+        return -1
+    if item_a.value > item_b.value:
+        return 1
+    return (item_a.index > item_b.index) - (item_a.index < item_b.index)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void sort_items(Sort_Item *items, int n, NP_INT_t *order) nogil:
+    # Write to order the indices of items, sorted by value. Runs without the GIL, unlike numpy's argsort, so that
+    # the columns searched in parallel (or the sibling nodes built concurrently) do not take turns sorting.
+    cdef int i
+    qsort(items, n, sizeof(Sort_Item), compare_sort_items)
+    for i in range(n):
+        order[i] = items[i].index
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void argsort_col(const DATA_t[:,:] X, int col, int n, NP_INT_t *order) nogil:
+    # Write to order the rows of X sorted by column col, equal values by row. Integer valued columns (the common
+    # case, even in float64) are sorted by counting, in linear time.
+    cdef Sort_Item *items
+    cdef NP_FLOAT_t value
+    cdef NP_FLOAT_t low = INFINITY
+    cdef NP_FLOAT_t high = -INFINITY
+    cdef bint integer = 1
+    cdef long long *starts
+    cdef long long n_values
+    cdef int i
+
+    for i in range(n):
+        value = X[i, col]
+        if value < low:
+            low = value
+        if value > high:
+            high = value
+        if DATA_t is np.float64_t:
+            # The first test also rejects nan and inf, before the cast
+            if not (fabs(value) < 1e15) or value != <NP_FLOAT_t> <long long> value:
+                integer = 0
+                break
+
+    if n > 0 and integer and high - low < max(n, COUNTING_SORT_MIN_RANGE):
+        n_values = <long long> (high - low) + 1
+        starts = <long long *> calloc(n_values + 1, sizeof(long long))
+        for i in range(n):
+            starts[<long long> (X[i, col] - low) + 1] += 1
+        for i in range(n_values):
+            starts[i + 1] += starts[i]
+        for i in range(n):
+            value = X[i, col] - low
+            order[starts[<long long> value]] = i
+            starts[<long long> value] += 1
+        free(starts)
+        return
+
+    items = <Sort_Item *> malloc(n * sizeof(Sort_Item))
+    for i in range(n):
+        items[i].value = X[i, col]
+        items[i].index = i
+    sort_items(items, n, order)
+    free(items)
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef void update_col_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, int* centers_count, NP_FLOAT_t *cols_thresholds, int *cols_mistakes, int col, int n, int d, int k) nogil:
+cdef void argsort_centers_col(NP_FLOAT_t[:,:] centers, int col, int k, NP_INT_t *order) nogil:
+    cdef Sort_Item *items = <Sort_Item *> malloc(k * sizeof(Sort_Item))
+    cdef int i
+    for i in range(k):
+        items[i].value = centers[i, col]
+        items[i].index = i
+    sort_items(items, k, order)
+    free(items)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void update_col_min_mistakes_cut(const DATA_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, int* centers_count, NP_FLOAT_t *cols_thresholds, int *cols_mistakes, int col, int n, int d, int k, NP_FLOAT_t *cols_sort_time, NP_FLOAT_t *cols_scan_time) nogil:
+    cdef NP_INT_t *data_order = <NP_INT_t *> malloc(n * sizeof(NP_INT_t))
+    cdef NP_INT_t *centers_order = <NP_INT_t *> malloc(k * sizeof(NP_INT_t))
+    cdef double start
+    cdef double sorted_time
+
+    if cols_sort_time != NULL:
+        start = omp_get_wtime()
+
+    # Sort data points and centers
+    argsort_col(X, col, n, data_order)
+    argsort_centers_col(centers, col, k, centers_order)
+
+    if cols_sort_time != NULL:
+        sorted_time = omp_get_wtime()
+        cols_sort_time[col] = sorted_time - start
+
+    col_min_mistakes_cut(X, y, centers, valid_centers, centers_count, data_order, centers_order, cols_thresholds, cols_mistakes, col, n, k)
+    free(data_order)
+    free(centers_order)
+
+    if cols_scan_time != NULL:
+        cols_scan_time[col] = omp_get_wtime() - sorted_time
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void col_min_mistakes_cut(const DATA_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, int* centers_count, const NP_INT_t *data_order, const NP_INT_t *centers_order, NP_FLOAT_t *cols_thresholds, int *cols_mistakes, int col, int n, int k) nogil:
+    # Find the minimal mistakes cut of a single column.
+    # data_order lists the n data points sorted by the column, and centers_order lists the k centers sorted by the column.
     cdef int i
     cdef int ix
     cdef int ic
@@ -91,8 +253,6 @@ cdef void update_col_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT
     cdef NP_FLOAT_t prev_threshold
     cdef NP_FLOAT_t threshold
     cdef NP_FLOAT_t max_val
-    cdef np.int64_t[:] data_order
-    cdef np.int64_t[:] centers_order
     cdef int *left_centers_count = <int *> malloc(k * sizeof(int))
     cdef int curr_center_idx
     cdef bint valid_found = 0
@@ -100,11 +260,6 @@ cdef void update_col_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT
     cdef int min_mistakes = INT_MAX
     cdef NP_FLOAT_t best_threshold
 
-    # Sort data points and centers
-    with gil:
-        data_order = np.asarray(X[:,col]).argsort()
-        centers_order = np.asarray(centers[:, col]).argsort()
-
     # Find maximal value of valid centers. Possible threshold must be strictly smaller than that.
     max_val = -INFINITY
     for i in range(k):
@@ -233,6 +388,118 @@ cdef void update_col_min_mistakes_cut(NP_FLOAT_t[:,:] X, NP_INT_t[:] y, NP_FLOAT
         cols_mistakes[col] = -1
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def get_min_mistakes_cut_presorted(const DATA_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, NP_INT_t[:] valid_cols, NP_INT_t[:, ::1] order, int start, int end, int njobs):
+    # Same as get_min_mistakes_cut, but over the rows order[col, start:end], which are already sorted by each column.
+    # Nothing is sorted or copied here, so the whole column search runs without the GIL.
+    cdef int n = end - start
+    cdef int k = centers.shape[0]
+    cdef int d = valid_cols.shape[0]
+    cdef int *centers_count = <int *> malloc(k * sizeof(int))
+    cdef NP_FLOAT_t *cols_thresholds = <NP_FLOAT_t *> malloc(d * sizeof(NP_FLOAT_t))
+    cdef int *cols_mistakes = <int *> malloc(d * sizeof(int))
+    cdef NP_INT_t[:, ::1] centers_order = np.ascontiguousarray(np.argsort(np.asarray(centers), axis=0).T, dtype=np.int32)
+    cdef int i
+    cdef int col
+    cdef int best_col = -1
+    cdef NP_FLOAT_t best_threshold
+    cdef int min_mistakes = INT_MAX
+
+    with nogil:
+        # Count the number of data points for each center.
+        for i in range(k):
+            centers_count[i] = 0
+        for i in range(start, end):
+            centers_count[y[order[0, i]]] += 1
+
+        if njobs <= 1:
+            for col in range(d):
+                if valid_cols[col] == 1:
+                    col_min_mistakes_cut(X, y, centers, valid_centers, centers_count, &order[col, start], &centers_order[col, 0], cols_thresholds, cols_mistakes, col, n, k)
+        else:
+            for col in prange(d, num_threads=njobs):
+                if valid_cols[col] == 1:
+                    col_min_mistakes_cut(X, y, centers, valid_centers, centers_count, &order[col, start], &centers_order[col, 0], cols_thresholds, cols_mistakes, col, n, k)
+
+    for col in range(d):
+        if valid_cols[col] == 1 and cols_mistakes[col] != -1 and cols_mistakes[col] < min_mistakes:
+            best_col = col
+            min_mistakes = cols_mistakes[col]
+
+    if best_col != -1:
+        best_threshold = cols_thresholds[best_col]
+
+    free(cols_thresholds)
+    free(cols_mistakes)
+    free(centers_count)
+
+    if best_col == -1:
+        return None
+    else:
+        return IMM_Cut(best_col, best_threshold, min_mistakes)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def partition_presorted(NP_INT_t[:, ::1] order, np.int8_t[:] side, int start, int end, int njobs):
+    # Stable in-place partition of order[col, start:end] for every column, according to side[row]:
+    # rows with side 0 (left) come first, then rows with side 1 (right), then rows with any other side (dropped).
+    # Each column stays sorted within the left and right ranges.
+    # Returns the number of left and right rows.
+    cdef int d = order.shape[0]
+    cdef int col
+    cdef int i
+    cdef int n_left = 0
+    cdef int n_right = 0
+
+    for i in range(start, end):
+        if side[order[0, i]] == 0:
+            n_left += 1
+        elif side[order[0, i]] == 1:
+            n_right += 1
+
+    with nogil:
+        if njobs <= 1:
+            for col in range(d):
+                partition_col(&order[col, start], side, end - start)
+        else:
+            for col in prange(d, num_threads=njobs):
+                partition_col(&order[col, start], side, end - start)
+
+    return n_left, n_right
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void partition_col(NP_INT_t *rows, np.int8_t[:] side, int n) nogil:
+    cdef NP_INT_t *tmp = <NP_INT_t *> malloc(n * sizeof(NP_INT_t))
+    cdef int i
+    cdef int n_left = 0
+    cdef int n_right = 0
+    cdef int n_dropped = 0
+
+    # Left rows are compacted in place (the write index never passes the read index).
+    # Right rows are buffered in order from the front of tmp, dropped rows from its back.
+    for i in range(n):
+        if side[rows[i]] == 0:
+            rows[n_left] = rows[i]
+            n_left += 1
+        elif side[rows[i]] == 1:
+            tmp[n_right] = rows[i]
+            n_right += 1
+        else:
+            n_dropped += 1
+            tmp[n - n_dropped] = rows[i]
+
+    for i in range(n_right):
+        rows[n_left + i] = tmp[i]
+    for i in range(n_dropped):
+        rows[n_left + n_right + i] = tmp[n - n_dropped + i]
+
+    free(tmp)
+
+
 cdef struct Surrogate_Cut:
     int col
     float threshold
@@ -243,7 +510,8 @@ cdef struct Surrogate_Cut:
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def get_min_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_dot, NP_FLOAT_t[:] X_sum_all_center_dot, NP_FLOAT_t[:] centers_norm_sqr, int njobs):
+def get_min_surrogate_cut(const DATA_t[:,:] X, NP_FLOAT_t[:,:] X_center_dot, NP_FLOAT_t[:] X_sum_all_center_dot, NP_FLOAT_t[:] centers_norm_sqr, int njobs, NP_FLOAT_t[:] timings=None):
+    # If timings is given, the seconds spent sorting and scanning columns are added to timings[0] and timings[1].
     cdef int n = X.shape[0]
     cdef int k = X_center_dot.shape[1]
     cdef int d = X.shape[1]
@@ -258,22 +526,30 @@ def get_min_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_dot, NP_FL
     cdef NP_FLOAT_t best_threshold
     cdef int best_center_left
     cdef int best_center_right
+    cdef NP_FLOAT_t *cols_sort_time = NULL
+    cdef NP_FLOAT_t *cols_scan_time = NULL
+    cdef NP_FLOAT_t tol = surrogate_cost_tolerance(n, k, centers_norm_sqr, X_sum_all_center_dot)
 
+    if timings is not None:
+        cols_sort_time = <NP_FLOAT_t *> malloc(d * sizeof(NP_FLOAT_t))
+        cols_scan_time = <NP_FLOAT_t *> malloc(d * sizeof(NP_FLOAT_t))
 
     if njobs is None or njobs <= 1:
         # Iterate over valid coordinates
-        for col in range(d):
-            update_col_surrogate_cut(X, X_center_dot, centers_norm_sqr, X_sum_all_center_dot, n, d, k, col, thresholds, costs, left_centers, right_centers)
+        # The GIL is released so that other threads can run meanwhile.
+        with nogil:
+            for col in range(d):
+                update_col_surrogate_cut(X, X_center_dot, centers_norm_sqr, X_sum_all_center_dot, n, d, k, col, tol, thresholds, costs, left_centers, right_centers, cols_sort_time, cols_scan_time)
     else:
         # Iterate over valid coordinates
         for col in prange(d, nogil=True, num_threads=njobs):
-            update_col_surrogate_cut(X, X_center_dot, centers_norm_sqr, X_sum_all_center_dot, n, d, k, col, thresholds, costs, left_centers, right_centers)
+            update_col_surrogate_cut(X, X_center_dot, centers_norm_sqr, X_sum_all_center_dot, n, d, k, col, tol, thresholds, costs, left_centers, right_centers, cols_sort_time, cols_scan_time)
 
     for col in range(d):
         # This is a valid cut
         if left_centers[col] != -1:
             # This is a better cut
-            if costs[col] < best_cost:
+            if costs[col] < best_cost - tol:
                 best_col = col
                 best_cost = costs[col]
 
@@ -283,6 +559,13 @@ def get_min_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_dot, NP_FL
         best_center_left = left_centers[best_col]
         best_center_right = right_centers[best_col]
 
+    if timings is not None:
+        for col in range(d):
+            timings[0] += cols_sort_time[col]
+            timings[1] += cols_scan_time[col]
+        free(cols_sort_time)
+        free(cols_scan_time)
+
     free(thresholds)
     free(costs)
     free(left_centers)
@@ -296,7 +579,18 @@ def get_min_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_dot, NP_FL
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef void update_col_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_dot, NP_FLOAT_t[:] centers_norm_sqr, NP_FLOAT_t[:] X_sum_all_center_dot, int n, int d, int k, int col, NP_FLOAT_t *thresholds, NP_FLOAT_t *costs, int *left_centers, int *right_centers) nogil:
+cdef NP_FLOAT_t surrogate_cost_tolerance(int n, int k, NP_FLOAT_t[:] centers_norm_sqr, NP_FLOAT_t[:] X_sum_all_center_dot):
+    # The costs of a leaf are differences of n * |c|^2 and 2 * sum <x, c>: their rounding errors scale with these.
+    cdef int ic
+    cdef NP_FLOAT_t scale = 0
+    for ic in range(k):
+        scale = max(scale, n * centers_norm_sqr[ic] + 2 * fabs(X_sum_all_center_dot[ic]))
+    return SURROGATE_COST_RTOL * scale
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void update_col_surrogate_cut(const DATA_t[:,:] X, NP_FLOAT_t[:,:] X_center_dot, NP_FLOAT_t[:] centers_norm_sqr, NP_FLOAT_t[:] X_sum_all_center_dot, int n, int d, int k, int col, NP_FLOAT_t tol, NP_FLOAT_t *thresholds, NP_FLOAT_t *costs, int *left_centers, int *right_centers, NP_FLOAT_t *cols_sort_time, NP_FLOAT_t *cols_scan_time) nogil:
     cdef int i
     cdef int ix
     cdef int ic
@@ -313,16 +607,24 @@ cdef void update_col_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_d
     cdef NP_FLOAT_t cur_total_cost
     cdef NP_FLOAT_t prev_threshold
     cdef NP_FLOAT_t threshold
-    cdef np.int64_t[:] data_order
+    cdef NP_INT_t *data_order = <NP_INT_t *> malloc(n * sizeof(NP_INT_t))
     cdef bint valid_found = 0
     cdef NP_FLOAT_t best_cost = INFINITY
     cdef NP_FLOAT_t best_threshold
     cdef int best_center_left
     cdef int best_center_right
+    cdef double start
+    cdef double sorted_time
+
+    if cols_sort_time != NULL:
+        start = omp_get_wtime()
 
     # Sort data points
-    with gil:
-        data_order = np.asarray(X[:,col]).argsort()
+    argsort_col(X, col, n, data_order)
+
+    if cols_sort_time != NULL:
+        sorted_time = omp_get_wtime()
+        cols_sort_time[col] = sorted_time - start
 
     ix = 0
 
@@ -350,11 +652,11 @@ cdef void update_col_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_d
             right_cost = INFINITY
             for ic in range(k):
                 cost = n_left * centers_norm_sqr[ic] - 2 * X_sum_left_center_dot[ic]
-                if cost < left_cost:
+                if cost < left_cost - tol:
                     left_cost = cost
                     left_center = ic
                 cost = n_right * centers_norm_sqr[ic] - 2 * X_sum_right_center_dot[ic]
-                if cost < right_cost:
+                if cost < right_cost - tol:
                     right_cost = cost
                     right_center = ic
 
@@ -370,7 +672,7 @@ cdef void update_col_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_d
         n_left += 1
         n_right -= 1
 
-        if (prev_threshold != threshold) and (cur_total_cost < best_cost):
+        if (prev_threshold != threshold) and (cur_total_cost < best_cost - tol):
             valid_found = 1
             best_threshold = prev_threshold
             best_cost = cur_total_cost
@@ -380,6 +682,7 @@ cdef void update_col_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_d
 
     free(X_sum_left_center_dot)
     free(X_sum_right_center_dot)
+    free(data_order)
 
     if valid_found == 1:
         thresholds[col] = best_threshold
@@ -391,3 +694,6 @@ cdef void update_col_surrogate_cut(NP_FLOAT_t[:,:] X, NP_FLOAT_t[:,:] X_center_d
         costs[col] = -1.0
         left_centers[col] = -1
         right_centers[col] = -1
+
+    if cols_scan_time != NULL:
+        cols_scan_time[col] = omp_get_wtime() - sorted_time
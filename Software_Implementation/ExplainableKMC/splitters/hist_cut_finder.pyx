@@ -0,0 +1,465 @@
+# distutils: language = c
+# cython: boundscheck = False
+# cython: wraparound = False
+# cython: profile = False
+
+# Counting based cut finders for discrete data.
+# Every value of X must be an integer in [0, n_bins). Instead of sorting each column, a single pass builds
+# per-value histograms, and the candidate thresholds are scanned in value order.
+# The cuts found are the same as the ones of the sort based kernels in cut_finder.pyx.
+# Building the histograms and scanning them are separate steps. Histograms are integer counts and sums, so the
+# histograms of several parts of the data add up exactly to the ones of the whole data, and scanning the sum finds
+# the same cut (see sharded.py).
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from cython.parallel import prange
+from libc.stdlib cimport malloc, calloc, free
+
+ctypedef np.int32_t NP_INT_t
+ctypedef np.float64_t NP_FLOAT_t
+ctypedef np.int64_t NP_COUNT_t
+
+ctypedef fused DATA_t:
+    np.uint8_t
+    np.uint16_t
+    np.int8_t
+    np.int16_t
+    np.int32_t
+    np.float64_t
+
+cdef extern from "<math.h>" nogil:
+    const float INFINITY
+    double fabs(double x)
+
+
+cdef extern from "<limits.h>":
+    const long long LLONG_MAX
+
+
+# Surrogate costs closer than this, relative to the cost scale of the leaf, are ties (see cut_finder.pyx): the
+# dot products are summed in a different order than there, and tied cuts must go to the same column and threshold.
+cdef NP_FLOAT_t SURROGATE_COST_RTOL = 1e-9
+
+
+# mistakes is the number of data points the cut separates from their center
+cdef struct IMM_Cut:
+    int col
+    float threshold
+    long long mistakes
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def get_min_mistakes_cut_hist(const DATA_t[:,:] X, NP_INT_t[:] y, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, NP_INT_t[:] valid_cols, int n_bins, int njobs):
+    hist = mistakes_histograms(X, y, centers.shape[0], valid_cols, n_bins, njobs)
+    return get_min_mistakes_cut_from_hist(hist, centers, valid_centers, valid_cols, njobs)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def mistakes_histograms(const DATA_t[:,:] X, NP_INT_t[:] y, int k, NP_INT_t[:] valid_cols, int n_bins, int njobs):
+    # hist[col, v, c] is the number of data points of center c whose value in column col is v.
+    # Columns that are not valid are left empty.
+    cdef int n = X.shape[0]
+    cdef int d = X.shape[1]
+    cdef int col
+    hist = np.zeros((d, n_bins, k), dtype=np.int64)
+    cdef NP_COUNT_t[:, :, ::1] hist_view = hist
+
+    with nogil:
+        if njobs <= 1:
+            for col in range(d):
+                if valid_cols[col] == 1:
+                    col_mistakes_hist(X, y, &hist_view[col, 0, 0], col, n, k)
+        else:
+            for col in prange(d, num_threads=njobs):
+                if valid_cols[col] == 1:
+                    col_mistakes_hist(X, y, &hist_view[col, 0, 0], col, n, k)
+    return hist
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void col_mistakes_hist(const DATA_t[:,:] X, NP_INT_t[:] y, NP_COUNT_t *hist, int col, int n, int k) nogil:
+    cdef int i
+    for i in range(n):
+        hist[(<int> X[i, col]) * k + y[i]] += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def get_min_mistakes_cut_from_hist(NP_COUNT_t[:, :, ::1] hist, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, NP_INT_t[:] valid_cols, int njobs):
+    cdef int d = hist.shape[0]
+    cdef int n_bins = hist.shape[1]
+    cdef int k = hist.shape[2]
+    cdef NP_COUNT_t *centers_count = <NP_COUNT_t *> calloc(k, sizeof(NP_COUNT_t))
+    cdef NP_FLOAT_t *cols_thresholds = <NP_FLOAT_t *> malloc(d * sizeof(NP_FLOAT_t))
+    cdef NP_COUNT_t *cols_mistakes = <NP_COUNT_t *> malloc(d * sizeof(NP_COUNT_t))
+    cdef NP_INT_t[:, ::1] centers_order = np.ascontiguousarray(np.argsort(np.asarray(centers), axis=0).T, dtype=np.int32)
+    cdef int i
+    cdef int v
+    cdef int col
+    cdef int first_col = -1
+    cdef NP_COUNT_t n = 0
+    cdef int best_col = -1
+    cdef NP_FLOAT_t best_threshold
+    cdef NP_COUNT_t min_mistakes = LLONG_MAX
+
+    # Every valid column histogram counts all data points, the first one gives the number of points of each center
+    for col in range(d):
+        if valid_cols[col] == 1:
+            first_col = col
+            break
+
+    with nogil:
+        if first_col != -1:
+            for v in range(n_bins):
+                for i in range(k):
+                    centers_count[i] += hist[first_col, v, i]
+            for i in range(k):
+                n += centers_count[i]
+
+        if njobs <= 1:
+            for col in range(d):
+                if valid_cols[col] == 1:
+                    col_min_mistakes_cut_hist(&hist[col, 0, 0], centers, valid_centers, centers_count, &centers_order[col, 0], cols_thresholds, cols_mistakes, col, n, k, n_bins)
+        else:
+            for col in prange(d, num_threads=njobs):
+                if valid_cols[col] == 1:
+                    col_min_mistakes_cut_hist(&hist[col, 0, 0], centers, valid_centers, centers_count, &centers_order[col, 0], cols_thresholds, cols_mistakes, col, n, k, n_bins)
+
+    for col in range(d):
+        if valid_cols[col] == 1 and cols_mistakes[col] != -1 and cols_mistakes[col] < min_mistakes:
+            best_col = col
+            min_mistakes = cols_mistakes[col]
+
+    if best_col != -1:
+        best_threshold = cols_thresholds[best_col]
+
+    free(cols_thresholds)
+    free(cols_mistakes)
+    free(centers_count)
+
+    if best_col == -1:
+        return None
+    else:
+        return IMM_Cut(best_col, best_threshold, min_mistakes)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void col_min_mistakes_cut_hist(const NP_COUNT_t *hist, NP_FLOAT_t[:,:] centers, NP_INT_t[:] valid_centers, NP_COUNT_t *centers_count, const NP_INT_t *centers_order, NP_FLOAT_t *cols_thresholds, NP_COUNT_t *cols_mistakes, int col, NP_COUNT_t n, int k, int n_bins) nogil:
+    # hist[v * k + c] is the number of data points of center c whose value in this column is v.
+    cdef NP_COUNT_t *bin_count = <NP_COUNT_t *> calloc(n_bins, sizeof(NP_COUNT_t))
+    cdef NP_COUNT_t *left_centers_count = <NP_COUNT_t *> calloc(k, sizeof(NP_COUNT_t))
+    cdef int c
+    cdef int v
+    cdef int ic
+    cdef NP_COUNT_t n_left = 0
+    cdef NP_COUNT_t n_right
+    cdef NP_COUNT_t mistakes
+    cdef NP_COUNT_t min_mistakes = LLONG_MAX
+    cdef bint valid_found = 0
+    cdef bint is_center_threshold
+    cdef bint is_data_threshold
+    cdef NP_FLOAT_t threshold
+    cdef NP_FLOAT_t center_val
+    cdef NP_FLOAT_t min_val = INFINITY
+    cdef NP_FLOAT_t max_val = -INFINITY
+    cdef NP_FLOAT_t best_threshold
+
+    for v in range(n_bins):
+        for c in range(k):
+            bin_count[v] += hist[v * k + c]
+
+    for c in range(k):
+        if valid_centers[c] == 1:
+            if centers[c, col] < min_val:
+                min_val = centers[c, col]
+            if centers[c, col] > max_val:
+                max_val = centers[c, col]
+
+    # Advance to the first valid center
+    ic = 0
+    while ic < k and valid_centers[centers_order[ic]] == 0:
+        ic += 1
+    # Advance to the first non empty bin
+    v = 0
+    while v < n_bins and bin_count[v] == 0:
+        v += 1
+
+    # Sweep the merged, ascending sequence of distinct data values and valid center values.
+    while v < n_bins or ic < k:
+        # Pick the next threshold. A data value and a center value that are equal form a single threshold.
+        is_data_threshold = 0
+        is_center_threshold = 0
+        if ic < k:
+            center_val = centers[centers_order[ic], col]
+        if v < n_bins and (ic >= k or v <= center_val):
+            threshold = v
+            is_data_threshold = 1
+            if ic < k and center_val == threshold:
+                is_center_threshold = 1
+        else:
+            threshold = center_val
+            is_center_threshold = 1
+
+        if threshold >= max_val and not (threshold == min_val and threshold == max_val):
+            break
+
+        # Move every data point of this value to the left
+        if is_data_threshold:
+            for c in range(k):
+                left_centers_count[c] += hist[v * k + c]
+            n_left += bin_count[v]
+            v += 1
+            while v < n_bins and bin_count[v] == 0:
+                v += 1
+        # Skip all valid centers of this value
+        if is_center_threshold:
+            while ic < k and (valid_centers[centers_order[ic]] == 0 or centers[centers_order[ic], col] == threshold):
+                ic += 1
+
+        if threshold < min_val:
+            continue
+        n_right = n - n_left
+
+        # The sort based kernel evaluates a threshold only while at least one more data point remains to its right,
+        # or two if the threshold coincides with a center that is not the first one.
+        # A first center with a single point to its right is evaluated by its corner case, whose count is kept as is.
+        if threshold == min_val and n_right == 1:
+            mistakes = 0
+            for c in range(k):
+                if valid_centers[c] != 0 and centers[c, col] > threshold:
+                    mistakes += centers_count[c]
+            for c in range(k):
+                if left_centers_count[c] < centers_count[c] and centers[c, col] > threshold:
+                    mistakes -= 1
+        elif threshold == max_val:
+            break
+        elif n_right >= 2 or (n_right == 1 and not (is_center_threshold and threshold != min_val)):
+            mistakes = 0
+            for c in range(k):
+                if centers[c, col] <= threshold:
+                    mistakes += centers_count[c] - left_centers_count[c]
+                else:
+                    mistakes += left_centers_count[c]
+        else:
+            break
+
+        if mistakes < min_mistakes:
+            valid_found = 1
+            best_threshold = threshold
+            min_mistakes = mistakes
+
+    free(bin_count)
+    free(left_centers_count)
+
+    if valid_found == 1:
+        cols_thresholds[col] = best_threshold
+        cols_mistakes[col] = min_mistakes
+    else:
+        cols_thresholds[col] = -1.0
+        cols_mistakes[col] = -1
+
+
+cdef struct Surrogate_Cut:
+    int col
+    float threshold
+    NP_FLOAT_t cost
+    int center_left
+    int center_right
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def get_min_surrogate_cut_hist(const DATA_t[:,:] X, NP_FLOAT_t[:,:] centers, NP_FLOAT_t[:] centers_norm_sqr, int n_bins, int njobs):
+    sums, counts = surrogate_histograms(X, n_bins, njobs)
+    return get_min_surrogate_cut_from_hist(sums, counts, centers, centers_norm_sqr, njobs)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def surrogate_histograms(const DATA_t[:,:] X, int n_bins, int njobs):
+    # sums[col, v, j] is the sum of column j over the data points whose value in column col is v, and counts[col, v]
+    # their number. The data is integer, so the sums are exact.
+    cdef int n = X.shape[0]
+    cdef int d = X.shape[1]
+    cdef int col
+    sums = np.zeros((d, n_bins, d), dtype=np.int64)
+    counts = np.zeros((d, n_bins), dtype=np.int64)
+    cdef NP_COUNT_t[:, :, ::1] sums_view = sums
+    cdef NP_COUNT_t[:, ::1] counts_view = counts
+
+    with nogil:
+        if njobs <= 1:
+            for col in range(d):
+                col_surrogate_hist(X, &sums_view[col, 0, 0], &counts_view[col, 0], col, n, d)
+        else:
+            for col in prange(d, num_threads=njobs):
+                col_surrogate_hist(X, &sums_view[col, 0, 0], &counts_view[col, 0], col, n, d)
+    return sums, counts
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void col_surrogate_hist(const DATA_t[:,:] X, NP_COUNT_t *sums, NP_COUNT_t *counts, int col, int n, int d) nogil:
+    cdef int i
+    cdef int j
+    cdef int v
+    for i in range(n):
+        v = <int> X[i, col]
+        counts[v] += 1
+        for j in range(d):
+            sums[v * d + j] += <NP_COUNT_t> X[i, j]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def get_min_surrogate_cut_from_hist(NP_COUNT_t[:, :, ::1] sums, NP_COUNT_t[:, ::1] counts, NP_FLOAT_t[:,:] centers, NP_FLOAT_t[:] centers_norm_sqr, int njobs):
+    cdef int d = sums.shape[0]
+    cdef int n_bins = sums.shape[1]
+    cdef int k = centers.shape[0]
+    cdef int col
+    cdef int v
+    cdef int j
+    cdef int ic
+    cdef NP_COUNT_t n = 0
+    cdef NP_COUNT_t *total = <NP_COUNT_t *> calloc(d, sizeof(NP_COUNT_t))
+    cdef NP_FLOAT_t *thresholds = <NP_FLOAT_t *> malloc(d * sizeof(NP_FLOAT_t))
+    cdef NP_FLOAT_t *costs = <NP_FLOAT_t *> malloc(d * sizeof(NP_FLOAT_t))
+    cdef int *left_centers = <int *> malloc(d * sizeof(int))
+    cdef int *right_centers = <int *> malloc(d * sizeof(int))
+    cdef int best_col = -1
+    cdef NP_FLOAT_t best_cost = INFINITY
+    cdef NP_FLOAT_t best_threshold
+    cdef int best_center_left
+    cdef int best_center_right
+    cdef NP_FLOAT_t total_dot
+    cdef NP_FLOAT_t tol = 0
+
+    with nogil:
+        # Every column histogram sums all data points, the first one gives the total
+        if d > 0:
+            for v in range(n_bins):
+                n += counts[0, v]
+                for j in range(d):
+                    total[j] += sums[0, v, j]
+
+        # The costs of the leaf are differences of n * |c|^2 and 2 * sum <x, c>: their rounding errors scale with these
+        for ic in range(k):
+            total_dot = 0
+            for j in range(d):
+                total_dot = total_dot + total[j] * centers[ic, j]
+            tol = max(tol, n * centers_norm_sqr[ic] + 2 * fabs(total_dot))
+        tol = SURROGATE_COST_RTOL * tol
+
+        if njobs <= 1:
+            for col in range(d):
+                col_surrogate_cut_hist(&sums[col, 0, 0], &counts[col, 0], centers, centers_norm_sqr, total, n, k, d, col, n_bins, tol, thresholds, costs, left_centers, right_centers)
+        else:
+            for col in prange(d, num_threads=njobs):
+                col_surrogate_cut_hist(&sums[col, 0, 0], &counts[col, 0], centers, centers_norm_sqr, total, n, k, d, col, n_bins, tol, thresholds, costs, left_centers, right_centers)
+
+    for col in range(d):
+        if left_centers[col] != -1 and costs[col] < best_cost - tol:
+            best_col = col
+            best_cost = costs[col]
+
+    if best_col != -1:
+        best_threshold = thresholds[best_col]
+        best_center_left = left_centers[best_col]
+        best_center_right = right_centers[best_col]
+
+    free(total)
+    free(thresholds)
+    free(costs)
+    free(left_centers)
+    free(right_centers)
+
+    if best_col == -1:
+        return None
+    else:
+        return Surrogate_Cut(best_col, best_threshold, best_cost, best_center_left, best_center_right)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void col_surrogate_cut_hist(const NP_COUNT_t *sums, const NP_COUNT_t *counts, NP_FLOAT_t[:,:] centers, NP_FLOAT_t[:] centers_norm_sqr, const NP_COUNT_t *total, NP_COUNT_t n, int k, int d, int col, int n_bins, NP_FLOAT_t tol, NP_FLOAT_t *thresholds, NP_FLOAT_t *costs, int *left_centers, int *right_centers) nogil:
+    # sums[v * d + j] is the sum of column j over the data points whose value in this column is v.
+    # The sums of the points left and right of a threshold are kept as exact integers, and their dot products with
+    # the centers are computed from them at each threshold: the cost of a split only depends on the points on each
+    # side, not on the order they were summed in.
+    cdef NP_COUNT_t *left_sum = <NP_COUNT_t *> calloc(d, sizeof(NP_COUNT_t))
+    cdef int j
+    cdef int ic
+    cdef int v
+    cdef int last_bin
+    cdef NP_COUNT_t n_left = 0
+    cdef NP_COUNT_t n_right
+    cdef NP_FLOAT_t left_dot
+    cdef NP_FLOAT_t right_dot
+    cdef NP_FLOAT_t cost
+    cdef NP_FLOAT_t left_cost
+    cdef NP_FLOAT_t right_cost
+    cdef NP_FLOAT_t cur_total_cost
+    cdef int left_center
+    cdef int right_center
+    cdef bint valid_found = 0
+    cdef NP_FLOAT_t best_cost = INFINITY
+    cdef NP_FLOAT_t best_threshold
+    cdef int best_center_left
+    cdef int best_center_right
+
+    last_bin = n_bins - 1
+    while last_bin >= 0 and counts[last_bin] == 0:
+        last_bin -= 1
+
+    # Every non empty bin but the last one is a candidate threshold (all points with this value go left).
+    for v in range(last_bin):
+        if counts[v] == 0:
+            continue
+        n_left += counts[v]
+        n_right = n - n_left
+        for j in range(d):
+            left_sum[j] += sums[v * d + j]
+
+        left_cost = INFINITY
+        right_cost = INFINITY
+        for ic in range(k):
+            left_dot = 0
+            right_dot = 0
+            for j in range(d):
+                left_dot = left_dot + left_sum[j] * centers[ic, j]
+                right_dot = right_dot + (total[j] - left_sum[j]) * centers[ic, j]
+            cost = n_left * centers_norm_sqr[ic] - 2 * left_dot
+            if cost < left_cost - tol:
+                left_cost = cost
+                left_center = ic
+            cost = n_right * centers_norm_sqr[ic] - 2 * right_dot
+            if cost < right_cost - tol:
+                right_cost = cost
+                right_center = ic
+        cur_total_cost = left_cost + right_cost
+
+        if cur_total_cost < best_cost - tol:
+            valid_found = 1
+            best_threshold = v
+            best_cost = cur_total_cost
+            best_center_left = left_center
+            best_center_right = right_center
+
+    free(left_sum)
+
+    if valid_found == 1:
+        thresholds[col] = best_threshold
+        costs[col] = best_cost
+        left_centers[col] = best_center_left
+        right_centers[col] = best_center_right
+    else:
+        thresholds[col] = -1.0
+        costs[col] = -1.0
+        left_centers[col] = -1
+        right_centers[col] = -1
@@ -11,6 +11,12 @@ ext_modules = [
         ["cut_finder.pyx"],
         extra_compile_args=['-fopenmp'],
         extra_link_args=['-fopenmp']
+    ),
+    Extension(
+        "hist_cut_finder",
+        ["hist_cut_finder.pyx"],
+        extra_compile_args=['-fopenmp'],
+        extra_link_args=['-fopenmp']
     )
 ]
 
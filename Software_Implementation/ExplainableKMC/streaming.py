@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_STREAM_CHUNK_SIZE = 65536
+
+
+def iter_csv_chunks(path, chunk_size=DEFAULT_STREAM_CHUNK_SIZE, drop_columns=None, dtype=None):
+    """
+    Read a csv file in chunks of at most chunk_size rows.
+    Dropped columns are never parsed, so they cost nothing.
+    :param path: Path (or open file) of the csv file.
+    :param chunk_size: Maximal number of rows per chunk.
+    :param drop_columns: Names of columns to leave out, e.g. the label column.
+    :param dtype: Optional dtype to parse the remaining columns as.
+    :return: Iterator over DataFrame chunks.
+    """
+    drop_columns = set() if drop_columns is None else set(drop_columns)
+    reader = pd.read_csv(path, chunksize=chunk_size, dtype=dtype,
+                         usecols=lambda column: column not in drop_columns)
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def iter_array_chunks(source, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+    """
+    Split an array, a DataFrame or an iterable of those into chunks of at most chunk_size rows.
+    Slicing an array does not copy it.
+    :param source: Array, DataFrame, or iterable of arrays / DataFrames.
+    :param chunk_size: Maximal number of rows per chunk.
+    :return: Iterator over chunks.
+    """
+    if isinstance(source, (np.ndarray, pd.DataFrame)):
+        source = [source]
+    for block in source:
+        if isinstance(block, pd.DataFrame):
+            block = block.values
+        elif isinstance(block, list):
+            block = np.array(block)
+        for start in range(0, block.shape[0], chunk_size):
+            yield block[start:start + chunk_size]
+
+
+def iter_chunks(source, chunk_size=DEFAULT_STREAM_CHUNK_SIZE, drop_columns=None, dtype=None):
+    """
+    Iterate over a csv path, an array, or an iterable of arrays in chunks.
+    :param source: Path of a csv file, or anything accepted by iter_array_chunks.
+    :param chunk_size: Maximal number of rows per chunk.
+    :param drop_columns: Names of csv columns to leave out. Ignored for non-csv sources.
+    :param dtype: Optional dtype to parse csv columns as. Ignored for non-csv sources.
+    :return: Iterator over chunks.
+    """
+    if isinstance(source, str):
+        return iter_csv_chunks(source, chunk_size, drop_columns, dtype)
+    return iter_array_chunks(source, chunk_size)
+
+
+def write_labels(out, labels):
+    """
+    Append labels to an open text file, one per line.
+    :param out: Open text file.
+    :param labels: Array of cluster assignments.
+    """
+    np.savetxt(out, labels.astype(np.int64, copy=False), fmt="%d")
@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .assignment import closest_distances
+from .centroids import BatchKMeansProvider, WarmStartKMeansProvider
+from .Tree import Tree, convert_input, presort_columns
+
+# Columns of the table returned by sweep_k
+SWEEP_COLUMNS = ["k", "leaves", "kmeans_cost", "cost", "surrogate_cost", "price_of_explainability",
+                 "surrogate_price", "kmeans_iterations", "centroids_time", "tree_time"]
+
+
+def add_centers(x_data, centers, n_new, rng):
+    """
+    Extend centers with n_new centers picked as in k-means++: each new center is a sample, drawn with probability
+    proportional to its squared distance to the closest center so far.
+    :param x_data: The input samples.
+    :param centers: The current centers, of shape (k, d).
+    :param n_new: Number of centers to add.
+    :param rng: numpy Generator.
+    :return: The (k + n_new, d) centers.
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    distances = closest_distances(x_data, centers)
+    new_centers = []
+    for _ in range(n_new):
+        total = distances.sum()
+        index = rng.integers(x_data.shape[0]) if total <= 0 else rng.choice(x_data.shape[0], p=distances / total)
+        center = np.asarray(x_data[index], dtype=np.float64)
+        new_centers.append(center)
+        distances = np.minimum(distances, closest_distances(x_data, center[None, :]))
+    return np.vstack([centers] + new_centers)
+
+
+def sweep_k(x_data, ks, max_leaves=None, n_jobs=1, random_state=None, **tree_params):
+    """
+    Fit centroids and a threshold tree for every k of ks, sharing the work that does not depend on k.
+    The data is converted once (to float64 for k-means), and the column sort orders of the presorted build are computed once. The centroids
+    are fitted in increasing k, each k warm started from the centroids of the previous one plus k-means++ picks for
+    the new centers, which converges in a few iterations. The trees of the k whose centroids are ready are built
+    concurrently with the centroids of the next k, on n_jobs threads.
+    :param x_data: The training input samples.
+    :param ks: The numbers of clusters.
+    :param max_leaves: Optional function of k giving the max_leaves of its tree. Defaults to k leaves.
+    :param n_jobs: Number of trees built concurrently.
+    :param random_state: Seed of the first k-means and of the k-means++ picks.
+    :param tree_params: Other Tree constructor parameters (e.g. splitter, presort).
+    :return: DataFrame with the columns of SWEEP_COLUMNS, one row per k, and a dictionary of the fitted trees by k.
+    """
+    ks = sorted(set(ks))
+    tree_params.setdefault("compact", True)
+    x_data = convert_input(x_data, tree_params["compact"])
+    order = presort_columns(x_data) if tree_params.get("presort", False) else None
+    # k-means runs in float64, converted once rather than by every fit
+    x_float = x_data.astype(np.float64, copy=False)
+    rng = np.random.default_rng(random_state)
+
+    def fit_tree(k, provider):
+        tree = Tree(k=k, max_leaves=None if max_leaves is None else max_leaves(k), **tree_params)
+        start = time.perf_counter()
+        tree.fit(x_data, provider=provider, order=order)
+        return tree, time.perf_counter() - start
+
+    providers = {}
+    futures = {}
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        previous = None
+        for k in ks:
+            if previous is None:
+                provider = BatchKMeansProvider(k, random_state=random_state)
+            else:
+                provider = WarmStartKMeansProvider(add_centers(x_data, previous.cluster_centers_,
+                                                               k - previous.cluster_centers_.shape[0], rng))
+            providers[k] = provider.fit(x_float)
+            futures[k] = pool.submit(fit_tree, k, provider)
+            previous = provider
+
+    rows = []
+    trees = {}
+    for k in ks:
+        tree, tree_time = futures[k].result()
+        evaluation = tree.fit_evaluation()
+        trees[k] = tree
+        rows.append({"k": k,
+                     "leaves": tree.max_leaves,
+                     "kmeans_cost": providers[k].inertia_,
+                     "cost": evaluation["cost"],
+                     "surrogate_cost": evaluation["surrogate_cost"],
+                     "price_of_explainability": evaluation["price_of_explainability"],
+                     "surrogate_price": evaluation["surrogate_price"],
+                     "kmeans_iterations": providers[k].n_iter_,
+                     "centroids_time": providers[k].fit_time_,
+                     "tree_time": tree_time})
+    return pd.DataFrame(rows, columns=SWEEP_COLUMNS), trees
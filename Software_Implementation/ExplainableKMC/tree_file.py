@@ -0,0 +1,77 @@
+import json
+import struct
+
+import numpy as np
+
+# File layout: MAGIC, then the format version and the header length (little endian uint32), then the JSON header,
+# then each array, raw, at an offset that is a multiple of ALIGNMENT. The header lists the dtype, shape and offset
+# of every array, so they can be memory mapped in place.
+MAGIC = b'EXKMCTRE'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct('<8sII')
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_tree_file(path, params, arrays):
+    """
+    Write a tree file.
+    :param path: Path of the file.
+    :param params: JSON serializable dictionary (the constructor parameters of the tree).
+    :param arrays: Dictionary of arrays.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    # The header holds the offsets of the arrays, which depend on the header size: grow it until it fits
+    data_start = _aligned(_PREAMBLE.size + 256)
+    while True:
+        offset = data_start
+        entries = []
+        for name, array in arrays.items():
+            entries.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps({"params": params, "arrays": entries}).encode()
+        if _PREAMBLE.size + len(header) <= data_start:
+            break
+        data_start = _aligned(_PREAMBLE.size + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for entry, array in zip(entries, arrays.values()):
+            f.write(b'\0' * (entry["offset"] - f.tell()))
+            f.write(memoryview(array).cast('B'))
+
+
+def read_tree_file(path, mmap_mode='r'):
+    """
+    Read a tree file.
+    :param path: Path of the file.
+    :param mmap_mode: Memory map mode (see numpy.memmap), or None to read the arrays into memory. Memory mapped
+    arrays are shared by every process mapping the same file.
+    :return: The params and the dictionary of arrays.
+    """
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) != _PREAMBLE.size or preamble[:len(MAGIC)] != MAGIC:
+            raise Exception('%s is not a tree file' % path)
+        _, version, header_size = _PREAMBLE.unpack(preamble)
+        if version > FORMAT_VERSION:
+            raise Exception('%s has format version %d, only versions up to %d are supported'
+                            % (path, version, FORMAT_VERSION))
+        header = json.loads(f.read(header_size).decode())
+
+    if mmap_mode is None:
+        data = np.fromfile(path, dtype=np.uint8)
+    else:
+        data = np.memmap(path, dtype=np.uint8, mode=mmap_mode)
+    arrays = {}
+    for entry in header["arrays"]:
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        arrays[entry["name"]] = data[entry["offset"]:entry["offset"] + nbytes].view(dtype).reshape(shape)
+    return header["params"], arrays
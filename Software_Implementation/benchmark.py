@@ -0,0 +1,240 @@
+# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+# % Benchmark of the K-Means to ExKMC pipeline         %
+# % $ python3 benchmark.py --out results.json          %
+# % $ python3 benchmark.py --baseline results.json     %
+# % Run python3 benchmark.py -h for the sweep options  %
+# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from ExplainableKMC import Tree, __version__
+from ExplainableKMC.centroids import ASICEmulatorProvider, BatchKMeansProvider, MiniBatchKMeansProvider
+from ExplainableKMC.profiling import Profiler
+from sw_explainable import data_source
+
+DEFAULT_SIZES = [2 ** p for p in range(10, 20)]
+DEFAULT_TOLERANCE = 0.2
+# Medians that moved by less than this many seconds are never reported as regressions (timer noise)
+MIN_DELTA = 1e-3
+
+PROVIDERS = {"batch": lambda k, seed: BatchKMeansProvider(k, max_iter=500, random_state=seed),
+             "minibatch": lambda k, seed: MiniBatchKMeansProvider(k, random_state=seed),
+             "asic_emulator": lambda k, seed: ASICEmulatorProvider(k)}
+
+# Columns identifying a measurement, in the order they are printed
+KEY = ["stage", "n", "k", "n_jobs", "splitter"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of the K-Means to ExKMC pipeline.")
+    parser.add_argument("--data", default=data_source(),
+                        help="Cleaned dataset, as a csv or a zip archive holding it (MH1 is dropped). Defaults to "
+                             "the extracted csv if there is one, else the shipped zip.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Number of rows of each (random, fixed seed) subsample.")
+    parser.add_argument("--k", type=int, nargs="+", default=[14], help="Number of clusters.")
+    parser.add_argument("--n-jobs", type=int, nargs="+", default=[1], help="Tree n_jobs values.")
+    parser.add_argument("--splitter", nargs="+", default=["sort", "hist"], choices=Tree.SPLITTERS,
+                        help="Cut finder backends.")
+    parser.add_argument("--provider", default="batch", choices=sorted(PROVIDERS), help="Centroid stage.")
+    parser.add_argument("--leaves-factor", type=float, default=2.0,
+                        help="Trees are expanded up to leaves_factor * k leaves (1 disables expansion).")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs of each stage.")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs of each stage before the timed ones.")
+    parser.add_argument("--sample-size", type=int,
+                        help="Also time the sampled IMM build (Tree sample_size) and report its cost gap to the "
+                             "exact tree.")
+    parser.add_argument("--no-plot", action="store_true", help="Skip the plotting stage.")
+    parser.add_argument("--seed", type=int, default=43)
+    parser.add_argument("--out", help="Write the results to this JSON file.")
+    parser.add_argument("--trace", help="Profile one extra (untimed) fit of each tree configuration and write its "
+                                        "Chrome trace to this directory.")
+    parser.add_argument("--baseline", help="Compare the results against this JSON file (a previous --out).")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative slowdown of a median reported as a regression.")
+    return parser.parse_args(argv)
+
+
+def repeat(fn, repeats, warmup):
+    '''
+    Run fn warmup times, then repeats times, timing the latter with perf_counter.
+    Returns the list of times and the result of the last run.
+    '''
+    result = None
+    for _ in range(warmup):
+        result = fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def record(results, times, stage, n=None, k=None, n_jobs=None, splitter=None):
+    entry = {"stage": stage, "n": n, "k": k, "n_jobs": n_jobs, "splitter": splitter,
+             "min": min(times), "median": statistics.median(times), "mean": statistics.mean(times),
+             "stdev": statistics.stdev(times) if len(times) > 1 else 0.0, "times": times}
+    results.append(entry)
+    print("  ".join("%s=%s" % (name, entry[name]) for name in KEY if entry[name] is not None)
+          + "  median=%.6fs" % entry["median"])
+
+
+def run_benchmark(args):
+    '''
+    Time csv loading once, then every (n, k) centroid fitting and label assignment, and every
+    (n, k, n_jobs, splitter) tree build, expansion and plot.
+    '''
+    results = []
+    csv_times, frame = repeat(lambda: pd.read_csv(args.data, dtype=np.uint8), args.repeats, args.warmup)
+    record(results, csv_times, "csv_load", n=frame.shape[0])
+    X = frame.drop('MH1', axis=1).values
+    feature_names = list(frame.drop('MH1', axis=1).columns)
+
+    plot_dir = tempfile.mkdtemp(prefix="exkmc_bench_")
+    can_plot = not args.no_plot and shutil.which("dot") is not None
+    if not args.no_plot and not can_plot:
+        print("graphviz 'dot' executable not found, skipping the plot stage")
+
+    rng = np.random.default_rng(args.seed)
+    permutation = rng.permutation(X.shape[0])
+    for n in sorted(set(min(n, X.shape[0]) for n in args.sizes)):
+        X_n = X[np.sort(permutation[:n])]
+        for k in args.k:
+            times, provider = repeat(lambda: PROVIDERS[args.provider](k, args.seed).fit(X_n),
+                                     args.repeats, args.warmup)
+            record(results, times, "centroids", n=n, k=k)
+            times, labels = repeat(lambda: provider.predict(X_n), args.repeats, args.warmup)
+            record(results, times, "labels", n=n, k=k)
+
+            for n_jobs in args.n_jobs:
+                for splitter in args.splitter:
+                    config = {"n": n, "k": k, "n_jobs": n_jobs, "splitter": splitter}
+                    tree_times = {"build": [], "expand": []}
+                    for run in range(args.warmup + args.repeats):
+                        tree = Tree.Tree(k=k, max_leaves=max(k, int(args.leaves_factor * k)), compact=True,
+                                         n_jobs=n_jobs, splitter=splitter)
+                        tree.fit(X_n, provider=provider, labels=labels)
+                        if run >= args.warmup:
+                            for stage in tree_times:
+                                tree_times[stage].append(tree.fit_times()[stage])
+                    for stage, times in tree_times.items():
+                        record(results, times, stage, **config)
+                    if args.sample_size is not None:
+                        sampled_build(args, results, X_n, provider, labels, tree, config)
+                    if args.trace is not None:
+                        trace_tree(args, X_n, provider, labels, config)
+                    times, _ = repeat(lambda: tree.to_dot(feature_names), args.repeats, args.warmup)
+                    record(results, times, "dot_export", **config)
+                    if can_plot:
+                        filename = os.path.join(plot_dir, "tree")
+                        times, _ = repeat(lambda: tree.plot(filename=filename, feature_names=feature_names,
+                                                            view=False), args.repeats, args.warmup)
+                        record(results, times, "plot", **config)
+
+    shutil.rmtree(plot_dir, ignore_errors=True)
+    return results
+
+
+def sampled_build(args, results, X, provider, labels, exact, config):
+    '''
+    Time the build of the sampled tree of a configuration, and print how far it is from the exact tree
+    '''
+    times = []
+    for run in range(args.warmup + args.repeats):
+        tree = Tree.Tree(k=config["k"], max_leaves=exact.max_leaves, compact=True, n_jobs=config["n_jobs"],
+                         splitter=config["splitter"], sample_size=args.sample_size, random_state=args.seed)
+        tree.fit(X, provider=provider, labels=labels)
+        if run >= args.warmup:
+            times.append(tree.fit_times()["build"])
+    record(results, times, "sampled_build", **config)
+    report = tree.approximation_report(exact)
+    if report is not None:
+        results[-1]["approximation"] = report
+        print("  sampled build: cost gap %+.4f%%, surrogate gap %+.4f%%, mistakes %d (exact %d), "
+              "%d of %d nodes grown" % (100 * report["cost_gap"], 100 * report["surrogate_gap"], report["mistakes"],
+                                        report["exact_mistakes"], report["grown"], report["nodes"]))
+
+
+def trace_tree(args, X, provider, labels, config):
+    '''
+    Fit one profiled tree, write its Chrome trace to args.trace and print its summary.
+    '''
+    profiler = Profiler()
+    k = config["k"]
+    tree = Tree.Tree(k=k, max_leaves=max(k, int(args.leaves_factor * k)), compact=True,
+                     n_jobs=config["n_jobs"], splitter=config["splitter"], profiler=profiler)
+    tree.fit(X, provider=provider, labels=labels)
+    os.makedirs(args.trace, exist_ok=True)
+    path = os.path.join(args.trace, "trace_n%(n)d_k%(k)d_j%(n_jobs)d_%(splitter)s.json" % config)
+    profiler.export_chrome_trace(path)
+    print(profiler.summary(top=5))
+    print("Trace written to %s" % path)
+
+
+def metadata(args):
+    return {"version": __version__,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": vars(args)}
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Compare the medians of results against the ones of baseline.
+    Returns the list of (key, baseline median, median) that slowed down by more than tolerance.
+    '''
+    previous = {tuple(entry[name] for name in KEY): entry["median"] for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        key = tuple(entry[name] for name in KEY)
+        if key not in previous:
+            continue
+        old, new = previous[key], entry["median"]
+        change = (new - old) / old if old > 0 else 0.0
+        flag = ""
+        if new > old * (1 + tolerance) and new - old > MIN_DELTA:
+            regressions.append((key, old, new))
+            flag = "  REGRESSION"
+        print("%s  %.6fs -> %.6fs  (%+.1f%%)%s" % (", ".join("%s=%s" % (name, value) for name, value in
+                                                             zip(KEY, key) if value is not None),
+                                                   old, new, 100 * change, flag))
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmark(args)
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump({"meta": metadata(args), "results": results}, f, indent=2)
+        print("Results written to %s" % args.out)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\nComparison against %s" % args.baseline)
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print("%d regression(s) beyond %.0f%%" % (len(regressions), 100 * args.tolerance))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
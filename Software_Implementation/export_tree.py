@@ -0,0 +1,50 @@
+# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+# % Export a fitted tree to Python, C and SystemVerilog %
+# % $ python3 export_tree.py out_dir --tree t.exkmc   %
+# % t.exkmc is written by Tree.save. Without --tree, a %
+# % tree is fitted on the dataset first.               %
+# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import argparse
+import sys
+
+import numpy as np
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider
+from ExplainableKMC.codegen import BACKENDS, check_equivalence, write_sources
+from ExplainableKMC.datastore import ColumnStore
+from sw_explainable import data_source
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate inference code for a fitted tree and check it against "
+                                                 "Tree.predict on the dataset.")
+    parser.add_argument("out", nargs="?", default="GeneratedTree", help="Output directory.")
+    parser.add_argument("--tree", help="Tree file written by Tree.save. Fits (and saves) a tree if left out.")
+    parser.add_argument("--k", type=int, default=14, help="Number of clusters of the fitted tree.")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS, help="Backends to check.")
+    parser.add_argument("--seed", type=int, default=43)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    X, feature_names = ColumnStore(data_source()).features()
+    if args.tree is not None:
+        tree = Tree.Tree.load(args.tree)
+    else:
+        tree = Tree.Tree(k=args.k, compact=True)
+        tree.fit(X, provider=BatchKMeansProvider(args.k, random_state=args.seed).fit(X))
+        tree.save(args.out + ".exkmc")
+
+    for path in write_sources(tree, args.out, feature_names, X.dtype):
+        print("Wrote %s" % path)
+    mismatches = check_equivalence(tree, np.asarray(X), args.backends)
+    for backend, count in mismatches.items():
+        print("%-6s %d / %d samples differ from Tree.predict" % (backend, count, X.shape[0]))
+    return 1 if any(count > 0 for count in mismatches.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+# % Serve cluster lookups of a fitted tree:           %
+# % $ python3 serve_tree.py --tree t.exkmc            %
+# % Load test it (in process, per batch size):        %
+# % $ python3 serve_tree.py --bench --batch 1 64 256  %
+# % t.exkmc is written by Tree.save. Without --tree, a %
+# % tree is fitted on the dataset first.               %
+# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import argparse
+import asyncio
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider
+from ExplainableKMC.serving import (DEFAULT_HOST, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_QUEUE, DEFAULT_MAX_WAIT,
+                                    DEFAULT_PORT, InferenceServer, generate_load, serve)
+from sw_explainable import load_features
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve single record cluster lookups of a fitted tree over a "
+                                                 "local socket, with micro-batching, or load test the server.")
+    parser.add_argument("--tree", help="Tree file written by Tree.save. Fits a tree on the dataset if left out.")
+    parser.add_argument("--k", type=int, default=14, help="Number of clusters of the fitted tree.")
+    parser.add_argument("--seed", type=int, default=43)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="Listen on this Unix socket instead of host:port.")
+    parser.add_argument("--batch", type=int, nargs="+", default=[DEFAULT_MAX_BATCH_SIZE],
+                        help="Max batch size (several values with --bench).")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT * 1e3,
+                        help="Milliseconds a request may wait for its batch to fill.")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="Requests waiting for a batch beyond which connections are not read any further.")
+    parser.add_argument("--bench", action="store_true", help="Load test an in process server instead of serving.")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests sent per load test.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients of the load test.")
+    return parser.parse_args(argv)
+
+
+def load_tree(args, X):
+    if args.tree is not None:
+        return Tree.Tree.load(args.tree)
+    tree = Tree.Tree(k=args.k, compact=True)
+    tree.fit(X, provider=BatchKMeansProvider(args.k, random_state=args.seed).fit(X))
+    return tree
+
+
+async def bench(tree, X, args):
+    '''
+    Load test a server per max batch size, checking every answer against Tree.predict, and time Tree.predict
+    called on one record at a time for reference
+    '''
+    rows = np.asarray(X[:args.requests])
+    expected = tree.predict(rows)
+    n_single = min(args.requests, 2000)
+    start = time.perf_counter()
+    for i in range(n_single):
+        tree.predict(rows[i:i + 1])
+    results = [{"max_batch": "predict(1 row)", "throughput": n_single / (time.perf_counter() - start)}]
+
+    for max_batch_size in args.batch:
+        server = InferenceServer(tree, max_batch_size, args.max_wait_ms * 1e-3, args.max_queue)
+        await server.start(args.host, args.port, args.unix)
+        try:
+            load = await generate_load(rows, args.requests, args.concurrency, args.host, args.port, args.unix)
+        finally:
+            await server.close()
+        mismatches = int((load["clusters"] != expected[np.arange(args.requests) % rows.shape[0]]).sum())
+        if mismatches > 0:
+            raise Exception("%d answers differ from Tree.predict" % mismatches)
+        latencies = load["latencies"] * 1e3
+        stats = server.stats.summary()
+        results.append({"max_batch": max_batch_size,
+                        "throughput": load["throughput"],
+                        "mean_batch": stats["mean_batch"],
+                        "p50_ms": np.percentile(latencies, 50),
+                        "p95_ms": np.percentile(latencies, 95),
+                        "p99_ms": np.percentile(latencies, 99),
+                        "server_p50_ms": stats["p50_ms"]})
+    return pd.DataFrame(results)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    X, _ = load_features()
+    tree = load_tree(args, X)
+    if args.bench:
+        table = asyncio.run(bench(tree, X, args))
+        with pd.option_context("display.width", 200, "display.max_columns", None):
+            print(table.to_string(index=False, float_format="%.3f"))
+        return 0
+
+    print("Serving on %s" % (args.unix if args.unix is not None else "%s:%d" % (args.host, args.port)))
+    try:
+        asyncio.run(serve(tree, args.host, args.port, args.unix, args.batch[0], args.max_wait_ms * 1e-3,
+                          args.max_queue))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
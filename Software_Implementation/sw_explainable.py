@@ -1,10 +1,13 @@
 # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 # % How To Run This Script:                           %
 # % 1.$ pip install -r requirements.txt               %
-# % 2.$ python3 sw_explainable.py T/F T/F             %
+# % 2.$ python3 sw_explainable.py T/F T/F [sampler]   %
 # % First True/False is for graphing over 50 runs     %
 # % Second True/False is for if we want to run with   %
 # % hardware acceleration                             %
+# % Optional sampler (rapl/replay/synthetic/auto)     %
+# % measures the energy of each pipeline stage        %
+# % For per stage timings and sweeps, see benchmark.py%
 # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
 
@@ -17,8 +20,13 @@ import sys
 import numpy as np
 import pandas as pd
 
-from ExplainableKMC import Tree
-from sklearn.cluster import KMeans
+from ExplainableKMC import Tree, render
+from ExplainableKMC.centroids import BatchKMeansProvider, FixedCentroidProvider
+from ExplainableKMC.cache import ArtifactCache, cache_key, hash_array
+from ExplainableKMC.datastore import ColumnStore
+from ExplainableKMC.energy import (EnergyMeter, PWR_ELAPSED_COLUMN, PWR_POWER_COLUMN, RaplSampler, ReplaySampler,
+                                   SyntheticSampler, default_sampler, read_power_gadget)
+from ExplainableKMC.profiling import NULL_CONTEXT
 import time
 import matplotlib.pyplot as plt
 import statistics
@@ -30,28 +38,124 @@ def main():
     - Establish arrays for timing if we choose to time over 50 runs
     - If 2nd argument is True, we are timing, else we just run once
     
-    Optionally, we can plot our power consumption. We read the power csv
-    fron Intel Power Gadget.
+    If a 3rd argument names an energy sampler, the energy of each stage (load, kmeans, label, tree build,
+    render) is measured, summed over the runs, printed and its power trace plotted. plot_power() alone plots
+    the Intel Power Gadget csv in PowerData.
     '''
     total_times = []
     k_means_times = []
     exkmc_times = []
+    meter = energy_meter_requested()
 
-    # Loop for testing time over 50 Runs
-    if sys.argv[1] is True:
+    # Loop for testing time over 50 Runs. The cache is off so that every run does the full work.
+    # Every run only exports its tree, the last one is rendered once the runs are done.
+    if timing_requested():
         for i in range(50):
-            total, kmeans, exkmc = run()
+            total, kmeans, exkmc = run(cache_dir=None, meter=meter)
             total_times.append(total)
             k_means_times.append(kmeans)
             exkmc_times.append(exkmc)
         plot(total_times,k_means_times,exkmc_times, 50)
     
     else:
-        total, kmeans, exkmc = run()
-    
-    # plot_power() # UNCOMMENT FOR POWER DATA PLOTTING, WHERE CSV IS IN POWERDATA
+        total, kmeans, exkmc = run(meter=meter)
+    render_output_tree(meter)
+
+    if meter is not None:
+        print(meter.summary())
+        times, watts = meter.power_trace()
+        plot_power(times, watts, "Power of the Explainable ML Pipeline (%s sampler)" % meter.sampler.name)
     
-def run():
+DATA_PATH = r"../Data/Mental_Health_Cleaned_524288.csv"
+# Shipped form of the dataset, read directly when the csv was not extracted
+DATA_ZIP_PATH = r"../Data/Mental_Health_Cleaned_524288.zip"
+CACHE_DIR = r"../Data/.exkmc_cache"
+OUTPUT_TREE = "Output_Tree"
+POWER_DATA = r"PowerData/PwrData.csv"
+POWER_PLOT = "power.png"
+
+# Centroids computed by the ASIC for k = 14 (see Centroids.txt)
+ASIC_CENTROIDS = np.array([[6, 3, 4, 3, 1, 0, 0, 0, 1, 0, 4, 2, 1, 1, 1, 0],
+                           [7, 3, 3, 4, 1, 0, 0, 0, 1, 0, 0, 3, 1, 5, 1, 1],
+                           [6, 0, 4, 4, 2, 0, 0, 0, 1, 0, 2, 2, 3, 1, 0, 0],
+                           [4, 2, 4, 4, 1, 0, 0, 0, 1, 0, 4, 2, 1, 5, 0, 0],
+                           [11, 4, 3, 3, 1, 0, 0, 0, 1, 1, 4, 0, 2, 1, 1, 0],
+                           [11, 0, 4, 3, 2, 0, 1, 0, 1, 0, 3, 0, 0, 5, 2, 1],
+                           [9, 3, 4, 4, 1, 0, 0, 0, 1, 0, 4, 1, 1, 2, 1, 0],
+                           [5, 2, 4, 3, 1, 0, 0, 0, 1, 0, 2, 3, 1, 1, 1, 0],
+                           [7, 3, 3, 4, 1, 0, 0, 0, 1, 0, 0, 2, 2, 5, 1, 1],
+                           [6, 3, 4, 4, 1, 0, 0, 0, 1, 0, 0, 1, 1, 5, 1, 1],
+                           [6, 4, 4, 4, 1, 0, 0, 1, 0, 0, 6, 0, 3, 1, 1, 0],
+                           [6, 3, 4, 3, 2, 0, 0, 1, 0, 1, 2, 2, 6, 0, 0, 0],
+                           [8, 0, 0, 0, 0, 0, 0, 0, 0, 0, 4, 1, 0, 0, 0, 0],
+                           [7, 3, 3, 4, 1, 0, 0, 0, 1, 0, 0, 0, 1, 1, 1, 0]], dtype=np.double)
+
+
+def timing_requested():
+    '''
+    The first command line argument (T/F) says whether we time the pipeline over 50 runs
+    '''
+    return len(sys.argv) > 1 and sys.argv[1].lower() in ("t", "true")
+
+
+def hardware_accel_requested():
+    '''
+    The second command line argument (T/F) says whether we run off of the centroids from the ASIC
+    '''
+    return len(sys.argv) > 2 and sys.argv[2].lower() in ("t", "true")
+
+
+def energy_meter_requested():
+    '''
+    The optional third command line argument picks the energy sampler: rapl (Linux powercap counters),
+    replay (replays PowerData/PwrData.csv), synthetic (CPU time based stand-in) or auto (the first available)
+    '''
+    if len(sys.argv) <= 3:
+        return None
+    samplers = {"rapl": RaplSampler,
+                "replay": lambda: ReplaySampler(POWER_DATA),
+                "synthetic": SyntheticSampler,
+                "auto": lambda: default_sampler(POWER_DATA)}
+    name = sys.argv[3].lower()
+    if name not in samplers:
+        raise Exception("Unknown energy sampler %s, expected one of %s" % (name, ", ".join(samplers)))
+    return EnergyMeter(samplers[name]())
+
+
+def energy_stage(meter, name):
+    return NULL_CONTEXT if meter is None else meter.stage(name)
+
+
+def default_provider(k, hardware_accel):
+    '''
+    Pick the centroid stage: the ASIC centroids as they are, or full batch KMeans.
+    Other options live in ExplainableKMC/centroids.py, e.g. MiniBatchKMeansProvider (streamed chunks) or
+    WarmStartKMeansProvider.from_file("Centroids.txt") to refine the ASIC centroids, and can be passed to run().
+    '''
+    if hardware_accel:
+        return FixedCentroidProvider(ASIC_CENTROIDS)
+    return BatchKMeansProvider(k, random_state=43, max_iter=500)
+
+
+def data_source():
+    '''
+    The extracted csv if there is one, else the zip archive it ships in
+    '''
+    return DATA_PATH if os.path.exists(DATA_PATH) else DATA_ZIP_PATH
+
+
+def load_features():
+    '''
+    Read the feature columns (everything but the MH1 label) of the dataset.
+    The csv (or zip) is converted once into a binary, column major store next to it (see ExplainableKMC/datastore.py),
+    which is memory mapped afterwards instead of parsing the csv again. The store is rebuilt when the source changes.
+    Every feature is a small non-negative integer (see the kmeans_1way.sv header), so the store holds uint8 and
+    the Tree keeps it that way (compact=True) instead of upcasting to float64.
+    '''
+    return ColumnStore(data_source()).features()
+
+
+def run(provider=None, cache_dir=CACHE_DIR, renderer=None, meter=None):
     '''
     Here, we actually run the K-Means to ExKMC pipeline, which can be done in two ways depending
     on whether or not we are running with output from the Hardware Acceleration
@@ -59,67 +163,107 @@ def run():
     To set whether we are running with hardware acceleration output, set the 3rd argument either
     True (We are) or False (We aren't) 
 
+    The centroid stage is a CentroidProvider: pass one in to trade clustering quality against latency,
+    otherwise default_provider picks one from the arguments. It reports the time and inertia it reached.
+
+    Every stage (centroids, labels, fitted tree) is cached under cache_dir, keyed on a hash
+    of its inputs, and skipped when its inputs did not change. Pass cache_dir=None to always recompute.
+
+    The fitted tree is written to Output_Tree.gv and Output_Tree.json once the timing is done. Its image is
+    only rendered if a TreeRenderer is passed in, on the renderer's background thread; a viewer is never opened.
+
+    Given an EnergyMeter (see ExplainableKMC/energy.py), the load, kmeans, label and tree build stages are
+    measured with it.
+
     Local timing is establish here, and we're interested in timing the entire execution of run(), 
     and the time it takes to do KMeans and ExKMC.
     '''
-    start = time.time()
-    frame = pd.read_csv(r"../Data/Mental_Health_Cleaned_524288.csv")
-
-    X = frame.drop('MH1', axis=1)
+    start = time.perf_counter()
+    cache = None if cache_dir is None else ArtifactCache(cache_dir)
+    with energy_stage(meter, "load"):
+        X, feature_names = load_features()
+        data_key = hash_array(X)
 
-    
-    kmeans_start = time.time()
+    kmeans_start = time.perf_counter()
     k = 14
-    
-    kmeans = KMeans(k, random_state=43, max_iter=500)
-    
-    # We are not running based off of centroids from the ASIC
-    if sys.argv[2] is False: 
-        kmeans.fit(X)
-        clusters = kmeans.cluster_centers_
-        k_means_finish = time.time() - kmeans_start
-        print("KMeans Execution Time: %f" % k_means_finish)
-    # We are running based off of centroids from the ASIC
-    else:
-        clusters = np.array([[6, 3, 4, 3, 1, 0, 0, 0, 1, 0, 4, 2, 1, 1, 1, 0],
-                            [7, 3, 3, 4, 1, 0, 0, 0, 1, 0, 0, 3, 1, 5, 1, 1],
-                            [6, 0, 4, 4, 2, 0, 0, 0, 1, 0, 2, 2, 3, 1, 0, 0],
-                            [4, 2, 4, 4, 1, 0, 0, 0, 1, 0, 4, 2, 1, 5, 0, 0],
-                            [11, 4, 3, 3, 1, 0, 0, 0, 1, 1, 4, 0, 2, 1, 1, 0],
-                            [11, 0, 4, 3, 2, 0, 1, 0, 1, 0, 3, 0, 0, 5, 2, 1],
-                            [9, 3, 4, 4, 1, 0, 0, 0, 1, 0, 4, 1, 1, 2, 1, 0],
-                            [5, 2, 4, 3, 1, 0, 0, 0, 1, 0, 2, 3, 1, 1, 1, 0], 
-                            [7, 3, 3, 4, 1, 0, 0, 0, 1, 0, 0, 2, 2, 5, 1, 1],
-                            [6, 3, 4, 4, 1, 0, 0, 0, 1, 0, 0, 1, 1, 5, 1, 1],
-                            [6, 4, 4, 4, 1, 0, 0, 1, 0, 0, 6, 0, 3, 1, 1, 0],
-                            [6, 3, 4, 3, 2, 0, 0, 1, 0, 1, 2, 2, 6, 0, 0, 0],
-                            [8, 0, 0, 0, 0, 0, 0, 0, 0, 0, 4, 1, 0, 0, 0, 0],
-                            [7, 3, 3, 4, 1, 0, 0, 0, 1, 0, 0, 0, 1, 1, 1, 0]], dtype=np.double)
+    if provider is None:
+        provider = default_provider(k, hardware_accel_requested())
+    centroids_key = cache_key(data_key, provider.params())
+    with energy_stage(meter, "kmeans"):
+        arrays = None if cache is None else cache.load("centroids", centroids_key)
+        if arrays is not None:
+            provider.restore(arrays["centers"], float(arrays["inertia"]), int(arrays["n_iter"]))
+        else:
+            provider.fit(X)
+            if cache is not None:
+                cache.store("centroids", centroids_key, {"centers": provider.cluster_centers_,
+                                                         "inertia": provider.inertia_,
+                                                         "n_iter": provider.n_iter_})
+    k_means_finish = time.perf_counter() - kmeans_start
+    print("KMeans Execution Time: %f" % k_means_finish)
+    report = provider.report()
+    print("Centroid provider: %s (inertia %f, %d iterations)" % (report["provider"], report["inertia"],
+                                                                  report["n_iter"]))
 
     # Start timing ExKMC
-    start_ExKMC = time.time()
+    start_ExKMC = time.perf_counter()
     # Establish Tree with k clusters for leaves, the number of features
-    tree = Tree.Tree(k=k)
-    # Fit Tree, passing in input data, clusters, T/F for hardware, and either a full
-    # or empty sklearn.kmeans object
-    tree.fit(X, clusters, sys.argv[2], kmeans)
-    # Plot the Tree
-    tree.plot(filename="Output_Tree", feature_names=X.columns)
-    
+    tree = Tree.Tree(k=k, compact=True, n_jobs=os.cpu_count())
+    centers_key = hash_array(provider.cluster_centers_)
+    tree_key = cache_key(data_key, centers_key, tree.params())
+    arrays = None if cache is None else cache.load("tree", tree_key)
+    if arrays is not None:
+        tree.from_arrays(arrays)
+    else:
+        def predict_labels():
+            return {"labels": provider.predict(X).astype(np.int32)}
+        with energy_stage(meter, "label"):
+            if cache is None:
+                labels = predict_labels()["labels"]
+            else:
+                labels = cache.get_or_compute("labels", cache_key(data_key, centers_key), predict_labels)["labels"]
+        # Fit Tree, passing in input data, the fitted centroid provider and the labels it assigns
+        with energy_stage(meter, "tree_build"):
+            tree.fit(X, provider=provider, labels=labels)
+        if cache is not None:
+            cache.store("tree", tree_key, tree.to_arrays())
+
     # Finish timing the execution
-    finish_ExKMC = time.time() - start_ExKMC
+    finish_ExKMC = time.perf_counter() - start_ExKMC
     print("ExKMC Execution Time: %f" % finish_ExKMC)
 
+    # Export the Tree outside the timed section, the image is rendered in the background if a renderer is given
+    tree.export(OUTPUT_TREE, feature_names)
+    if renderer is not None:
+        tree.plot(filename=OUTPUT_TREE, feature_names=feature_names, renderer=renderer)
+
     
     # Finish Script timing
-    finish = time.time() - start
+    finish = time.perf_counter() - start
     print("Total Execution Time: %f " % finish)
+    if cache is not None:
+        print("Cache: %(hits)d hits, %(misses)d misses" % cache.stats())
     
     
     
     return finish, k_means_finish, finish_ExKMC    
 
 
+def render_output_tree(meter=None):
+    '''
+    Render the exported Output_Tree.gv into Output_Tree.gv.png on a background renderer, without opening a viewer.
+    Skipped with a message when graphviz is not installed. The render stage is measured by meter if given.
+    '''
+    if not render.graphviz_available:
+        print("graphviz is not installed, %s.gv was not rendered" % OUTPUT_TREE)
+        return
+    with energy_stage(meter, "render"), render.TreeRenderer() as renderer:
+        with open(OUTPUT_TREE + ".gv") as f:
+            renderer.submit(f.read(), OUTPUT_TREE)
+    for filename, error in renderer.errors:
+        print("Could not render %s: %s" % (filename, error))
+
+
 # The Functions Below Plot Data, Either Time or Power Output
 def plot(total, kmeans, exkmc, steps):
     fig, ax = plt.subplots()
@@ -161,19 +305,22 @@ def plot(total, kmeans, exkmc, steps):
     print(statistics.mean(exkmc))
     print(statistics.stdev(exkmc))
 
-def plot_power():
-    frame = pd.read_csv(r"PowerData/PwrData.csv")
+def plot_power(times=None, watts=None, title=None):
+    '''
+    Plot a power trace into power.png. Without a trace, plots the Intel Power Gadget csv in PowerData.
+    '''
+    if times is None:
+        frame = read_power_gadget(POWER_DATA)
+        times, watts = frame[PWR_ELAPSED_COLUMN], frame[PWR_POWER_COLUMN]
+        title = "Power Required to Execute Explainable ML Over %s Measurements" % len(times)
     fig, ax = plt.subplots()
 
-    ax.plot(frame["System Time"], frame["Processor Power_0(Watt)"])
+    ax.plot(times, watts)
 
-    ax.set(xlabel='Time', ylabel='Power (W)',
-        title="Power Required to Execute Explainable ML Over %s Measurements" % len(frame["System Time"]))
-    start, end = ax.get_xlim()
-    ax.xaxis.set_ticks(np.arange(start, end, 50))
-    # ax.grid()
+    ax.set(xlabel='Time (s)', ylabel='Power (W)', title=title)
+    ax.grid()
 
-    fig.savefig("total_time.png")
+    fig.savefig(POWER_PLOT)
     plt.show()
 
         
@@ -0,0 +1,44 @@
+# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+# % Fit centroids and trees for a range of k:         %
+# % $ python3 sweep_k.py --k 8 20 --out sweep.csv     %
+# % Prints k-means cost, tree costs and timings per k %
+# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from ExplainableKMC import Tree
+from sw_explainable import load_features
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fit centroids and threshold trees for every k of a range, "
+                                                 "sharing the work that does not depend on k.")
+    parser.add_argument("--k", type=int, nargs=2, default=[8, 20], metavar=("MIN", "MAX"),
+                        help="Range of k, both ends included.")
+    parser.add_argument("--leaves-factor", type=float, default=1.0, help="max_leaves of each tree, times k.")
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count(), help="Trees built concurrently.")
+    parser.add_argument("--splitter", default="auto", choices=Tree.SPLITTERS)
+    parser.add_argument("--seed", type=int, default=43)
+    parser.add_argument("--out", help="Optional csv file the table is written to.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    X, _ = load_features()
+    table, _ = Tree.Tree.sweep(X, range(args.k[0], args.k[1] + 1),
+                               max_leaves=lambda k: max(k, int(args.leaves_factor * k)), n_jobs=args.n_jobs,
+                               random_state=args.seed, splitter=args.splitter)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(table.to_string(index=False))
+    if args.out is not None:
+        table.to_csv(args.out, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
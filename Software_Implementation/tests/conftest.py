@@ -0,0 +1,87 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SPLITTERS_DIR = os.path.join(ROOT, "ExplainableKMC", "splitters")
+# The scripts import ExplainableKMC from Software_Implementation, and the splitters package imports its compiled
+# extensions as top level modules
+for path in (ROOT, SPLITTERS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+try:
+    import cut_finder  # noqa: F401
+    import hist_cut_finder  # noqa: F401
+except ImportError:
+    pytest.exit("The cut finders are not built, run python setup.py build_ext --inplace in %s" % SPLITTERS_DIR)
+
+from ExplainableKMC import hw_codec  # noqa: E402
+from ExplainableKMC.centroids import BatchKMeansProvider  # noqa: E402
+
+K = 5
+
+
+def blobs(n, d=6, k=K, n_bins=16, spread=4, seed=0):
+    '''
+    Integer samples in [0, n_bins) drawn around k random centers, like the (small integer) features of the dataset
+    '''
+    rng = np.random.default_rng(seed)
+    centers = rng.integers(2, n_bins - 2, size=(k, d))
+    x_data = centers[rng.integers(k, size=n)] + rng.integers(-spread, spread + 1, size=(n, d))
+    return np.clip(x_data, 0, n_bins - 1).astype(np.uint8)
+
+
+def element_rows(n, fields=hw_codec.ELEMENT_FIELDS, seed=0):
+    '''
+    Random field values of n hardware elements
+    '''
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.integers(0, 1 << width, size=n) for _, _, width in fields]).astype(np.uint8)
+
+
+def drift(seed=0):
+    '''
+    Two clusters around (3, 3) and (10, 10), then batches of samples of the first one spread along column 0 up to
+    8, that the IMM cut between them (on column 0, around 4) sends to the second one
+    '''
+    rng = np.random.default_rng(seed)
+    x_data = np.vstack([np.array([3, 3]) + rng.integers(-1, 2, size=(500, 2)),
+                        np.array([10, 10]) + rng.integers(-1, 2, size=(500, 2))])
+    batches = [np.column_stack([rng.integers(4, 9, size=1000), rng.integers(0, 4, size=1000)]) for _ in range(3)]
+    return x_data, batches
+
+
+def walk(root, x_data):
+    '''
+    Reference predict: route each sample down the Node tree one at a time
+    '''
+    clusters = np.empty(x_data.shape[0], dtype=np.int64)
+    for i, row in enumerate(x_data):
+        node = root
+        while not node.is_leaf():
+            node = node.left if row[node.feature] <= node.value else node.right
+        clusters[i] = node.value
+    return clusters
+
+
+def assert_same_tree(tree, other):
+    '''
+    Node by node equality of two fitted trees, in breadth-first order
+    '''
+    flat, other_flat = tree.compile(), other.compile()
+    assert flat.n_nodes == other_flat.n_nodes
+    for name in ("feature", "threshold", "left", "right", "value"):
+        np.testing.assert_array_equal(getattr(flat, name), getattr(other_flat, name), err_msg=name)
+
+
+@pytest.fixture(scope="session")
+def x_data():
+    return blobs(3000)
+
+
+@pytest.fixture(scope="session")
+def provider(x_data):
+    return BatchKMeansProvider(K, random_state=0).fit(x_data)
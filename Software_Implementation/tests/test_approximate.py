@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.approximate import _column_runner_up, _mistakes_mask
+from ExplainableKMC.centroids import BatchKMeansProvider
+
+from .conftest import K, assert_same_tree, blobs
+
+REPORT_KEYS = {"sample_size", "nodes", "grown", "exact", "sample_rows", "max_node_rows", "estimated_mistakes",
+               "mistakes", "mistake_rate", "cost", "surrogate_cost", "exact_mistakes", "exact_mistake_rate",
+               "exact_cost", "exact_surrogate_cost", "cost_gap", "surrogate_gap"}
+
+
+@pytest.fixture(scope="module")
+def large():
+    x_data = blobs(40000, spread=2, seed=4)
+    return x_data, BatchKMeansProvider(K, random_state=0).fit(x_data)
+
+
+def test_sample_size_past_n_is_exact(x_data, provider):
+    exact = Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, provider=provider)
+    tree = Tree.Tree(k=K, max_leaves=2 * K, sample_size=x_data.shape[0]).fit(x_data, provider=provider)
+    assert_same_tree(exact, tree)
+    assert tree.approximation_report() is None
+
+
+@pytest.mark.parametrize("splitter", ['sort', 'hist'])
+def test_sampled_build(large, splitter):
+    x_data, provider = large
+    exact = Tree.Tree(k=K, splitter=splitter).fit(x_data, provider=provider)
+    tree = Tree.Tree(k=K, splitter=splitter, sample_size=2000, random_state=0).fit(x_data, provider=provider)
+    report = tree.approximation_report(exact)
+    assert set(report) == REPORT_KEYS
+    assert report["nodes"] == K - 1 and report["sample_size"] == 2000
+    assert report["max_node_rows"] < x_data.shape[0] // 2
+    # Well separated clusters: the sampled cuts make the same clusters as the exact ones
+    np.testing.assert_array_equal(tree.predict(x_data), exact.predict(x_data))
+    assert report["cost_gap"] == pytest.approx(0.0, abs=1e-12) and report["mistakes"] == report["exact_mistakes"]
+    # The statistics of the tree are computed on all the rows
+    assert tree.fit_evaluation()["n"] == x_data.shape[0] and tree.to_arrays()["samples"][0] == x_data.shape[0]
+
+
+def test_sampled_build_is_seeded(large):
+    x_data, provider = large
+    trees = [Tree.Tree(k=K, max_leaves=2 * K, sample_size=300, random_state=1).fit(x_data, provider=provider)
+             for _ in range(2)]
+    assert_same_tree(trees[0], trees[1])
+    assert trees[0].approximation_report() == trees[1].approximation_report()
+
+
+def test_column_runner_up():
+    rng = np.random.default_rng(0)
+    valid = np.array([2.0, 5.0, 9.0, 12.0])
+    for _ in range(20):
+        center_col = valid[rng.integers(4, size=300)]
+        x_col = np.clip(center_col + rng.integers(-4, 5, size=300), 0, 15).astype(np.float64)
+        threshold = valid[rng.integers(3)]
+        runner_up = _column_runner_up(x_col, center_col, valid, threshold)
+
+        # Brute force over every threshold that splits the samples or the centers differently
+        best = None
+        for candidate in np.union1d(x_col, valid):
+            if not valid.min() <= candidate < valid.max():
+                continue
+            if ((x_col <= candidate) == (x_col <= threshold)).all() and \
+                    ((valid <= candidate) == (valid <= threshold)).all():
+                continue
+            mistakes = np.count_nonzero(_mistakes_mask(x_col, center_col, candidate))
+            if best is None or mistakes < best:
+                best = mistakes
+        assert np.count_nonzero(_mistakes_mask(x_col, center_col, runner_up)) == best
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from ExplainableKMC import hw_codec
+from ExplainableKMC.asic_emulator import ASICEmulator, ECD_FIELDS, ECD_XOR_FIELDS, PIPELINE_LATENCY, \
+    RESET_CENTROIDS, RESET_CYCLES, dc_select, ecd_distances, label_elements
+from ExplainableKMC.centroids import ASICEmulatorProvider
+
+from .conftest import ROOT, element_rows
+
+SYS_DEFS_PATH = os.path.join(os.path.dirname(ROOT), "Hardware_Implementation", "sys_defs.svh")
+
+
+def field(word, name):
+    lsb, width = {name: (lsb, width) for name, lsb, width in hw_codec.ELEMENT_FIELDS}[name]
+    return (int(word) >> lsb) & ((1 << width) - 1)
+
+
+def reference_distance(element, centroid):
+    '''
+    e2cd for one element and one centroid, in unsigned modular arithmetic like the RTL registers
+    '''
+    distance = 0
+    for name, reg_width, sign_bit, abs_width in ECD_FIELDS:
+        diff = (field(element, name) - field(centroid, name)) % (1 << reg_width)
+        distance += (-diff if (diff >> sign_bit) & 1 else diff) % (1 << abs_width)
+    for name in ECD_XOR_FIELDS:
+        distance += field(element, name) ^ field(centroid, name)
+    return distance
+
+
+@pytest.fixture(scope="module")
+def elements():
+    return hw_codec.pack(element_rows(1000, hw_codec.FEATURE_FIELDS), hw_codec.FEATURE_FIELDS)
+
+
+def test_ecd_matches_scalar_model(elements):
+    centroids = np.array([int(word, 2) for word in RESET_CENTROIDS], dtype=np.uint64)
+    distances = ecd_distances(elements[:50], centroids)
+    for i, element in enumerate(elements[:50]):
+        assert distances[i].tolist() == [reference_distance(element, centroid) for centroid in centroids]
+
+
+def test_dc_keeps_larger_distance_lower_index():
+    np.testing.assert_array_equal(dc_select(np.array([[1, 5, 5, 2], [3, 0, 1, 3], [0, 0, 0, 0]])), [1, 0, 0])
+
+
+def test_label_elements(elements):
+    labels = np.arange(elements.shape[0]) % 14
+    np.testing.assert_array_equal(label_elements(elements, labels, 14), hw_codec.set_label(elements, labels))
+
+
+def test_fit(elements):
+    emulator = ASICEmulator(n_iter=20).fit(elements)
+    assert emulator.cluster_centers_.shape == (14, len(hw_codec.FEATURE_FIELDS))
+    report = emulator.report()
+    assert report["n_iter"] == 20 and report["cycles"] == RESET_CYCLES + 20 * emulator.batch_size + PIPELINE_LATENCY
+    np.testing.assert_array_equal(emulator.predict(elements),
+                                  dc_select(ecd_distances(elements, emulator.centroid_words_)))
+    # The csv columns (without MH1) pack into the same elements
+    np.testing.assert_array_equal(ASICEmulator(n_iter=20).fit(hw_codec.unpack(elements, hw_codec.FEATURE_FIELDS))
+                                  .centroid_words_, emulator.centroid_words_)
+
+
+def test_stop_when_stable(elements):
+    # A few distinct elements, started from themselves, so the running averages settle
+    repeated = np.tile(elements[:4], 64)
+    emulator = ASICEmulator(k=4, init=elements[:4], n_iter=1000, stop_when_stable=True).fit(repeated)
+    assert emulator.n_iter_ < 1000
+    np.testing.assert_array_equal(ASICEmulator(k=4, init=elements[:4], n_iter=emulator.n_iter_ + 10).fit(repeated)
+                                  .centroid_words_, emulator.centroid_words_)
+
+
+def test_from_sys_defs():
+    emulator = ASICEmulator.from_sys_defs(SYS_DEFS_PATH)
+    assert emulator.k == 14 and emulator.m == 524288
+
+
+def test_init_required_past_reset_centroids():
+    with pytest.raises(Exception, match='Initial centroids must be given'):
+        ASICEmulator(k=15)
+    with pytest.raises(Exception, match='Expected 3 initial centroids'):
+        ASICEmulator(k=3, init=[0, 1])
+
+
+def test_provider(elements):
+    x_data = hw_codec.unpack(elements, hw_codec.FEATURE_FIELDS)
+    provider = ASICEmulatorProvider(n_iter=20).fit(x_data)
+    np.testing.assert_array_equal(provider.cluster_centers_, ASICEmulator(n_iter=20).fit(x_data).cluster_centers_)
+    assert provider.n_iter_ == 20 and provider.n_cycles_ > 0
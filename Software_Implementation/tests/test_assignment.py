@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.assignment import assign, center_dots, closest_distances
+
+from .conftest import K, assert_same_tree, blobs
+
+
+@pytest.fixture(scope="module")
+def centers():
+    return np.random.default_rng(0).uniform(0, 15, size=(K, 6))
+
+
+def squared_distances(x_data, centers):
+    return ((x_data.astype(np.float64)[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32, np.uint8, np.int16])
+@pytest.mark.parametrize("chunk_size, n_jobs", [(4096, 1), (113, 1), (113, 3)])
+def test_assign_matches_brute_force(centers, dtype, chunk_size, n_jobs):
+    x_data = blobs(2000).astype(dtype)
+    labels = assign(x_data, centers, chunk_size=chunk_size, n_jobs=n_jobs)
+    assert labels.dtype == np.int32
+    np.testing.assert_array_equal(labels, squared_distances(x_data, centers).argmin(axis=1))
+
+
+def test_center_dot(centers):
+    x_data = blobs(500)
+    labels, center_dot = assign(x_data, centers, chunk_size=77, keep_center_dot=True)
+    np.testing.assert_array_equal(labels, assign(x_data, centers))
+    np.testing.assert_allclose(center_dot, x_data.astype(np.float64) @ centers.T)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_center_dots(centers, n_jobs):
+    x_data = blobs(500)
+    np.testing.assert_array_equal(center_dots(x_data, centers, chunk_size=77, n_jobs=n_jobs),
+                                  assign(x_data, centers, chunk_size=77, keep_center_dot=True)[1])
+
+
+@pytest.mark.parametrize("splitter", ['sort', 'hist'])
+def test_fit_with_labels_skips_assignment(x_data, provider, monkeypatch, splitter):
+    '''
+    Given labels are kept, only the dot products the sort based expansion needs are computed
+    '''
+    params = {"k": K, "max_leaves": 2 * K, "splitter": splitter}
+    expected = Tree.Tree(**params).fit(x_data, provider=provider)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the samples were assigned again")
+
+    monkeypatch.setattr(Tree, "assign", fail)
+    tree = Tree.Tree(**params).fit(x_data, provider=provider, labels=provider.predict(x_data))
+    assert_same_tree(expected, tree)
+
+
+def test_closest_distances(centers):
+    x_data = blobs(500)
+    np.testing.assert_allclose(closest_distances(x_data, centers, chunk_size=77),
+                               squared_distances(x_data, centers).min(axis=1))
+    # Never negative, even for the centers themselves
+    distances = closest_distances(centers, centers)
+    assert (distances >= 0).all() and distances.max() < 1e-9
+
+
+def test_hardware_accel_fit(x_data, centers):
+    '''
+    A fit on given centers labels the samples with their closest center
+    '''
+    tree = Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, clusters=centers, hardware_accel=True)
+    np.testing.assert_array_equal(tree.all_centers, centers)
+    np.testing.assert_array_equal(tree.fit_evaluation()["confusion"].sum(axis=1),
+                                  np.bincount(squared_distances(x_data, centers).argmin(axis=1), minlength=K))
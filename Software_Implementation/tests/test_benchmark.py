@@ -0,0 +1,65 @@
+import json
+
+import pandas as pd
+import pytest
+
+import benchmark
+
+from .conftest import blobs
+
+
+@pytest.fixture(scope="module")
+def data_path(tmp_path_factory):
+    frame = pd.DataFrame(blobs(600), columns=["f%d" % i for i in range(6)])
+    frame.insert(3, "MH1", 1)
+    path = str(tmp_path_factory.mktemp("data") / "data.csv")
+    frame.to_csv(path, index=False)
+    return path
+
+
+def results_path(tmp_path, data_path, *args):
+    path = str(tmp_path / "results.json")
+    assert benchmark.main(["--data", data_path, "--sizes", "200", "5000", "--k", "3", "--n-jobs", "1", "2",
+                           "--repeats", "2", "--warmup", "0", "--no-plot", "--out", path] + list(args)) == 0
+    return path
+
+
+def test_results(tmp_path, data_path):
+    with open(results_path(tmp_path, data_path)) as f:
+        results = json.load(f)
+    assert results["meta"]["args"]["k"] == [3]
+    stages = {(entry["stage"], entry["n"], entry["n_jobs"], entry["splitter"]) for entry in results["results"]}
+    assert ("csv_load", 600, None, None) in stages
+    # Sizes are capped at the number of rows
+    assert {("centroids", n, None, None) for n in (200, 600)} <= stages
+    for stage in ("build", "expand", "dot_export"):
+        assert {(stage, n, n_jobs, splitter) for n in (200, 600) for n_jobs in (1, 2)
+                for splitter in ("sort", "hist")} <= stages
+    for entry in results["results"]:
+        assert len(entry["times"]) == 2 and entry["min"] <= entry["median"]
+
+
+def test_baseline_regressions(tmp_path, data_path, monkeypatch):
+    path = results_path(tmp_path, data_path)
+    with open(path) as f:
+        baseline = json.load(f)
+    assert benchmark.compare(baseline["results"], baseline, 0.2) == []
+
+    slow = [dict(entry, median=entry["median"] + 1.0) for entry in baseline["results"]]
+    assert [key for key, _, _ in benchmark.compare(slow, baseline, 0.2)] == \
+           [tuple(entry[name] for name in benchmark.KEY) for entry in baseline["results"]]
+    # Slowdowns below MIN_DELTA are timer noise
+    fast = {"results": [dict(entry, median=benchmark.MIN_DELTA / 100) for entry in baseline["results"]]}
+    noise = [dict(entry, median=benchmark.MIN_DELTA / 2) for entry in baseline["results"]]
+    assert benchmark.compare(noise, fast, 0.2) == []
+
+    # main exits with 1 when a stage regressed
+    args = ["--data", data_path, "--sizes", "200", "--k", "3", "--repeats", "1", "--warmup", "0", "--no-plot",
+            "--baseline", path]
+    monkeypatch.setattr(benchmark, "MIN_DELTA", 0.0)
+    for median, status in ((10.0, 0), (0.0, 1)):
+        for entry in baseline["results"]:
+            entry["median"] = median
+        with open(path, "w") as f:
+            json.dump(baseline, f)
+        assert benchmark.main(args) == status
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.cache import ArtifactCache, cache_key, hash_array
+
+from .conftest import K, assert_same_tree, blobs
+
+
+def tree_key(**kwargs):
+    return cache_key("data", "centers", Tree.Tree(k=K, **kwargs).params())
+
+
+@pytest.mark.parametrize("kwargs", [{"max_leaves": 2 * K}, {"base_tree": 'NONE'}, {"splitter": 'sort'},
+                                    {"compact": True}, {"presort": True}, {"sample_size": 1000},
+                                    {"random_state": 1}])
+def test_build_params_change_the_key(kwargs):
+    assert tree_key(**kwargs) != tree_key()
+
+
+@pytest.mark.parametrize("kwargs", [{"n_jobs": 4}, {"verbose": 2}, {"light": False}])
+def test_other_params_keep_the_key(kwargs):
+    assert tree_key(**kwargs) == tree_key()
+
+
+def test_hash_array_covers_dtype_and_shape():
+    data = np.arange(12, dtype=np.uint8)
+    assert hash_array(data) == hash_array(data.copy())
+    assert hash_array(data) != hash_array(data.astype(np.int8))
+    assert hash_array(data) != hash_array(data.reshape(3, 4))
+
+
+def test_cached_tree_round_trip(tmp_path, x_data, provider):
+    cache = ArtifactCache(str(tmp_path))
+    tree = Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, provider=provider)
+    key = cache_key(hash_array(x_data), hash_array(tree.all_centers), tree.params())
+    assert cache.load("tree", key) is None
+    cache.store("tree", key, tree.to_arrays())
+
+    cached = Tree.Tree(k=K, max_leaves=2 * K).from_arrays(cache.load("tree", key))
+    assert cache.stats() == {"hits": 1, "misses": 1}
+    assert_same_tree(tree, cached)
+    test_data = blobs(500, seed=1)
+    np.testing.assert_array_equal(cached.predict(test_data), tree.predict(test_data))
+    np.testing.assert_array_equal(cached.to_arrays()["samples"], tree.to_arrays()["samples"])
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    array = {"x": np.zeros(1000)}
+    cache = ArtifactCache(str(tmp_path), max_bytes=20000)
+    for key in ("a", "b", "c"):
+        cache.store("labels", key, array)
+        # Make the order of the stores visible to the mtime based eviction
+        os.utime(cache._path("labels", key), (len(os.listdir(str(tmp_path))),) * 2)
+    assert cache.load("labels", "a") is None
+    assert cache.load("labels", "c") is not None
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider, FixedCentroidProvider, MiniBatchKMeansProvider, \
+    WarmStartKMeansProvider, load_centroids
+
+from .conftest import ROOT, K
+
+
+def inertia(x_data, centers):
+    return float((((x_data[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)).min(axis=1).sum())
+
+
+def test_load_centroids():
+    centers = load_centroids(os.path.join(ROOT, "Centroids.txt"))
+    assert centers.shape == (14, 16)
+    np.testing.assert_array_equal(centers[0], [5, 2, 4, 3, 1, 0, 0, 0, 1, 0, 2, 3, 1, 1, 1, 0])
+
+
+def test_batch_report(x_data, provider):
+    report = provider.report()
+    assert report["provider"] == 'batch' and report["k"] == K
+    assert report["fit_time"] > 0 and report["n_iter"] > 0
+    assert report["inertia"] == pytest.approx(inertia(x_data, provider.cluster_centers_))
+    np.testing.assert_array_equal(provider.predict(x_data), provider.kmeans.predict(x_data.astype(np.float64)))
+
+
+def test_warm_start_from_converged_centers(x_data, provider):
+    warm = WarmStartKMeansProvider(provider.cluster_centers_).fit(x_data.astype(np.float64))
+    assert warm.n_iter_ <= 2
+    np.testing.assert_allclose(warm.cluster_centers_, provider.cluster_centers_)
+    assert warm.inertia_ == pytest.approx(provider.inertia_)
+
+
+def test_fixed_centers(x_data, provider):
+    centers = provider.cluster_centers_ + 0.5
+    fixed = FixedCentroidProvider(centers).fit(x_data)
+    np.testing.assert_array_equal(fixed.cluster_centers_, centers)
+    assert fixed.n_iter_ == 0 and fixed.inertia_ == pytest.approx(inertia(x_data, centers))
+
+
+def test_minibatch_sources(tmp_path, x_data):
+    '''
+    An array, a list of blocks and a csv file holding the same samples give the same centroids
+    '''
+    path = str(tmp_path / "data.csv")
+    pd.DataFrame(x_data).to_csv(path, index=False)
+    fitted = [MiniBatchKMeansProvider(K, batch_size=500, chunk_size=1000, n_passes=2, random_state=0).fit(source)
+              for source in (x_data, [x_data[:1000], x_data[1000:2000], x_data[2000:]], path)]
+    for other in fitted[1:]:
+        np.testing.assert_allclose(other.cluster_centers_, fitted[0].cluster_centers_)
+    assert fitted[0].n_iter_ == 2 * x_data.shape[0] // 500
+    assert fitted[0].inertia_ > 0
+
+
+def test_restore(provider):
+    restored = BatchKMeansProvider(K).restore(provider.cluster_centers_, provider.inertia_, provider.n_iter_)
+    assert restored.is_fitted() and restored.report()["fit_time"] == 0.0
+    np.testing.assert_array_equal(restored.cluster_centers_, provider.cluster_centers_)
+
+
+def test_fit_with_provider(x_data, provider):
+    '''
+    fit uses the provider centroids, and fits a provider that is not fitted yet
+    '''
+    tree = Tree.Tree(k=K).fit(x_data, provider=provider)
+    np.testing.assert_array_equal(tree.all_centers, provider.cluster_centers_)
+    fixed = FixedCentroidProvider(provider.cluster_centers_)
+    other = Tree.Tree(k=K).fit(x_data, provider=fixed)
+    assert fixed.is_fitted()
+    np.testing.assert_array_equal(other.predict(x_data), tree.predict(x_data))
@@ -0,0 +1,71 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree, codegen, hw_codec
+from ExplainableKMC.centroids import BatchKMeansProvider
+from ExplainableKMC.flat_tree import FlatTree
+
+from .conftest import K, element_rows
+
+needs_cc = pytest.mark.skipif(shutil.which('cc') is None, reason='no C compiler')
+
+
+@pytest.fixture(scope="module")
+def elements():
+    return element_rows(3000, hw_codec.FEATURE_FIELDS)
+
+
+@pytest.fixture(scope="module")
+def element_tree(elements):
+    return Tree.Tree(k=K, max_leaves=3 * K).fit(elements, provider=BatchKMeansProvider(K, random_state=0)
+                                                 .fit(elements))
+
+
+@needs_cc
+def test_backends_match_predict(element_tree, elements):
+    assert codegen.check_equivalence(element_tree, elements) == {"python": 0, "c": 0, "sv": 0}
+
+
+@needs_cc
+@pytest.mark.parametrize("dtype", [np.float64, np.uint8, np.int16])
+def test_c_kernel_any_memory_order(x_data, provider, dtype):
+    data = x_data.astype(np.float64) + (0.5 if dtype == np.float64 else 0)
+    tree = Tree.Tree(k=K, max_leaves=2 * K).fit(data.astype(dtype), provider=provider)
+    kernel = codegen.CKernel(tree.compile(), dtype)
+    try:
+        for samples in (data.astype(dtype), np.asfortranarray(data.astype(dtype)), data.astype(dtype)[::3, ::-1]):
+            np.testing.assert_array_equal(kernel.predict(samples), tree.predict(samples))
+        with pytest.raises(Exception, match='compiled for'):
+            kernel.predict(data.astype(np.float32))
+    finally:
+        shutil.rmtree(kernel.directory, ignore_errors=True)
+
+
+def test_python_single_leaf(x_data):
+    leaf = Tree.Tree(k=1).fit(x_data, clusters=x_data.mean(axis=0, keepdims=True), hardware_accel=True)
+    assert (codegen.compile_python(leaf.compile())(x_data) == 0).all()
+
+
+def test_sv_constant_conditions(element_tree, elements):
+    '''
+    A threshold below 0, or at the top of the field, does not depend on the element
+    '''
+    flat = FlatTree.from_node(element_tree.tree)
+    (_, _, width), _, _ = codegen.sv_conditions(flat)[0]
+    for threshold, constant in ((-0.5, False), ((1 << width) - 1, True), (1 << width, True)):
+        flat.threshold[0] = threshold
+        assert codegen.sv_conditions(flat)[0][2] is constant
+        np.testing.assert_array_equal(codegen.sv_predict(flat, hw_codec.pack(elements, hw_codec.FEATURE_FIELDS)),
+                                      flat.predict(elements))
+
+
+def test_write_sources(tmp_path, element_tree):
+    paths = codegen.write_sources(element_tree, str(tmp_path), feature_names=[field[0] for field in
+                                                                              hw_codec.FEATURE_FIELDS])
+    assert [path.rsplit('.', 1)[1] for path in paths] == ["py", "c", "sv"]
+    with open(paths[2]) as f:
+        source = f.read()
+    assert "input logic [38:0] element_in" in source
+    assert source.count("label = ") == 3 * K
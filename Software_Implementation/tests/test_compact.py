@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.Tree import compact_dtype, convert_input
+
+from .conftest import K, assert_same_tree, blobs
+
+
+@pytest.mark.parametrize("data, dtype", [(np.array([[0, 255]]), np.uint8),
+                                         (np.array([[-3.0, 100.0]]), np.int8),
+                                         (np.array([[0, 60000]]), np.uint16),
+                                         (np.array([[-1, 60000]]), np.int32),
+                                         (np.array([[0.5, 1.0]]), np.float64),
+                                         (np.array([[0, 2 ** 40]]), np.float64)])
+def test_compact_dtype(data, dtype):
+    assert compact_dtype(data) == dtype
+    np.testing.assert_array_equal(convert_input(data, compact=True), data)
+
+
+def test_compact_input_is_not_copied():
+    data = blobs(100)
+    assert convert_input(data, compact=True) is data
+    assert convert_input(data).dtype == np.float64
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16, np.int32, np.float64])
+def test_compact_tree_matches_float_tree(x_data, provider, dtype):
+    tree = Tree.Tree(k=K, max_leaves=2 * K, splitter='sort').fit(x_data.astype(np.float64), provider=provider)
+    compact = Tree.Tree(k=K, max_leaves=2 * K, splitter='sort', compact=True).fit(x_data.astype(dtype),
+                                                                                 provider=provider)
+    assert_same_tree(tree, compact)
+    test_data = blobs(300, seed=1)
+    np.testing.assert_array_equal(compact.predict(test_data.astype(dtype)), tree.predict(test_data))
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider
+
+from .conftest import K, assert_same_tree, blobs
+
+
+@pytest.fixture(scope="module")
+def float_data():
+    # Not integer valued: the sort based kernels fall back from counting sort to qsort
+    rng = np.random.default_rng(4)
+    return blobs(2000, seed=4) + rng.uniform(-0.5, 0.5, size=(2000, 6))
+
+
+@pytest.mark.parametrize("kwargs", [{"splitter": 'sort'}, {"splitter": 'hist'}, {"presort": True}])
+def test_n_jobs_same_tree(x_data, provider, kwargs):
+    tree = Tree.Tree(k=K, max_leaves=3 * K, n_jobs=1, **kwargs).fit(x_data, provider=provider)
+    parallel = Tree.Tree(k=K, max_leaves=3 * K, n_jobs=3, **kwargs).fit(x_data, provider=provider)
+    assert_same_tree(tree, parallel)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_float_data_matches_presorted_build(float_data, n_jobs):
+    provider = BatchKMeansProvider(K, random_state=0).fit(float_data)
+    tree = Tree.Tree(k=K, splitter='sort', n_jobs=n_jobs).fit(float_data, provider=provider)
+    presorted = Tree.Tree(k=K, presort=True, n_jobs=n_jobs).fit(float_data, provider=provider)
+    assert_same_tree(tree, presorted)
@@ -0,0 +1,80 @@
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ExplainableKMC.datastore import ColumnStore, default_store_dir, narrow_dtype
+
+from .conftest import blobs
+
+
+@pytest.fixture
+def frame():
+    frame = pd.DataFrame(blobs(1000).astype(np.int64), columns=["f%d" % i for i in range(6)])
+    frame.insert(2, "MH1", np.arange(1000) % 13)
+    return frame
+
+
+def write_csv(frame, path):
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("values, dtype", [((0, 255), np.uint8), ((-1, 100), np.int8), ((0, 256), np.uint16),
+                                           ((-129, 0), np.int16), ((0, 2 ** 40), np.int64)])
+def test_narrow_dtype(values, dtype):
+    assert narrow_dtype(*values) == dtype
+
+
+def test_features_and_labels(tmp_path, frame):
+    store = ColumnStore(write_csv(frame, tmp_path / "data.csv"), chunk_size=300)
+    features, columns = store.features()
+    assert store.directory == default_store_dir(store.source) == str(tmp_path / "data.store")
+    assert columns == ["f%d" % i for i in range(6)]
+    assert isinstance(features, np.memmap) and features.dtype == np.uint8 and features.flags.f_contiguous
+    np.testing.assert_array_equal(features, frame.drop("MH1", axis=1).values)
+    np.testing.assert_array_equal(store.labels(), frame["MH1"].values)
+    assert isinstance(store.features(mmap_mode=None)[0], np.ndarray)
+
+
+def test_zip_source(tmp_path, frame):
+    csv_path = write_csv(frame, tmp_path / "data.csv")
+    zip_path = str(tmp_path / "data.zip")
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.write(csv_path, "data.csv")
+    features, _ = ColumnStore(zip_path, directory=str(tmp_path / "zip.store")).features()
+    np.testing.assert_array_equal(features, frame.drop("MH1", axis=1).values)
+
+
+def test_rebuilt_when_the_source_changes(tmp_path, frame):
+    path = write_csv(frame, tmp_path / "data.csv")
+    store = ColumnStore(path).ensure()
+    assert not store.is_stale()
+    built = os.stat(os.path.join(store.directory, "features.npy")).st_mtime_ns
+
+    # Unchanged source: the store is reused
+    store.features()
+    assert os.stat(os.path.join(store.directory, "features.npy")).st_mtime_ns == built
+
+    frame.loc[0, "f0"] = 300
+    write_csv(frame, path)
+    assert store.is_stale()
+    features, _ = store.features()
+    assert features.dtype == np.uint16 and features[0, 0] == 300
+    assert not os.path.exists(store.directory + ".tmp")
+
+
+def test_no_label(tmp_path, frame):
+    store = ColumnStore(write_csv(frame, tmp_path / "data.csv"), label=None)
+    features, columns = store.features()
+    assert "MH1" in columns and features.shape == frame.shape
+    with pytest.raises(Exception, match='no label column'):
+        store.labels()
+
+
+def test_non_integer_source(tmp_path, frame):
+    frame["f0"] = frame["f0"] + 0.5
+    with pytest.raises(Exception, match='non integer values'):
+        ColumnStore(write_csv(frame, tmp_path / "data.csv")).features()
@@ -0,0 +1,113 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from ExplainableKMC import energy
+
+from .conftest import ROOT
+
+PWR_DATA_PATH = os.path.join(ROOT, "PowerData", "PwrData.csv")
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_read_power_gadget():
+    frame = energy.read_power_gadget(PWR_DATA_PATH)
+    assert {energy.PWR_ELAPSED_COLUMN, energy.PWR_ENERGY_COLUMN, energy.PWR_POWER_COLUMN} <= set(frame.columns)
+    # The summary at the end of the log is left out
+    assert np.isfinite(frame[energy.PWR_ENERGY_COLUMN].values.astype(np.float64)).all()
+    assert (np.diff(frame[energy.PWR_ELAPSED_COLUMN].values) > 0).all()
+
+
+def test_replay_sampler():
+    frame = energy.read_power_gadget(PWR_DATA_PATH)
+    elapsed = frame[energy.PWR_ELAPSED_COLUMN].values - frame[energy.PWR_ELAPSED_COLUMN].values[0]
+    joules = frame[energy.PWR_ENERGY_COLUMN].values - frame[energy.PWR_ENERGY_COLUMN].values[0]
+    clock = Clock()
+    sampler = energy.ReplaySampler(PWR_DATA_PATH, clock)
+    assert sampler.read() == 0.0
+    clock.now = elapsed[3]
+    assert sampler.read() == pytest.approx(joules[3])
+    # Past its end, the log starts over
+    clock.now = 2 * elapsed[-1] + elapsed[3]
+    assert sampler.read() == pytest.approx(2 * joules[-1] + joules[3])
+
+
+def write_domain(directory, name, energy_uj, max_range=1000000):
+    domain = directory / name
+    domain.mkdir(exist_ok=True)
+    (domain / "energy_uj").write_text("%d\n" % energy_uj)
+    (domain / "max_energy_range_uj").write_text("%d\n" % max_range)
+
+
+def test_rapl_sampler(tmp_path):
+    assert not energy.RaplSampler.available(str(tmp_path))
+    write_domain(tmp_path, "intel-rapl:0", 900000)
+    write_domain(tmp_path, "intel-rapl:1", 0)
+    # Subdomains are included in their package, and are not counted twice
+    write_domain(tmp_path, "intel-rapl:0:0", 0)
+    sampler = energy.RaplSampler(str(tmp_path))
+    assert len(sampler.domains) == 2
+    write_domain(tmp_path, "intel-rapl:0", 950000)
+    write_domain(tmp_path, "intel-rapl:0:0", 500000)
+    assert sampler.read() == pytest.approx(0.05)
+    # The counter of package 0 wraps around
+    write_domain(tmp_path, "intel-rapl:0", 100000)
+    write_domain(tmp_path, "intel-rapl:1", 250000)
+    assert sampler.read() == pytest.approx(0.05 + 0.15 + 0.25)
+
+
+def test_default_sampler(monkeypatch):
+    monkeypatch.setattr(energy.RaplSampler, "available", classmethod(lambda cls, powercap_dir=None: False))
+    assert isinstance(energy.default_sampler(PWR_DATA_PATH), energy.ReplaySampler)
+    assert isinstance(energy.default_sampler(), energy.SyntheticSampler)
+
+
+class CountingSampler:
+    '''
+    1 joule more at every read
+    '''
+
+    def __init__(self):
+        self.reads = 0
+
+    def read(self):
+        self.reads += 1
+        return float(self.reads)
+
+
+def test_meter_stages():
+    meter = energy.EnergyMeter(CountingSampler(), interval=60)
+    for name in ("kmeans", "build", "kmeans"):
+        with meter.stage(name):
+            pass
+    report = meter.report()
+    assert report["name"].tolist() == ["kmeans", "build", "kmeans", "total"]
+    # A stage reads the sampler when it starts and when it ends
+    assert report["joules"].tolist() == [1.0, 1.0, 1.0, 3.0]
+    np.testing.assert_allclose(report["watts"], report["joules"] / report["duration"])
+    summary = meter.summary().splitlines()
+    assert [line.split()[0] for line in summary] == ["stage", "kmeans", "build", "total"]
+    assert float(summary[1].split()[2]) == 2.0
+
+
+def test_meter_samples_in_background():
+    meter = energy.EnergyMeter(energy.SyntheticSampler(idle_watts=10.0, core_watts=0.0), interval=0.01)
+    with meter.stage("sleep"):
+        time.sleep(0.2)
+    assert len(meter.samples) > 4
+    times, watts = meter.power_trace()
+    assert times.shape == watts.shape and np.allclose(watts, 10.0, rtol=0.05)
+    assert meter.report()["watts"][0] == pytest.approx(10.0, rel=0.05)
+    # The sampling thread stops with the last stage
+    time.sleep(0.05)
+    assert meter._thread is None
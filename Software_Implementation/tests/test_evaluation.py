@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.evaluation import evaluate
+
+from .conftest import K, blobs
+
+
+def brute_force(tree, x_data, labels):
+    '''
+    Reference statistics, one sample and one cluster at a time
+    '''
+    flat = tree.compile()
+    centers = tree.all_centers
+    x_data = x_data.astype(np.float64)
+    samples = np.zeros(flat.n_nodes, dtype=np.int64)
+    mistakes = np.where(flat.left == -1, 0, -1)
+    confusion = np.zeros((K, K), dtype=np.int64)
+    clusters = np.empty(x_data.shape[0], dtype=np.int64)
+    for i, row in enumerate(x_data):
+        node = 0
+        samples[node] += 1
+        while flat.left[node] != -1:
+            node = flat.left[node] if row[flat.feature[node]] <= flat.threshold[node] else flat.right[node]
+            samples[node] += 1
+        clusters[i] = flat.value[node]
+        mistakes[node] += labels[i] != clusters[i]
+        confusion[labels[i], clusters[i]] += 1
+    cost = sum(((x_data[clusters == c] - x_data[clusters == c].mean(axis=0)) ** 2).sum()
+               for c in range(K) if (clusters == c).any())
+    surrogate_cost = ((x_data - centers[clusters]) ** 2).sum()
+    reference_cost = ((x_data - centers[labels]) ** 2).sum()
+    return {"cost": cost, "surrogate_cost": surrogate_cost, "reference_cost": reference_cost,
+            "price_of_explainability": cost / reference_cost, "surrogate_price": surrogate_cost / reference_cost,
+            "samples": samples, "mistakes": mistakes, "confusion": confusion, "n": x_data.shape[0]}
+
+
+def assert_same_evaluation(evaluation, expected):
+    assert evaluation.keys() == expected.keys()
+    for name, value in expected.items():
+        if isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(evaluation[name], value, err_msg=name)
+        else:
+            assert evaluation[name] == pytest.approx(value, rel=1e-9), name
+
+
+@pytest.fixture(scope="module")
+def tree(x_data, provider):
+    return Tree.Tree(k=K, max_leaves=3 * K).fit(x_data, provider=provider)
+
+
+@pytest.mark.parametrize("chunk_size, n_jobs", [(4096, 1), (97, 1), (97, 4)])
+def test_matches_brute_force(tree, provider, chunk_size, n_jobs):
+    test_data = blobs(1000, seed=1)
+    labels = provider.predict(test_data)
+    expected = brute_force(tree, test_data, labels)
+    assert_same_evaluation(evaluate(tree.compile(), tree.all_centers, test_data, chunk_size=chunk_size,
+                                    n_jobs=n_jobs), expected)
+    # Other reference labels only change the reference cost and the mistakes
+    other = (labels + 1) % K
+    assert_same_evaluation(evaluate(tree.compile(), tree.all_centers, test_data, other, chunk_size, n_jobs),
+                           brute_force(tree, test_data, other))
+
+
+def test_scores(tree, provider):
+    test_data = blobs(500, seed=2)
+    expected = brute_force(tree, test_data, provider.predict(test_data))
+    assert tree.score(test_data) == pytest.approx(expected["cost"])
+    assert tree.surrogate_score(test_data) == pytest.approx(expected["surrogate_cost"])
+
+
+def test_fit_evaluation(tree, x_data, provider):
+    evaluation = tree.fit_evaluation()
+    assert_same_evaluation(evaluation, brute_force(tree, x_data, provider.predict(x_data)))
+    np.testing.assert_array_equal(evaluation["samples"], tree.to_arrays()["samples"])
+
+
+def test_empty_data(tree):
+    evaluation = tree.evaluate(blobs(0))
+    assert evaluation["n"] == 0 and evaluation["cost"] == 0.0 and np.isnan(evaluation["price_of_explainability"])
+    assert evaluation["samples"].sum() == 0 and evaluation["confusion"].sum() == 0
@@ -0,0 +1,82 @@
+import sys
+
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.assignment import assign
+
+from .conftest import K
+
+
+def best_center(x_data, centers):
+    '''
+    Center of least summed squared distance to x_data, and that distance
+    '''
+    costs = ((x_data[:, None, :] - centers[None, :, :]) ** 2).sum(axis=(0, 2))
+    return int(costs.argmin()), float(costs.min())
+
+
+def naive_expansion(x_data, centers, labels, leaves, steps):
+    '''
+    Reference best-first growth: at each step try every cut of every leaf that still has mistakes, and split the
+    one that lowers the surrogate cost the most. Return the surrogate cost after each step.
+    '''
+    costs = []
+    for _ in range(steps):
+        best = None
+        for i, (rows, value) in enumerate(leaves):
+            if (labels[rows] == value).all():
+                continue
+            pre_split_cost = best_center(x_data[rows], centers)[1]
+            for col in range(x_data.shape[1]):
+                for threshold in np.unique(x_data[rows, col])[:-1]:
+                    left = x_data[rows, col] <= threshold
+                    (left_value, left_cost), (right_value, right_cost) = \
+                        best_center(x_data[rows[left]], centers), best_center(x_data[rows[~left]], centers)
+                    gain = left_cost + right_cost - pre_split_cost
+                    if best is None or gain < best[0]:
+                        best = (gain, i, [(rows[left], left_value), (rows[~left], right_value)])
+        if best is None:
+            break
+        leaves[best[1]:best[1] + 1] = best[2]
+        costs.append(sum(best_center(x_data[rows], centers[value][None, :])[1] for rows, value in leaves))
+    return costs
+
+
+def test_expansion_is_best_first(x_data, provider):
+    x_data = x_data[:600].astype(np.float64)
+    centers = provider.cluster_centers_
+    labels = assign(x_data, centers)
+    imm = Tree.Tree(k=K).fit(x_data, provider=provider)
+    flat = imm.compile()
+    leaf_of = flat.apply(x_data)
+    leaves = [(np.flatnonzero(leaf_of == leaf), int(flat.value[leaf])) for leaf in np.unique(leaf_of)]
+    expected = naive_expansion(x_data, centers, labels, leaves, K)
+    for added, cost in enumerate(expected, 1):
+        tree = Tree.Tree(k=K, max_leaves=K + added).fit(x_data, provider=provider)
+        assert tree.surrogate_score(x_data) == pytest.approx(cost, rel=1e-9)
+
+
+@pytest.mark.parametrize("splitter", ['sort', 'hist'])
+def test_grows_to_max_leaves_without_recursion(x_data, provider, splitter):
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    try:
+        tree = Tree.Tree(k=K, max_leaves=250, splitter=splitter).fit(x_data, provider=provider)
+    finally:
+        sys.setrecursionlimit(limit)
+    assert tree.compile().is_leaf().sum() == 250
+
+
+def test_smaller_tree_is_a_prefix(x_data, provider):
+    '''
+    Growing further only splits leaves of the smaller tree
+    '''
+    small = Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, provider=provider).compile()
+    large = Tree.Tree(k=K, max_leaves=4 * K).fit(x_data, provider=provider)
+    leaf_of = small.apply(x_data)
+    large_leaf_of = large.compile().apply(x_data)
+    # Every leaf of the large tree holds samples of a single leaf of the small tree
+    for leaf in np.unique(large_leaf_of):
+        assert len(np.unique(leaf_of[large_leaf_of == leaf])) == 1
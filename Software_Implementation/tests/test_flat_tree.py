@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.flat_tree import FlatTree, LEAF
+
+from .conftest import K, assert_same_tree, blobs, walk
+
+
+@pytest.mark.parametrize("max_leaves", [K, 3 * K])
+def test_predict_matches_node_walk(x_data, provider, max_leaves):
+    tree = Tree.Tree(k=K, max_leaves=max_leaves, splitter='sort').fit(x_data, provider=provider)
+    test_data = blobs(500, seed=1)
+    np.testing.assert_array_equal(tree.predict(test_data), walk(tree.tree, test_data))
+    np.testing.assert_array_equal(tree.compile().predict(test_data, chunk_size=7), walk(tree.tree, test_data))
+
+
+def test_flat_tree_layout(x_data, provider):
+    tree = Tree.Tree(k=K, max_leaves=2 * K, splitter='sort').fit(x_data, provider=provider)
+    flat = tree.compile()
+    assert flat.is_leaf().sum() == 2 * K
+    # Breadth-first: children come after their parent
+    internal = np.flatnonzero(flat.left != LEAF)
+    assert (flat.left[internal] > internal).all() and (flat.right[internal] > internal).all()
+
+
+def test_node_round_trip(x_data, provider):
+    tree = Tree.Tree(k=K, max_leaves=2 * K, splitter='sort').fit(x_data, provider=provider)
+    rebuilt = Tree.Tree(k=K, max_leaves=2 * K)
+    rebuilt.all_centers = tree.all_centers
+    rebuilt.tree = tree.compile().to_node(Tree.Node)
+    assert_same_tree(tree, rebuilt)
+    assert FlatTree.from_node(rebuilt.tree).n_nodes == tree.compile().n_nodes
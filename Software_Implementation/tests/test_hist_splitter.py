@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider
+
+from .conftest import K, assert_same_tree, blobs
+
+
+@pytest.fixture(scope="module")
+def tied_data():
+    # A duplicated column: its cuts tie exactly with the ones of the original column, and the sort and histogram
+    # kernels only see them differ by rounding
+    x_data = blobs(4000, d=5, spread=5, seed=2)
+    return np.hstack([x_data, x_data[:, 1:2]])
+
+
+@pytest.mark.parametrize("max_leaves", [K, 4 * K, 12 * K])
+def test_hist_tree_matches_sort(tied_data, max_leaves):
+    provider = BatchKMeansProvider(K, random_state=0).fit(tied_data)
+    sort_tree = Tree.Tree(k=K, max_leaves=max_leaves, splitter='sort').fit(tied_data, provider=provider)
+    for kwargs in ({"splitter": 'hist'}, {"splitter": 'auto'}, {"splitter": 'hist', "compact": True},
+                   {"splitter": 'sort', "compact": True}, {"splitter": 'hist', "presort": True}):
+        tree = Tree.Tree(k=K, max_leaves=max_leaves, **kwargs).fit(tied_data, provider=provider)
+        assert_same_tree(sort_tree, tree)
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pytest
+
+from ExplainableKMC import hw_codec
+
+from .conftest import ROOT, element_rows
+
+ELEMENT_DATA_PATH = os.path.join(os.path.dirname(ROOT), "Hardware_Implementation", "element_data_small.txt")
+
+
+def reference_bits(row, fields=hw_codec.ELEMENT_FIELDS):
+    '''
+    Element of a row written field by field with np.binary_repr, MSB first
+    '''
+    return "".join(np.binary_repr(value, width) for value, (_, _, width) in
+                   sorted(zip(row, fields), key=lambda item: -item[1][1]))
+
+
+def test_layout_covers_the_element():
+    bits = np.zeros(hw_codec.ELEMENT_BITS, dtype=int)
+    for _, lsb, width in hw_codec.ELEMENT_FIELDS:
+        bits[lsb:lsb + width] += 1
+    assert (bits == 1).all()
+
+
+def test_pack_matches_binary_repr():
+    rows = element_rows(50)
+    bits = hw_codec.to_bits(hw_codec.pack(rows))
+    for row, row_bits in zip(rows, bits):
+        assert "".join(map(str, row_bits)) == reference_bits(row)
+    np.testing.assert_array_equal(hw_codec.unpack(hw_codec.pack(rows)), rows)
+
+
+def test_pack_rejects_overflow():
+    rows = element_rows(3)
+    rows[1, 0] = 16
+    with pytest.raises(Exception, match='AGE do not fit in 4 bits'):
+        hw_codec.pack(rows)
+
+
+def test_element_file_round_trip(tmp_path):
+    packed = hw_codec.read_elements(ELEMENT_DATA_PATH)
+    assert packed.shape[0] == 128
+    path = str(tmp_path / "elements.txt")
+    hw_codec.write_elements(path, packed)
+    with open(path, 'rb') as f, open(ELEMENT_DATA_PATH, 'rb') as expected:
+        assert f.read().strip() == expected.read().replace(b'\r', b'').strip()
+
+    binary_path = str(tmp_path / "elements.bin")
+    hw_codec.write_elements_binary(binary_path, packed)
+    assert os.path.getsize(binary_path) == packed.shape[0] * hw_codec.ELEMENT_BYTES
+    np.testing.assert_array_equal(hw_codec.read_elements_binary(binary_path), packed)
+
+
+def test_read_elements_rejects_other_files(tmp_path):
+    path = tmp_path / "other.txt"
+    path.write_text("0101\n0110\n")
+    with pytest.raises(Exception, match='does not hold lines of 39 bits'):
+        hw_codec.read_elements(str(path))
+
+
+def test_label_and_format():
+    packed = hw_codec.pack(element_rows(20))
+    labeled = hw_codec.set_label(packed, 9)
+    assert (hw_codec.unpack(labeled)[:, 10] == 9).all()
+    formatted = hw_codec.format_elements(labeled)
+    assert formatted.max() < 1 << hw_codec.FORMATTED_BITS
+    np.testing.assert_array_equal(hw_codec.unformat_elements(formatted), hw_codec.set_label(packed, 0))
+
+
+def test_centroid_dump(tmp_path):
+    centers = element_rows(4, hw_codec.FEATURE_FIELDS, seed=1).astype(np.float64)
+    words = hw_codec.encode_centroids(centers)
+    np.testing.assert_array_equal(hw_codec.decode_centroids(words), centers)
+
+    # The first line holds earlier centroids, the last k words are the final ones
+    bits = ["".join(map(str, row)) for row in hw_codec.to_bits(words, hw_codec.FORMATTED_BITS)]
+    path = tmp_path / "centroids.txt"
+    path.write_text("# formatted_centroids\n%s\n%s\n" % (bits[0], "".join(bits)))
+    np.testing.assert_array_equal(hw_codec.read_centroids(str(path), k=4), centers)
+    assert hw_codec.read_centroids(str(path)).shape == (5, len(hw_codec.FEATURE_FIELDS))
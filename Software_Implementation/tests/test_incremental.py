@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider
+
+from .conftest import K, drift
+
+
+def leaf_values(tree):
+    flat = tree.compile()
+    return set(flat.value[flat.is_leaf()].astype(int))
+
+
+@pytest.mark.parametrize("max_leaves", [K, 2 * K])
+def test_partial_fit_keeps_every_center(max_leaves):
+    rng = np.random.default_rng(3)
+    x_data = rng.integers(0, 16, size=(4000, 3))
+    tree = Tree.Tree(k=K, max_leaves=max_leaves, incremental=True)
+    tree.fit(x_data, provider=BatchKMeansProvider(K, random_state=0).fit(x_data))
+    for _ in range(5):
+        tree.partial_fit(rng.integers(0, 12, size=3) + rng.integers(0, 4, size=(20000, 3)))
+        assert leaf_values(tree) == set(range(K))
+        if max_leaves == K:
+            assert tree.compile().is_leaf().sum() == K
+
+
+def test_partial_fit_moves_drifted_cut():
+    x_data, batches = drift()
+    tree = Tree.Tree(k=2, incremental=True).fit(x_data, provider=BatchKMeansProvider(2, random_state=0).fit(x_data))
+    mistakes = tree.evaluate(batches[0])["mistakes"].sum()
+    tree.partial_fit(batches[0])
+    assert tree.partial_fit_report()["changed"] == [0]
+    assert leaf_values(tree) == {0, 1}
+    # The cut still separates the two centers, and sends fewer of the new samples away from their center
+    flat = tree.compile()
+    col, threshold = flat.feature[0], flat.threshold[0]
+    assert (tree.all_centers[flat.value[flat.left[0]].astype(int), col] <= threshold) and \
+           (tree.all_centers[flat.value[flat.right[0]].astype(int), col] > threshold)
+    assert tree.evaluate(batches[0])["mistakes"].sum() < mistakes
+
+
+def test_partial_fit_evaluation_covers_all_samples():
+    x_data, batches = drift()
+    tree = Tree.Tree(k=2, incremental=True).fit(x_data, provider=BatchKMeansProvider(2, random_state=0).fit(x_data))
+    for batch in batches:
+        tree.partial_fit(batch)
+    expected = tree.evaluate(np.vstack([x_data] + batches))
+    evaluation = tree.fit_evaluation()
+    for name in ("cost", "surrogate_cost", "reference_cost"):
+        assert evaluation[name] == pytest.approx(expected[name])
+    for name in ("samples", "mistakes", "confusion"):
+        np.testing.assert_array_equal(evaluation[name], expected[name])
+    assert tree.partial_fit_report()["total_samples"] == x_data.shape[0] + sum(batch.shape[0] for batch in batches)
+
+
+def test_partial_fit_requires_incremental(x_data, provider):
+    tree = Tree.Tree(k=K).fit(x_data, provider=provider)
+    with pytest.raises(Exception, match='incremental=True'):
+        tree.partial_fit(x_data)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider
+from ExplainableKMC.Tree import presort_columns
+
+from .conftest import K, assert_same_tree, blobs
+
+
+def test_presort_columns(x_data):
+    order = presort_columns(x_data)
+    assert order.shape == (x_data.shape[1], x_data.shape[0]) and order.dtype == np.int32
+    for col in range(x_data.shape[1]):
+        np.testing.assert_array_equal(order[col], np.argsort(x_data[:, col], kind='stable'))
+
+
+@pytest.mark.parametrize("max_leaves", [K, 3 * K])
+def test_presort_tree_matches_sort_tree(x_data, provider, max_leaves):
+    tree = Tree.Tree(k=K, max_leaves=max_leaves, splitter='sort').fit(x_data, provider=provider)
+    presorted = Tree.Tree(k=K, max_leaves=max_leaves, presort=True).fit(x_data, provider=provider)
+    assert_same_tree(tree, presorted)
+    test_data = blobs(300, seed=1)
+    np.testing.assert_array_equal(presorted.predict(test_data), tree.predict(test_data))
+
+
+def test_shared_order(x_data, provider):
+    '''
+    An order passed to fit is not consumed by the build, it can be shared by fits of several k like in sweep
+    '''
+    order = presort_columns(x_data)
+    other_provider = BatchKMeansProvider(K - 1, random_state=0).fit(x_data)
+    for k, k_provider in ((K, provider), (K - 1, other_provider), (K, provider)):
+        shared = Tree.Tree(k=k, max_leaves=2 * k, presort=True).fit(x_data, provider=k_provider, order=order)
+        fresh = Tree.Tree(k=k, max_leaves=2 * k, presort=True).fit(x_data, provider=k_provider)
+        assert_same_tree(fresh, shared)
+    np.testing.assert_array_equal(order, presort_columns(x_data))
@@ -0,0 +1,50 @@
+import json
+import tracemalloc
+
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.profiling import Profiler
+
+from .conftest import K, assert_same_tree
+
+
+@pytest.mark.parametrize("splitter, presort", [('sort', False), ('hist', False), ('sort', True)])
+def test_profiled_fit(x_data, provider, splitter, presort):
+    profiler = Profiler()
+    params = {"k": K, "max_leaves": 2 * K, "splitter": splitter, "presort": presort}
+    tree = Tree.Tree(profiler=profiler, **params).fit(x_data, provider=provider)
+    assert_same_tree(Tree.Tree(**params).fit(x_data, provider=provider), tree)
+    assert not tracemalloc.is_tracing()
+
+    assert [stage["name"] for stage in profiler.stages] == ["labels", "build", "expand", "stats"]
+    assert all(stage["allocated"] is not None and stage["peak"] >= 0 for stage in profiler.stages)
+
+    # One record per IMM node, with the cut of the internal ones, then one per leaf split by the expansion
+    flat = tree.compile()
+    cuts = set(zip(flat.feature[~flat.is_leaf()].tolist(), flat.threshold[~flat.is_leaf()].tolist()))
+    build = [record for record in profiler.nodes if record["phase"] == "build" and record["col"] is not None]
+    splits = [record for record in profiler.nodes if record["phase"] == "split"]
+    assert len(build) == K - 1 and len(splits) == K
+    assert max(record["samples"] for record in build) == x_data.shape[0]
+    assert {(record["col"], record["threshold"]) for record in build + splits} == cuts
+    if splitter == 'sort' and not presort:
+        assert sum(record["argsort"] for record in profiler.nodes) > 0
+
+
+def test_chrome_trace(tmp_path, x_data, provider):
+    profiler = Profiler(track_memory=False)
+    Tree.Tree(k=K, max_leaves=2 * K, profiler=profiler).fit(x_data, provider=provider)
+    path = str(tmp_path / "trace.json")
+    profiler.export_chrome_trace(path)
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    complete = [event for event in events if event["ph"] == "X"]
+    assert len(complete) == len(profiler.stages) + len(profiler.nodes)
+    assert all(event["dur"] >= 0 for event in complete)
+    assert {event["cat"] for event in complete} == {"stage", "node"}
+    assert all(event["args"]["allocated"] is None for event in complete if event["cat"] == "stage")
+
+    summary = profiler.summary(top=3)
+    assert "stage" in summary and "argsort (s)" in summary
+    assert len(summary.splitlines()) == 1 + 4 + 1 + 1 + 3 + 1 + 1 + 3
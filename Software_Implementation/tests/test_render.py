@@ -0,0 +1,81 @@
+import json
+import os
+import re
+import shutil
+
+import pytest
+
+from ExplainableKMC import Tree, render
+
+from .conftest import K
+
+FEATURE_NAMES = ["a", "b", "c", "d", "e", "f"]
+
+
+@pytest.fixture(scope="module")
+def tree(x_data, provider):
+    return Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, provider=provider)
+
+
+def test_export_nodes(tree):
+    nodes = tree.export_nodes(FEATURE_NAMES)
+    flat, arrays = tree.compile(), tree.to_arrays()
+    assert [node["id"] for node in nodes] == list(range(flat.n_nodes))
+    for node in nodes:
+        assert node["samples"] == arrays["samples"][node["id"]]
+        if "value" in node:
+            assert node["value"] == flat.value[node["id"]] and node["mistakes"] == arrays["mistakes"][node["id"]]
+        else:
+            assert node["feature_name"] == FEATURE_NAMES[node["feature"]]
+            assert (node["left"], node["right"]) == (flat.left[node["id"]], flat.right[node["id"]])
+    assert json.loads(json.dumps(nodes)) == nodes
+
+
+def test_dot_source(tree):
+    dot = tree.to_dot(FEATURE_NAMES)
+    flat = tree.compile()
+    assert dot.startswith("digraph ClusteringTree {") and dot.endswith("}")
+    labels = re.findall(r'n_(\d+) \[label="((?:[^"\\]|\\.)*)"\];', dot)
+    assert [int(node) for node, _ in labels] == list(range(flat.n_nodes))
+    edges = re.findall(r'n_(\d+) -> n_(\d+);', dot)
+    assert len(edges) == 2 * (~flat.is_leaf()).sum()
+
+
+def test_dot_escapes_names():
+    nodes = [{"id": 0, "feature": 0, "feature_name": 'say "hi" \\', "threshold": 1.5, "left": 1, "right": 2},
+             {"id": 1, "value": 0, "samples": 3, "mistakes": 1}, {"id": 2, "value": 1}]
+    assert render.dot_source(nodes) == ('digraph ClusteringTree {\n'
+                                        'n_0 [label="say \\"hi\\" \\\\ <= 1.500"];\n'
+                                        'n_1 [label="0\\nsamples=3\\nmistakes=1"];\n'
+                                        'n_2 [label="1"];\n'
+                                        'n_0 -> n_1;\n'
+                                        'n_0 -> n_2;\n'
+                                        '}')
+
+
+def test_export(tmp_path, tree):
+    filename = str(tmp_path / "tree")
+    assert tree.export(filename) == [filename + ".gv", filename + ".json"]
+    with open(filename + ".gv") as f:
+        assert f.read() == tree.to_dot()
+    with open(filename + ".json") as f:
+        assert json.load(f)["nodes"] == tree.export_nodes()
+
+
+@pytest.mark.skipif(not render.graphviz_available, reason='graphviz is not installed')
+def test_background_renderer(tmp_path, tree):
+    '''
+    Trees are rendered off the calling thread, and a missing dot executable is reported rather than raised
+    '''
+    filenames = [str(tmp_path / ("tree%d" % i)) for i in range(3)]
+    with render.TreeRenderer(n_workers=2) as renderer:
+        for filename in filenames:
+            tree.plot(filename=filename, renderer=renderer)
+        renderer.join()
+    for filename in filenames:
+        with open(filename + ".gv") as f:
+            assert f.read().strip() == tree.to_dot()
+    if shutil.which("dot") is None:
+        assert sorted(filename for filename, _ in renderer.errors) == filenames
+    else:
+        assert renderer.errors == [] and all(os.path.exists(filename + ".gv.png") for filename in filenames)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.serving import InferenceServer, generate_load, query_stats
+
+from .conftest import K, blobs
+
+
+@pytest.fixture(scope="module")
+def tree(x_data, provider):
+    return Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, provider=provider)
+
+
+def run(tree, client, **kwargs):
+    '''
+    Start a server on a free local port, run client(port, server) against it and close it
+    '''
+    async def main():
+        server = InferenceServer(tree, **kwargs)
+        listening = await server.start(port=0)
+        try:
+            return await client(listening.sockets[0].getsockname()[1], server)
+        finally:
+            await server.close()
+    return asyncio.run(main())
+
+
+async def exchange(port, lines):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b''.join(line + b'\n' for line in lines))
+    responses = [json.loads(await reader.readline()) for _ in lines]
+    writer.close()
+    return responses
+
+
+@pytest.mark.parametrize("max_batch_size, max_queue", [(1, 4096), (64, 4096), (64, 4)])
+def test_answers_match_predict(tree, max_batch_size, max_queue):
+    rows = blobs(300, seed=1)
+
+    async def client(port, server):
+        load = await generate_load(rows, 600, 16, port=port)
+        return load, await query_stats(port=port)
+
+    load, stats = run(tree, client, max_batch_size=max_batch_size, max_queue=max_queue)
+    np.testing.assert_array_equal(load["clusters"], np.tile(tree.predict(rows), 2))
+    assert stats["requests"] == 600 and stats["errors"] == 0
+    assert stats["max_batch"] <= max_batch_size
+
+
+def test_response_fields(tree):
+    row = blobs(1, seed=2)[0]
+    response, = run(tree, lambda port, server: exchange(port, [json.dumps({"id": "a", "x": row.tolist()}).encode()]))
+    leaf = tree.compile().apply(row[None, :])[0]
+    arrays = tree.to_arrays()
+    assert response == {"id": "a", "cluster": int(tree.predict(row[None, :])[0]), "leaf": int(leaf),
+                        "samples": int(arrays["samples"][leaf]), "mistakes": int(arrays["mistakes"][leaf])}
+
+
+def test_pipelined_requests_past_the_queue_bound(tree):
+    rows = blobs(200, seed=3)
+    lines = [json.dumps({"id": i, "x": row.tolist()}).encode() for i, row in enumerate(rows)]
+    responses = run(tree, lambda port, server: exchange(port, lines), max_batch_size=8, max_queue=2)
+    assert [response["id"] for response in responses] == list(range(len(rows)))
+    assert [response["cluster"] for response in responses] == tree.predict(rows).tolist()
+
+
+def test_bad_requests_get_errors(tree):
+    lines = [b'not json', b'{"id": 1, "x": [1, 2]}', json.dumps({"id": 2, "x": blobs(1)[0].tolist()}).encode()]
+    responses = run(tree, lambda port, server: exchange(port, lines))
+    by_id = {response["id"]: response for response in responses}
+    assert "error" in by_id[None] and "expected 6 features" in by_id[1]["error"]
+    assert "cluster" in by_id[2]
+
+
+def test_failed_batch_does_not_stop_the_server(tree):
+    row = json.dumps({"id": 0, "x": blobs(1)[0].tolist()}).encode()
+
+    def fail(x_data):
+        raise MemoryError("no memory")
+
+    async def client(port, server):
+        apply = server.flat.apply
+        server.flat.apply = fail
+        failed = await exchange(port, [row])
+        server.flat.apply = apply
+        return failed, await exchange(port, [row]), server.stats.errors
+
+    (failed,), (answered,), errors = run(tree, client)
+    assert failed == {"id": 0, "error": "no memory"}
+    assert "cluster" in answered and errors == 1
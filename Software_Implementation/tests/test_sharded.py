@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider
+from ExplainableKMC.sharded import ProcessPoolTransport, SerialTransport, write_shards
+
+from .conftest import K, assert_same_tree
+
+
+@pytest.fixture(scope="module")
+def shards(tmp_path_factory, x_data):
+    return write_shards(x_data, str(tmp_path_factory.mktemp("shards")), rows_per_shard=700)
+
+
+@pytest.mark.parametrize("max_leaves", [K, 3 * K])
+def test_fit_sharded_matches_fit(x_data, provider, shards, max_leaves):
+    tree = Tree.Tree(k=K, max_leaves=max_leaves).fit(x_data, provider=provider)
+    with SerialTransport() as transport:
+        sharded = Tree.Tree(k=K, max_leaves=max_leaves).fit_sharded(shards, provider, transport)
+    assert_same_tree(tree, sharded)
+    for name in ("samples", "mistakes"):
+        np.testing.assert_array_equal(sharded.to_arrays()[name], tree.to_arrays()[name])
+
+
+def test_fit_sharded_on_worker_processes(x_data, provider, shards):
+    tree = Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, provider=provider)
+    with ProcessPoolTransport(2) as transport:
+        sharded = Tree.Tree(k=K, max_leaves=2 * K).fit_sharded(shards, provider, transport)
+    assert_same_tree(tree, sharded)
+
+
+def test_transport_reused_across_fits(x_data, shards):
+    # The second fit labels the shards again: the shards mapped by the first one must not be reused
+    with SerialTransport() as transport:
+        for seed in (0, 1):
+            provider = BatchKMeansProvider(K, random_state=seed).fit(x_data)
+            tree = Tree.Tree(k=K).fit(x_data, provider=provider)
+            assert_same_tree(tree, Tree.Tree(k=K).fit_sharded(shards, provider, transport))
+        assert len(transport.shards._shards) == len(shards)
+    assert len(transport.shards._shards) == 0
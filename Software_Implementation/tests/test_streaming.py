@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.streaming import iter_chunks
+
+from .conftest import K, blobs
+
+
+@pytest.fixture(scope="module")
+def tree(x_data, provider):
+    return Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, provider=provider)
+
+
+@pytest.fixture(scope="module")
+def test_data():
+    return blobs(1000, seed=1)
+
+
+def test_predict_stream_array(tree, test_data):
+    chunks = list(tree.predict_stream(test_data, chunk_size=300))
+    assert [chunk.shape[0] for chunk in chunks] == [300, 300, 300, 100]
+    np.testing.assert_array_equal(np.concatenate(chunks), tree.predict(test_data))
+
+
+def test_predict_stream_blocks(tree, test_data):
+    blocks = [test_data[:250], pd.DataFrame(test_data[250:700]), test_data[700:].tolist()]
+    np.testing.assert_array_equal(np.concatenate(list(tree.predict_stream(blocks, chunk_size=200))),
+                                  tree.predict(test_data))
+
+
+def test_predict_file(tmp_path, tree, test_data):
+    frame = pd.DataFrame(test_data, columns=["f%d" % i for i in range(test_data.shape[1])])
+    frame.insert(2, "label", 7)
+    path, out_path = str(tmp_path / "data.csv"), str(tmp_path / "clusters.txt")
+    frame.to_csv(path, index=False)
+    assert tree.predict_file(path, out_path, chunk_size=128, drop_columns=["label"]) == test_data.shape[0]
+    np.testing.assert_array_equal(np.loadtxt(out_path, dtype=np.int64), tree.predict(test_data))
+
+
+def test_iter_chunks_does_not_copy_arrays(test_data):
+    for chunk in iter_chunks(test_data, chunk_size=400):
+        assert np.shares_memory(chunk, test_data)
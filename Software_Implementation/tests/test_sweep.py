@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.assignment import closest_distances
+from ExplainableKMC.centroids import FixedCentroidProvider
+from ExplainableKMC.sweep import SWEEP_COLUMNS, add_centers
+
+from .conftest import K, assert_same_tree
+
+
+@pytest.mark.parametrize("presort, n_jobs", [(False, 1), (True, 1), (True, 3)])
+def test_trees_match_individual_fits(x_data, presort, n_jobs):
+    ks = [K + 1, K - 2, K, K - 1]
+    table, trees = Tree.Tree.sweep(x_data, ks, max_leaves=lambda k: 2 * k, n_jobs=n_jobs, random_state=0,
+                                   presort=presort)
+    assert list(table.columns) == SWEEP_COLUMNS and table["k"].tolist() == sorted(ks)
+    assert table["leaves"].tolist() == [2 * k for k in sorted(ks)]
+    for k, tree in trees.items():
+        centers = tree.all_centers
+        assert centers.shape[0] == k
+        fit = Tree.Tree(k=k, max_leaves=2 * k, compact=True).fit(x_data, provider=FixedCentroidProvider(centers))
+        assert_same_tree(fit, tree)
+        row = table[table["k"] == k].iloc[0]
+        assert row["kmeans_cost"] == pytest.approx(closest_distances(x_data, centers).sum())
+        assert row["cost"] == pytest.approx(fit.score(x_data))
+
+
+def test_add_centers(x_data):
+    rng = np.random.default_rng(0)
+    centers = x_data[:2].astype(np.float64)
+    extended = add_centers(x_data, centers, 3, rng)
+    np.testing.assert_array_equal(extended[:2], centers)
+    # New centers are samples, away from the previous centers
+    for center in extended[2:]:
+        assert (x_data == center).all(axis=1).any()
+    assert len({tuple(center) for center in extended}) == 5
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from ExplainableKMC import Tree
+from ExplainableKMC.centroids import BatchKMeansProvider
+from ExplainableKMC.flat_tree import FlatTree
+from ExplainableKMC.tree_file import read_tree_file
+
+from .conftest import K, assert_same_tree, blobs, drift, walk
+
+
+def node_stats(tree):
+    samples, mistakes = [], []
+    nodes = [tree.tree]
+    while len(nodes) > 0:
+        node = nodes.pop(0)
+        samples.append(node.samples)
+        mistakes.append(node.mistakes)
+        if not node.is_leaf():
+            nodes.extend((node.left, node.right))
+    return samples, mistakes
+
+
+@pytest.mark.parametrize("mmap_mode", ['r', None])
+def test_save_load_round_trip(tmp_path, x_data, provider, mmap_mode):
+    tree = Tree.Tree(k=K, max_leaves=3 * K, compact=True).fit(x_data, provider=provider)
+    path = str(tmp_path / "tree.exkmc")
+    tree.save(path)
+    loaded = Tree.Tree.load(path, mmap_mode=mmap_mode)
+
+    assert loaded.params() == tree.params()
+    assert_same_tree(tree, loaded)
+    test_data = blobs(500, seed=1)
+    np.testing.assert_array_equal(loaded.predict(test_data), tree.predict(test_data))
+    np.testing.assert_array_equal(loaded.feature_importance(), tree.feature_importance())
+    np.testing.assert_array_equal(loaded.all_centers, tree.all_centers)
+    # The nodes of a loaded tree are only built on access, with the saved statistics
+    assert node_stats(loaded) == node_stats(tree)
+
+
+def test_not_a_tree_file(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b'not a tree file at all')
+    with pytest.raises(Exception, match='not a tree file'):
+        read_tree_file(str(path))
+
+
+def test_tree_setter_resets_flat(x_data, provider):
+    tree = Tree.Tree(k=K, max_leaves=2 * K).fit(x_data, provider=provider)
+    assert tree.compile().n_nodes > 1
+    leaf = Tree.Node()
+    leaf.value = 3
+    tree.tree = leaf
+    assert tree.compile().n_nodes == 1
+    assert (tree.predict(x_data) == 3).all()
+
+
+def test_partial_fit_keeps_flat_in_sync():
+    x_data, batches = drift()
+    tree = Tree.Tree(k=2, incremental=True).fit(x_data, provider=BatchKMeansProvider(2, random_state=0).fit(x_data))
+    changed = 0
+    for batch in batches:
+        tree.partial_fit(batch)
+        changed += len(tree.partial_fit_report()["changed"])
+        rebuilt = FlatTree.from_node(tree.tree)
+        np.testing.assert_array_equal(tree.compile().feature, rebuilt.feature)
+        np.testing.assert_array_equal(tree.compile().threshold, rebuilt.threshold)
+        np.testing.assert_array_equal(tree.predict(batch), walk(tree.tree, batch))
+    assert changed > 0